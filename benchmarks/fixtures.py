@@ -0,0 +1,217 @@
+"""
+Synthetic GAIA-like fixtures for the benchmarks.
+
+Everything is generated from a fixed seed so results are comparable between
+runs. Attachment builders import their format library lazily and return None
+when it is not installed.
+"""
+import io
+import json
+import random
+import uuid
+import zipfile
+
+import pandas as pd
+
+SEED = 7245
+NUM_TASKS = 165  # size of the GAIA 2023 validation split
+WORDS = ("the of and to in is was for on that with as by at from his her which "
+         "paper museum species river album population year city author table "
+         "value total number first last page chapter dataset release version").split()
+
+
+def _sentence(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def _paragraph(rng, n_sentences):
+    return " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(n_sentences))
+
+
+def make_steps(rng, n_steps):
+    """Annotator steps in GAIA's '1. ... 2. ...' single-string layout."""
+    return " ".join(f"{i}. {_sentence(rng, rng.randint(6, 18))}" for i in range(1, n_steps + 1))
+
+
+def make_metadata(num_tasks=NUM_TASKS, seed=SEED):
+    """The metadataTable: Question, task_id, Final answer, Steps, extractedData and its extractedIndex."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(num_tasks):
+        final_answer = str(rng.randint(1, 5000)) if rng.random() < 0.5 else rng.choice(WORDS)
+        steps = make_steps(rng, rng.randint(3, 12))
+        rows.append({
+            "Question": _paragraph(rng, rng.randint(1, 4)) + " What is the answer?",
+            "task_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "Final answer": final_answer,
+            "correct_answer": final_answer,
+            "Steps": f"{steps} Final answer: {final_answer}",
+            # Roughly a third of GAIA tasks carry an attachment
+            "extractedData": _paragraph(rng, rng.randint(5, 60)) if rng.random() < 0.35 else None,
+        })
+    df = pd.DataFrame(rows)
+    # The BM25 index dataflow/DataFromFile.py stores next to each extraction
+    from retrieval import build_index, index_to_json
+    df["extractedIndex"] = [index_to_json(build_index(text)) if isinstance(text, str) else None for text in df["extractedData"]]
+    return df
+
+
+def make_results(metadata, num_sessions=50, seed=SEED):
+    """Latest results per (session, task) answered, as enrichedMetadataLatest derives them from the event log."""
+    rng = random.Random(seed)
+    rows = []
+    task_ids = metadata["task_id"].tolist()
+    for _ in range(num_sessions):
+        session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        for task_id in rng.sample(task_ids, rng.randint(5, 40)):
+            question_result = rng.choice(["True", "False"])
+            rows.append({
+                "task_id": task_id,
+                "sessionId": session_id,
+                "questionResult": question_result,
+                "stepsResult": "Skipped" if question_result == "True" else rng.choice(["True", "False", "Pending"]),
+            })
+    return pd.DataFrame(rows)
+
+
+def make_users(num_users=500, seed=SEED):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(num_users):
+        first, last = rng.choice(WORDS).title(), rng.choice(WORDS).title()
+        rows.append({
+            "firstName": first,
+            "lastName": last,
+            "fullName": f"{first} {last}",
+            "email": f"user{i}@example.com",
+            "password": "Passw0rd!",
+            "feedback": _sentence(rng, 12) if rng.random() < 0.2 else None,
+        })
+    return pd.DataFrame(rows)
+
+
+# Attachment builders, one per extractor in dataflow/extractors.py
+def make_txt(text):
+    return text.encode("utf-8")
+
+
+def make_csv(text):
+    lines = ["id,label,value"] + [f"{i},{word},{i * 3}" for i, word in enumerate(text.split())]
+    return "\n".join(lines).encode("utf-8")
+
+
+def make_jsonld(text):
+    words = text.split()
+    doc = {"@context": "https://schema.org", "@type": "Dataset",
+           "name": " ".join(words[:5]),
+           "author": [{"@type": "Person", "name": w.title()} for w in words[5:25]],
+           "description": text}
+    return json.dumps(doc).encode("utf-8")
+
+
+def make_xml(text):
+    items = "".join(f"<item id='{i}'>{word}</item>" for i, word in enumerate(text.split()))
+    return f"<?xml version='1.0'?><root><title>GAIA</title>{items}</root>".encode("utf-8")
+
+
+def make_pdb(text):
+    lines = [f"ATOM  {i:5d}  CA  ALA A{i:4d}    {i * 0.1:8.3f}{i * 0.2:8.3f}{i * 0.3:8.3f}  1.00  0.00           C"
+             for i in range(1, 400)]
+    return ("HEADER    " + text[:60] + "\n" + "\n".join(lines) + "\nEND\n").encode("utf-8")
+
+
+def make_zip(text):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("notes.txt", make_txt(text))
+        archive.writestr("table.csv", make_csv(text))
+    return buffer.getvalue()
+
+
+def make_xlsx(text):
+    try:
+        import openpyxl
+    except ImportError:
+        return None
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for i, word in enumerate(text.split()):
+        sheet.append([i, word, i * 1.5, None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_pdf(text):
+    try:
+        import fitz
+    except ImportError:
+        return None
+    document = fitz.open()
+    words = text.split()
+    for start in range(0, len(words), 200):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 560, 800), " ".join(words[start:start + 200]))
+    return document.tobytes()
+
+
+def make_pptx(text):
+    try:
+        from pptx import Presentation
+    except ImportError:
+        return None
+    presentation = Presentation()
+    words = text.split()
+    for start in range(0, len(words), 50):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = words[start]
+        slide.placeholders[1].text = " ".join(words[start:start + 50])
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    return buffer.getvalue()
+
+
+def make_png(text):
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return None
+    image = Image.new("RGB", (640, 480), "white")
+    ImageDraw.Draw(image).multiline_text((10, 10), text[:400], fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_wav(text, seconds=2.0, sample_rate=16000):
+    try:
+        import numpy as np
+        import soundfile as sf
+    except ImportError:
+        return None
+    t = np.linspace(0, seconds, int(seconds * sample_rate), endpoint=False)
+    signal = 0.2 * np.sin(2 * np.pi * 440 * t)
+    buffer = io.BytesIO()
+    sf.write(buffer, signal, sample_rate, format="WAV")
+    return buffer.getvalue()
+
+
+ATTACHMENT_BUILDERS = {
+    ".txt": make_txt,
+    ".csv": make_csv,
+    ".jsonld": make_jsonld,
+    ".xml": make_xml,
+    ".pdb": make_pdb,
+    ".zip": make_zip,
+    ".xlsx": make_xlsx,
+    ".pdf": make_pdf,
+    ".pptx": make_pptx,
+    ".png": make_png,
+    ".wav": make_wav,
+}
+
+
+def make_attachments(seed=SEED, n_sentences=120):
+    """Return {extension: bytes or None} with one synthetic attachment per format."""
+    text = _paragraph(random.Random(seed), n_sentences)
+    return {ext: builder(text) for ext, builder in ATTACHMENT_BUILDERS.items()}
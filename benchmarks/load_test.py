@@ -0,0 +1,299 @@
+"""
+Concurrent-user load test of the Streamlit app.
+
+Starts one real Streamlit server for streamlit_app/main.py (one replica) on
+the offline stubs, and connects N simulated users to it over Streamlit's
+websocket protocol, as N browsers would. Every user walks through the app:
+
+- open the login page and log in (main.py);
+- pick a test case, Answer, Validate, NEXT (Testing.py);
+- pick a step, Answer, Validate, Next (validation.py);
+- open the overview table and the three charts (visualization.py);
+- go back to the testing page for the next flow.
+
+Clicks inside a fragment rerun only that fragment, like in the browser. A
+page change only shows on the rerun after the click, so navigation steps
+include that rerun. The BigQuery, OpenAI and GCS stubs sleep for the
+injected latencies, so every blocking call holds up the session that made
+it as it would in production. Users pick different test cases, so answers
+are not served from the answer cache until the cases run out.
+
+For each number of users it reports:
+- throughput: completed flows and steps (clicks) per second;
+- latency percentiles of every step, from the click until the server
+  reports the rerun finished;
+- memory per session: growth of the server's RSS with all the level's
+  sessions connected, divided by the number of users (noisy for a few users).
+
+Usage:
+    python benchmarks/load_test.py [--users 1,5,10,25] [--flows 2]
+        [--bigquery-latency 0.3] [--openai-latency 1.0] [--token-latency 0.02] [--gcs-latency 0.1]
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import STREAMLIT_APP_DIR
+import fixtures
+
+STEPS = ["open", "login", "select case", "answer", "validate", "next", "select step", "answer step",
+         "validate step", "next (results)", "overview", "question chart", "steps chart", "overall chart",
+         "back to validation", "back to testing"]
+CHART_BUTTONS = [("overview", "Overview"), ("question chart", "Outcome from Question"),
+                 ("steps chart", "Outcome from Steps"), ("overall chart", "Overall Outcome")]
+
+# Runs in the server process: installs the stubs, then serves main.py like `streamlit run`
+SERVER_SCRIPT = r"""
+import json, os, sys
+benchmark_dir, port, latency = sys.argv[1], int(sys.argv[2]), json.loads(sys.argv[3])
+sys.path.insert(0, benchmark_dir)
+import stubs, fixtures
+metadata = fixtures.make_metadata()
+stubs.install_stubs(tables={"metadataTable": metadata,
+                            "evaluationEvents": fixtures.make_results(metadata),  # as the latest-state query returns it
+                            "UserInfo": fixtures.make_users()}, latency=latency)
+from streamlit.web import bootstrap
+bootstrap.load_config_options({"server_port": port, "server_headless": True, "server_fileWatcherType": "none",
+                               "browser_gatherUsageStats": False, "logger_level": "error"})
+bootstrap.run(os.path.join(stubs.STREAMLIT_APP_DIR, "main.py"), False, [], {})
+"""
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, latency):
+    """Start the app server in a child process and wait until it is healthy."""
+    env = dict(os.environ)
+    env.setdefault("LEDGER_DIR", tempfile.mkdtemp(prefix="load-test-usage-"))
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SCRIPT, os.path.dirname(os.path.abspath(__file__)), str(port), json.dumps(latency)],
+        cwd=STREAMLIT_APP_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Server did not become healthy within 120s")
+
+
+def process_rss_mb(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class SimulatedUser:
+    """One browser session: sends reruns with widget states and times them until the script finishes."""
+
+    def __init__(self, connection, email, password):
+        self.connection = connection
+        self.email, self.password = email, password
+        self.widgets = {}        # label -> (widget id, fragment id) of the widgets on the page
+        self.options = {}        # label -> options of the selectboxes on the page
+        self.widget_values = {}  # widget id -> WidgetState of the values this user has set
+        self.logged_in = False
+        self.timings = {}
+
+    def rerun(self, trigger=None, fragment_id=""):
+        """Send a rerun (of a fragment, if fragment_id is given) and read the page until the script finishes."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        message = BackMsg()
+        message.rerun_script.page_script_hash = ""
+        message.rerun_script.fragment_id = fragment_id
+        states = message.rerun_script.widget_states.widgets
+        states.extend(self.widget_values.values())
+        if trigger:
+            states.append(WidgetState(id=trigger, trigger_value=True))
+        self.connection.send(message.SerializeToString())
+
+        if not fragment_id:
+            self.widgets, self.options = {}, {}
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(self.connection.recv(timeout=300))
+            kind = reply.WhichOneof("type")
+            if kind == "delta" and reply.delta.WhichOneof("type") == "new_element":
+                element = reply.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    raise RuntimeError(element.exception.message)
+                widget = getattr(element, element_type)
+                if getattr(widget, "id", "") and getattr(widget, "label", ""):
+                    self.widgets[widget.label] = (widget.id, reply.delta.fragment_id)
+                    if element_type == "selectbox":
+                        self.options[widget.label] = list(widget.options)
+            elif kind == "script_finished":
+                if reply.script_finished in (ForwardMsg.FINISHED_SUCCESSFULLY,
+                                             ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY):
+                    return
+                if reply.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("main.py failed to compile")
+
+    def widget(self, label):
+        if label not in self.widgets:
+            raise LookupError(f"No widget labelled {label!r} on the page")
+        return self.widgets[label]
+
+    def step(self, name, click=None, values=None, navigates=False):
+        """Set widget values and/or click a button, and time the rerun (and the page shown after it)."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        trigger, fragment_id = self.widget(click) if click else (None, "")
+        for label, value in (values or {}).items():
+            widget_id, fragment_id = self.widget(label)
+            self.widget_values[widget_id] = WidgetState(id=widget_id, string_value=value)
+        start = time.perf_counter()
+        self.rerun(trigger, fragment_id)
+        if navigates:
+            self.rerun()
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    def flow(self, question):
+        if not self.logged_in:
+            self.step("open")
+            self.step("login", "Login", {"Email": self.email, "Password": self.password}, navigates=True)
+            self.logged_in = True
+        self.step("select case", values={"Choose a test case:": question})
+        self.step("answer", "Answer")
+        self.step("validate", "Validate")
+        self.step("next", "NEXT", navigates=True)
+        self.step("select step", values={"Choose a step:": self.options["Choose a step:"][1]})
+        self.step("answer step", "Answer")
+        self.step("validate step", "Validate")
+        self.step("next (results)", "Next", navigates=True)
+        for name, label in CHART_BUTTONS:
+            self.step(name, label)
+        # Close the table and charts again, so that every flow opens them anew
+        for _, label in CHART_BUTTONS:
+            self.rerun(*self.widget(label))
+        self.step("back to validation", "Back to Validation Page", navigates=True)
+        self.step("back to testing", "Back to Test Cases", navigates=True)
+
+
+def run_level(port, server_pid, users, flows, questions, offset, credentials):
+    """Run `flows` flows for each of `users` concurrent users; return the level's report."""
+    from websockets.sync.client import connect
+
+    connections = contextlib.ExitStack()
+    start_rss = process_rss_mb(server_pid)
+    sessions = [SimulatedUser(connections.enter_context(connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                                                subprotocols=["streamlit"], max_size=None,
+                                                                open_timeout=60)),
+                              *credentials[i % len(credentials)])
+                for i in range(users)]
+    errors = []
+    start_barrier = threading.Barrier(users)
+
+    def run(user, session):
+        start_barrier.wait()
+        completed = 0
+        for flow in range(flows):
+            try:
+                session.flow(questions[(offset + flow * users + user) % len(questions)])
+                completed += 1
+            except Exception as e:
+                errors.append(f"user {user}: {e}")
+                break
+        return completed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        completed = sum(executor.map(run, range(users), sessions))
+    elapsed = time.perf_counter() - start
+    memory_per_session = (process_rss_mb(server_pid) - start_rss) / users  # every session still connected
+    connections.close()
+
+    timings = {}
+    for session in sessions:
+        for name, values in session.timings.items():
+            timings.setdefault(name, []).extend(values)
+    steps = sum(len(values) for values in timings.values())
+    return {"users": users, "seconds": elapsed, "flows": completed, "steps": steps,
+            "flows_per_second": completed / elapsed, "steps_per_second": steps / elapsed,
+            "all_steps": [value for values in timings.values() for value in values],
+            "timings": timings, "memory_per_session_mb": memory_per_session, "errors": errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1,5,10,25", help="comma-separated numbers of concurrent users")
+    parser.add_argument("--flows", type=int, default=2, help="flows per user")
+    parser.add_argument("--bigquery-latency", type=float, default=0.3)
+    parser.add_argument("--openai-latency", type=float, default=1.0, help="seconds to the first token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per further streamed token")
+    parser.add_argument("--gcs-latency", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    levels = [int(users) for users in args.users.split(",")]
+
+    metadata = fixtures.make_metadata()
+    users = fixtures.make_users()
+    credentials = list(zip(users["email"], users["password"]))
+    questions = [row.Question for row in metadata.itertuples(index=False) if isinstance(row.Steps, str) and row.Steps]
+    latency = {"bigquery": args.bigquery_latency, "openai": args.openai_latency,
+               "openai_token": args.token_latency, "gcs": args.gcs_latency}
+
+    port = free_port()
+    server = start_server(port, latency)
+    try:
+        # One flow first, so imports and per-process caches don't count against the first level
+        run_level(port, server.pid, 1, 1, questions, 0, credentials)
+
+        print(f"latency: bigquery {args.bigquery_latency}s, openai {args.openai_latency}s + "
+              f"{args.token_latency}s/token, gcs {args.gcs_latency}s; {args.flows} flows per user")
+        print(f"{'users':>5s} {'seconds':>8s} {'flows/s':>8s} {'steps/s':>8s} {'p50':>8s} {'p95':>8s} "
+              f"{'MB/session':>10s} {'errors':>6s}")
+        reports, offset = [], 1
+        for level in levels:
+            report = run_level(port, server.pid, level, args.flows, questions, offset, credentials)
+            offset += level * args.flows
+            reports.append(report)
+            print(f"{level:5d} {report['seconds']:8.1f} {report['flows_per_second']:8.2f} "
+                  f"{report['steps_per_second']:8.2f} {percentile(report['all_steps'], 0.5) * 1000:6.0f}ms "
+                  f"{percentile(report['all_steps'], 0.95) * 1000:6.0f}ms {report['memory_per_session_mb']:10.2f} "
+                  f"{len(report['errors']):6d}", flush=True)
+            for error in report["errors"][:3]:
+                print(f"      {error}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    print("\nper-step latency p50 / p95 (ms)")
+    print(f"{'step':20s}" + "".join(f"{f'{level} users':>16s}" for level in levels))
+    for name in STEPS:
+        cells = []
+        for report in reports:
+            values = report["timings"].get(name)
+            cells.append(f"{percentile(values, 0.5) * 1000:.0f} / {percentile(values, 0.95) * 1000:.0f}"
+                         if values else "-")
+        print(f"{name:20s}" + "".join(f"{cell:>16s}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Time to read the test case dataset into a DataFrame, over REST versus Arrow.
+
+The fixture metadata (Question, task_id, Final answer, extractedData,
+extractedIndex) is repeated to --rows rows, with every attachment text
+padded by --filler-sentences sentences, and read three ways:
+
+- REST, per row: the library's RowIterator decoding REST JSON pages
+  (served from memory, --page-rows rows each), iterated row by row into a
+  DataFrame of Python str objects;
+- REST, Arrow strings: the same pages read with to_dataframe and
+  bigquery_reads.string_dtype(), what query_dataframe does when the
+  Storage Read API is unavailable (pages are decoded into Arrow columns);
+- Arrow stream: the result as an Arrow IPC stream of record batches (what
+  the Storage Read API sends, and the stub client serves) read into a
+  DataFrame with Arrow strings, what query_dataframe does with it.
+
+Prints the time, throughput (MB of string payload per second) and the
+DataFrame's memory for each.
+
+Usage:
+    python benchmarks/measure_bigquery_reads.py [--rows 2000] [--filler-sentences 400] [--page-rows 500]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from stubs import STREAMLIT_APP_DIR  # noqa: F401  (puts streamlit_app/ on sys.path)
+import fixtures
+
+COLUMNS = ["Question", "task_id", "Final answer", "extractedData", "extractedIndex"]
+
+
+def make_dataset(rows, filler_sentences):
+    metadata = fixtures.make_metadata()[COLUMNS]
+    rng = random.Random(fixtures.SEED)
+    records = []
+    for i in range(rows):
+        record = metadata.iloc[i % len(metadata)].to_dict()
+        record["task_id"] = f"{record['task_id']}-{i}"
+        if isinstance(record["extractedData"], str):
+            record["extractedData"] += " " + fixtures._paragraph(rng, filler_sentences)
+        records.append({column: value if isinstance(value, str) else None for column, value in record.items()})
+    return records
+
+
+def rest_pages(records, page_rows):
+    """Serialized REST tabledata pages: {"rows": [{"f": [{"v": ...}]}], "pageToken", "totalRows"}."""
+    pages = []
+    for start in range(0, len(records), page_rows):
+        rows = [{"f": [{"v": record[column]} for column in COLUMNS]} for record in records[start:start + page_rows]]
+        token = str(start + page_rows) if start + page_rows < len(records) else None
+        pages.append(json.dumps({"rows": rows, "pageToken": token, "totalRows": str(len(records))}).encode("utf-8"))
+    return pages
+
+
+def read_rest(pages, page_rows, string_dtype=None):
+    """Read the pages with to_dataframe, or row by row into object columns if string_dtype is None."""
+    import pandas as pd
+    from google.cloud import bigquery
+    from google.cloud.bigquery.table import RowIterator
+
+    def api_request(method=None, path=None, query_params=None, **kwargs):
+        token = int((query_params or {}).get("pageToken") or 0)
+        return json.loads(pages[token // page_rows])
+
+    rows = RowIterator(client=None, api_request=api_request, path="/tabledata",
+                       schema=[bigquery.SchemaField(column, "STRING") for column in COLUMNS])
+    if string_dtype is None:
+        return pd.DataFrame([list(row.values()) for row in rows], columns=COLUMNS, dtype=object)
+    return rows.to_dataframe(create_bqstorage_client=False, string_dtype=string_dtype)
+
+
+def arrow_stream(records):
+    import pyarrow as pa
+
+    table = pa.Table.from_pylist(records)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=1024):
+            writer.write_batch(batch)
+    return sink.getvalue()
+
+
+def read_arrow(stream, string_dtype):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(stream).read_all().to_pandas(types_mapper={pa.string(): string_dtype}.get)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--filler-sentences", type=int, default=400)
+    parser.add_argument("--page-rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from bigquery_reads import string_dtype
+
+    records = make_dataset(args.rows, args.filler_sentences)
+    payload_mb = sum(len(value.encode("utf-8")) for record in records for value in record.values() if value) / 1e6
+    pages, stream = rest_pages(records, args.page_rows), arrow_stream(records)
+    print(f"{args.rows} rows, {payload_mb:.1f} MB of strings; REST pages {sum(map(len, pages)) / 1e6:.1f} MB, "
+          f"Arrow stream {len(stream) / 1e6:.1f} MB")
+
+    readers = [("REST, per row", lambda: read_rest(pages, args.page_rows)),
+               ("REST, Arrow strings", lambda: read_rest(pages, args.page_rows, string_dtype())),
+               ("Arrow stream", lambda: read_arrow(stream, string_dtype()))]
+    for label, read in readers:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            df = read()
+            timings.append(time.perf_counter() - start)
+        seconds = statistics.median(timings)
+        print(f"{label:22s} {seconds * 1000:9.1f}ms  {payload_mb / seconds:8.0f} MB/s  "
+              f"DataFrame {df.memory_usage(deep=True).sum() / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
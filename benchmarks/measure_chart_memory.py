@@ -0,0 +1,117 @@
+"""
+Memory soak test for the chart panels.
+
+Reruns the visualization page (all three charts) and the admin page (its
+chart) thousands of times through Streamlit's AppTest, then renders charts
+for a thousand distinct counts (every one a cache miss), sampling the
+process RSS as it goes. Every rerun that drew a chart used to leave a
+pyplot figure behind; now RSS should stay flat once the caches are warm.
+
+AppTest itself keeps a little state per rerun, so the same reruns are made
+first with the charts hidden and only the difference is charged to the
+charts. Exits with status 1 if the charts grew RSS by more than
+--max-growth-mb in either phase.
+
+Usage:
+    python benchmarks/measure_chart_memory.py [--reruns 2000] [--renders 1000]
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import time
+
+from stubs import STREAMLIT_APP_DIR
+from measure_reruns import APP_SCRIPT
+import fixtures
+
+ADMIN_SCRIPT = APP_SCRIPT.replace('elif page == "visualization":', '''elif page == "admin":
+        from admin import admin_page
+        admin_page()
+    elif page == "visualization":''')
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def soak(label, step, iterations, warmup, sample_every):
+    """Run step() iterations times; return (rss after warmup, rss at end, seconds)."""
+    for _ in range(warmup):
+        step()
+    gc.collect()
+    start_rss, start = rss_mb(), time.perf_counter()
+    for i in range(1, iterations + 1):
+        step()
+        if i % sample_every == 0:
+            print(f"  {label:24s} {i:6d}  rss {rss_mb():8.1f} MB", flush=True)
+    gc.collect()
+    return start_rss, rss_mb(), time.perf_counter() - start
+
+
+def page_app(page, state, toggles):
+    from streamlit.testing.v1 import AppTest
+
+    metadata = fixtures.make_metadata()
+    results = fixtures.make_results(metadata)
+    app = AppTest.from_string(ADMIN_SCRIPT.format(app_dir=STREAMLIT_APP_DIR,
+                                                  benchmark_dir=os.path.dirname(os.path.abspath(__file__))),
+                              default_timeout=60)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    app.session_state["page"] = page
+    app.session_state["session_id"] = results["sessionId"].iloc[0]
+    for key, value in state.items():
+        app.session_state[key] = value
+    app.run()
+    for key in toggles:
+        app.session_state[key] = True
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"{page} page failed: {app.exception[0].message}")
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=2000)
+    parser.add_argument("--renders", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    def rerun_pages(show_charts):
+        visualization = page_app("visualization", {"user_email": "bench@example.com"},
+                                 ["show_question_graph", "show_steps_graph", "show_overall_graph"] if show_charts else [])
+        admin = page_app("admin", {}, ["show_visualization"] if show_charts else [])
+        return lambda: (visualization.run(), admin.run())
+
+    sys.path.insert(0, STREAMLIT_APP_DIR)
+    from visualization import render_bar_chart
+    counter = iter(range(10 ** 9))
+
+    def render_new_counts():
+        # Distinct counts every time: a cache miss that draws and evicts
+        n = next(counter)
+        render_bar_chart(["True", "False", "Skipped"], [n, n // 2, n // 3], "Soak", ["green", "red", "blue"])
+
+    growth = {}
+    for label, step, iterations in [("reruns, charts hidden", rerun_pages(False), args.reruns),
+                                    ("reruns, charts shown", rerun_pages(True), args.reruns),
+                                    ("uncached renders", render_new_counts, args.renders)]:
+        start_rss, end_rss, seconds = soak(label, step, iterations, args.warmup, max(1, iterations // 10))
+        growth[label] = end_rss - start_rss
+        print(f"{label}: {iterations} in {seconds:.1f}s ({seconds / iterations * 1000:.1f}ms each), "
+              f"rss {start_rss:.1f} -> {end_rss:.1f} MB ({growth[label]:+.1f} MB)")
+
+    chart_growth = {"reruns": growth["reruns, charts shown"] - growth["reruns, charts hidden"],
+                    "uncached renders": growth["uncached renders"]}
+    print("growth charged to charts: " + ", ".join(f"{k} {v:+.1f} MB" for k, v in chart_growth.items()))
+    if max(chart_growth.values()) > args.max_growth_mb:
+        sys.exit(f"RSS grew by more than {args.max_growth_mb} MB")
+
+
+if __name__ == "__main__":
+    main()
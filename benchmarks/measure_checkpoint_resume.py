@@ -0,0 +1,176 @@
+"""
+Kill dataflow/DataFromFile.py halfway through an ingest and resume it.
+
+Runs the ingest (against the stub BigQuery and GCS clients, in a child
+process) over --tasks tasks whose attachments cycle through the fixture
+formats, plus a task without a file path, one with a non-GCS path and one
+whose file is missing. The first download of every --flaky-every-th file
+fails, so those tasks are retried with backoff. Then:
+
+- an uninterrupted run, for reference;
+- a run killed (SIGKILL) once --kill-at of the tasks are in its journal,
+  followed by a run resuming from the journal.
+
+Prints the duration of each run, how long the resumed run took to skip the
+finished tasks and start on new ones, how many tasks were done twice, and
+whether the stored text (hash of extractedData, token count and index per
+task) and the journaled outcomes match those of the uninterrupted run.
+
+Usage:
+    python benchmarks/measure_checkpoint_resume.py [--tasks 120] [--kill-at 0.5] [--gcs-latency 0.05]
+"""
+import argparse
+import json
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from stubs import REPO_ROOT
+import fixtures
+
+BENCHMARKS_DIR = os.path.join(REPO_ROOT, "benchmarks")
+# Formats the ingest extracts without OCR or ffmpeg
+EXTENSIONS = [".txt", ".csv", ".jsonld", ".xml", ".pdb", ".zip", ".xlsx", ".pdf", ".pptx"]
+
+# Child process: records every UPDATE of the stub metadata table to a file, then runs the ingest
+CHILD_SCRIPT = """
+import hashlib, json, pickle, sys, zlib
+sys.path.insert(0, {benchmarks_dir!r})
+from stubs import FakeBigQueryClient, FakeBlob, install_stubs
+
+workdir, table_file, journal, flaky_every = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+with open(workdir + "/fixtures.pkl", "rb") as f:
+    tables, objects, latency = pickle.load(f)
+install_stubs(tables=tables, objects=objects, latency=latency)
+sha = lambda text: hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+query = FakeBigQueryClient.query
+def recording_query(self, sql, job_config=None):
+    job = query(self, sql, job_config)
+    if sql.strip().upper().startswith("UPDATE"):
+        params = {{p.name: p.value for p in job_config.query_parameters}}
+        with open(table_file, "a") as f:
+            f.write(json.dumps({{"task_id": params["task_id"], "text": sha(params["extracted_text"]),
+                                "tokens": params["token_count"], "index": sha(params["extracted_index"])}}) + "\\n")
+    return job
+FakeBigQueryClient.query = recording_query
+
+download, failed_once = FakeBlob.download_as_bytes, set()
+def flaky_download(self, **kwargs):
+    if flaky_every and zlib.crc32(self.name.encode()) % flaky_every == 0 and self.name not in failed_once:
+        from google.api_core.exceptions import ServiceUnavailable
+        failed_once.add(self.name)
+        raise ServiceUnavailable("stub: transient GCS error")
+    return download(self, **kwargs)
+FakeBlob.download_as_bytes = flaky_download
+
+import DataFromFile
+DataFromFile.main(["--journal", journal, "--backoff", "0.05"])
+"""
+
+
+def make_fixtures(num_tasks, n_sentences):
+    attachments = fixtures.make_attachments(n_sentences=n_sentences)
+    rows, objects = [], {}
+    for i in range(num_tasks):
+        extension = EXTENSIONS[i % len(EXTENSIONS)]
+        name = f"attachments/task-{i:04d}{extension}"
+        objects[name] = attachments[extension]
+        rows.append({"task_id": f"task-{i:04d}", "gcs_file_path": f"gs://gaia-benchmark-dataset/{name}"})
+    rows += [{"task_id": "no-path", "gcs_file_path": None},
+             {"task_id": "bad-path", "gcs_file_path": "https://example.com/attachment.pdf"},
+             {"task_id": "no-file", "gcs_file_path": "gs://gaia-benchmark-dataset/attachments/missing.pdf"}]
+    return pd.DataFrame(rows), objects
+
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return f.read().count(b"\n")
+
+
+def run_ingest(workdir, name, flaky_every, kill_at=None):
+    """Run the ingest into <name>.table/<name>.journal; return (seconds, seconds until its first new entry)."""
+    journal, table_file = os.path.join(workdir, f"{name}.journal"), os.path.join(workdir, f"{name}.table")
+    script = CHILD_SCRIPT.format(benchmarks_dir=BENCHMARKS_DIR)
+    finished_before = count_lines(journal)
+    with open(os.path.join(workdir, f"{name}.log"), "ab") as log:
+        start = time.perf_counter()
+        child = subprocess.Popen([sys.executable, "-c", script, workdir, table_file, journal, str(flaky_every)],
+                                 stdout=log, stderr=subprocess.STDOUT)
+        first_entry = None
+        while child.poll() is None:
+            entries = count_lines(journal)
+            if first_entry is None and entries > finished_before:
+                first_entry = time.perf_counter() - start
+            if kill_at is not None and entries >= kill_at:
+                child.send_signal(signal.SIGKILL)
+                child.wait()
+                break
+            time.sleep(0.005)
+        seconds = time.perf_counter() - start
+    if kill_at is None and child.returncode:
+        sys.exit(f"Ingest {name} exited with {child.returncode}, see {workdir}/{name}.log")
+    return seconds, first_entry
+
+
+def load_state(workdir, name):
+    """The stored columns per task (last UPDATE wins), the UPDATE count and the journaled outcomes."""
+    table, updates = {}, 0
+    with open(os.path.join(workdir, f"{name}.table")) as f:
+        for line in f:
+            row = json.loads(line)
+            table[row["task_id"]] = row
+            updates += 1
+    with open(os.path.join(workdir, f"{name}.journal")) as f:
+        outcomes = {}
+        for line in f:
+            entry = json.loads(line)
+            outcomes[entry["item"]] = (entry["outcome"], entry["sha256"])
+    return table, updates, outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=120)
+    parser.add_argument("--kill-at", type=float, default=0.5, help="Fraction of the tasks journaled before the kill.")
+    parser.add_argument("--gcs-latency", type=float, default=0.05, help="Seconds per stubbed GCS download.")
+    parser.add_argument("--filler-sentences", type=int, default=120)
+    parser.add_argument("--flaky-every", type=int, default=10,
+                        help="Fail the first download of one in N files (0: never).")
+    args = parser.parse_args(argv)
+
+    metadata, objects = make_fixtures(args.tasks, args.filler_sentences)
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "fixtures.pkl"), "wb") as f:
+            pickle.dump(({"metadataTable": metadata}, objects, {"gcs": args.gcs_latency}), f)
+
+        full_seconds, _ = run_ingest(workdir, "full", args.flaky_every)
+        kill_at = max(1, int(len(metadata) * args.kill_at))
+        killed_seconds, _ = run_ingest(workdir, "resumed", args.flaky_every, kill_at=kill_at)
+        finished = count_lines(os.path.join(workdir, "resumed.journal"))
+        resumed_seconds, first_entry = run_ingest(workdir, "resumed", args.flaky_every)
+
+        full_table, full_updates, full_outcomes = load_state(workdir, "full")
+        table, updates, outcomes = load_state(workdir, "resumed")
+
+    print(f"{len(metadata)} tasks, {full_updates} with text; GCS latency {args.gcs_latency * 1000:.0f}ms")
+    print(f"uninterrupted run        {full_seconds:7.2f}s")
+    print(f"killed run               {killed_seconds:7.2f}s  ({finished} tasks journaled)")
+    print(f"resumed run              {resumed_seconds:7.2f}s  (first new task after {first_entry:.2f}s, "
+          f"including imports)")
+    print(f"tasks updated twice      {updates - len(table)}")
+    print(f"stored text identical    {table == full_table}")
+    print(f"journal outcomes equal   {outcomes == full_outcomes}  "
+          f"({pd.Series([o for o, _ in outcomes.values()]).value_counts().to_dict()})")
+
+
+if __name__ == "__main__":
+    main()
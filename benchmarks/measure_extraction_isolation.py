@@ -0,0 +1,125 @@
+"""
+Per-format extraction throughput in the isolated worker, and what its caps
+do to pathological attachments.
+
+Extracts every fixture attachment (padded with --filler-sentences) --runs
+times, once in-process with extract_text_from_file and once through
+extract_text_isolated (without a time cap), and prints the per-format MB/s
+of each: the cost of sending the file to the worker process and the text
+back. Then runs
+pathological attachments through the worker with a --memory-mb cap and a
+--timeout:
+
+- a zip bomb: one member of --bomb-mb MB of zeros, compressed to ~1000x less;
+- a spreadsheet too large to read within the timeout (--huge-rows rows);
+- a corrupt PDF, which the extractor rejects with an error.
+
+Prints the outcome, time and parent RSS of each, the ingest's extraction
+profile (see dataflow/extractors.py), and exits non-zero if a
+pathological file was not stopped by its cap.
+
+Usage:
+    python benchmarks/measure_extraction_isolation.py [--runs 5] [--memory-mb 256] [--timeout 2]
+"""
+import argparse
+import io
+import os
+import resource
+import sys
+import time
+import zipfile
+
+from stubs import install_stubs
+import fixtures
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def zip_bomb(megabytes):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        with archive.open("zeros.txt", "w") as member:
+            chunk = bytes(2 ** 20)
+            for _ in range(megabytes):
+                member.write(chunk)
+    return buffer.getvalue()
+
+
+def huge_spreadsheet(rows):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for i in range(rows):
+        sheet.append([i, f"row {i}", i * 0.5, "filler text " * 4])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--filler-sentences", type=int, default=400)
+    parser.add_argument("--memory-mb", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--bomb-mb", type=int, default=1024)
+    parser.add_argument("--huge-rows", type=int, default=400000)
+    args = parser.parse_args(argv)
+
+    install_stubs()
+    import extractors
+    from isolation import IsolatedWorker, WorkProfile, format_profile
+
+    # No time cap while measuring throughput: the worker's first audio file imports numba
+    extractors.extraction_worker = IsolatedWorker("extract", 300, args.memory_mb)
+    attachments = {ext: content for ext, content in fixtures.make_attachments(n_sentences=args.filler_sentences).items()
+                   if content is not None and ext in extractors.EXTRACTORS}
+
+    # Throughput per format, in-process and in the worker
+    in_process = WorkProfile()
+    for ext, content in attachments.items():
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            extractors.extract_text_from_file(f"attachment{ext}", content)
+            in_process.record(extractors.FORMAT_BY_EXTENSION[ext], len(content), time.perf_counter() - start)
+            extractors.extract_text_isolated(f"attachment{ext}", content)
+    isolated = extractors.extraction_profile.summary()
+    print(f"{'format':8s} {'KB':>7s} {'in-process MB/s':>16s} {'isolated MB/s':>14s}")
+    for name, stats in in_process.summary().items():
+        print(f"{name:8s} {stats['mb'] * 1000 / stats['runs']:7.1f} {stats['mb_per_s']:16.2f} "
+              f"{isolated[name]['mb_per_s']:14.2f}")
+
+    # Pathological attachments, each expected to be stopped by a cap
+    print(f"\nCaps: {args.memory_mb}MB, {args.timeout:.1f}s")
+    extractors.extraction_worker.timeout = args.timeout
+    cases = [
+        ("zip bomb", "bomb.zip", zip_bomb(args.bomb_mb), "memory"),
+        ("huge spreadsheet", "huge.xlsx", huge_spreadsheet(args.huge_rows), "timeout"),
+        ("corrupt pdf", "corrupt.pdf", b"%PDF-1.7\n" + os.urandom(4096), "error"),
+    ]
+    stopped = True
+    for label, file_path, content, expected in cases:
+        start = time.perf_counter()
+        try:
+            outcome, _ = extractors.extract_text_isolated(file_path, content)
+        except RuntimeError:
+            outcome = "error"
+        seconds = time.perf_counter() - start
+        stopped &= outcome == expected
+        print(f"{label:18s} {len(content) / 1e6:7.2f}MB  {outcome:8s} (expected {expected:7s}) {seconds:6.2f}s  "
+              f"parent max RSS {rss_mb():6.0f}MB")
+    # The worker is replaced after a cap: the next file is extracted as usual
+    outcome, text = extractors.extract_text_isolated("after.txt", b"still extracting")
+    print(f"{'next file':18s} {outcome:8s} ({text!r}), {extractors.extraction_worker.starts} worker processes started")
+    extractors.extraction_worker.stop()
+
+    print("\nExtraction profile:\n" + format_profile(extractors.extraction_profile.summary()))
+    if not stopped:
+        sys.exit("A pathological attachment was not stopped by its cap")
+
+
+if __name__ == "__main__":
+    main()
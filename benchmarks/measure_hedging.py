@@ -0,0 +1,134 @@
+"""
+Tail latency of chat completions with and without hedged requests, and the
+circuit breaker during an outage.
+
+The stub completion takes a log-normal time (median --median-latency
+seconds), and one call in --slow-every instead hangs for --slow-seconds:
+the slow responses of a degraded upstream. get_completion is called with
+--calls distinct prompts from --concurrency threads, after --warmup calls
+that fill the latency window the hedge delay is derived from. Prints the
+latency percentiles with hedging off and on, and the share of calls that
+sent a hedge. (With one slow call in 20 or more, the p95 the hedge delay
+is derived from is itself a slow response, and hedging can't help.)
+
+Then the stub goes down (every request fails after --timeout-seconds, as a
+timeout) and comes back. Prints, for the calls during the outage, the probe
+call once the breaker lets one through, and the calls after it: how many
+failed, how many failed fast on the open breaker, and how long they took.
+
+Usage:
+    python benchmarks/measure_hedging.py [--calls 400] [--slow-every 50] [--slow-seconds 3]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stubs import fake_chat_completion, install_stubs
+
+
+class SlowStub:
+    """ChatCompletion.create stand-in with log-normal latency, some hung calls, and an outage switch."""
+
+    def __init__(self, median, slow_every, slow_seconds, seed=7245):
+        self.median, self.slow_every, self.slow_seconds = median, slow_every, slow_seconds
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.down_for = None  # seconds each request takes before failing, while down
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.requests += 1
+            slow = self.slow_every and self.rng.randrange(self.slow_every) == 0
+            latency = self.median * self.rng.lognormvariate(0, 0.3)
+        if self.down_for is not None:
+            import openai
+            time.sleep(self.down_for)
+            raise openai.error.Timeout("stub: request timed out")
+        time.sleep(self.slow_seconds if slow else latency)
+        return fake_chat_completion(**kwargs)
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return f"p50 {pick(0.5):7.0f}ms  p95 {pick(0.95):7.0f}ms  p99 {pick(0.99):7.0f}ms  max {ordered[-1] * 1000:7.0f}ms"
+
+
+def timed_calls(openai_utils, prompts, concurrency):
+    """Call get_completion for every prompt; return (latencies of successes, failures, fast failures)."""
+    def call(prompt):
+        start = time.perf_counter()
+        try:
+            openai_utils.get_completion(prompt)
+            return time.perf_counter() - start, None
+        except RuntimeError as e:
+            return time.perf_counter() - start, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, prompts))
+    latencies = [seconds for seconds, error in outcomes if error is None]
+    failures = [(seconds, error) for seconds, error in outcomes if error is not None]
+    fast = [seconds for seconds, error in failures if "circuit breaker open" in str(error)]
+    return latencies, failures, fast
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median-latency", type=float, default=0.2)
+    parser.add_argument("--slow-every", type=int, default=50)
+    parser.add_argument("--slow-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout-seconds", type=float, default=1.0, help="Per-call timeout in the outage.")
+    parser.add_argument("--outage-calls", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("LEDGER_DIR", tempfile.mkdtemp(prefix="hedging-usage-"))
+    install_stubs()
+    import openai
+    import openai_utils
+
+    stub = SlowStub(args.median_latency, args.slow_every, args.slow_seconds)
+    openai.ChatCompletion.create = staticmethod(stub.create)
+    counter = iter(range(10 ** 9))
+    prompts = lambda n: [f"Question {next(counter)}: what is the answer?" for _ in range(n)]
+
+    for hedge in (False, True):
+        openai_utils.OPENAI_HEDGE_ENABLED = hedge
+        openai_utils.openai_callers.clear()
+        timed_calls(openai_utils, prompts(args.warmup), args.concurrency)
+        requests_before = stub.requests
+        latencies, failures, _ = timed_calls(openai_utils, prompts(args.calls), args.concurrency)
+        hedges = stub.requests - requests_before - args.calls
+        delay = openai_utils.get_openai_caller().hedge_delay()
+        print(f"hedging {'on ' if hedge else 'off'}  {percentiles(latencies)}  "
+              f"mean {statistics.mean(latencies) * 1000:5.0f}ms  hedged {hedges / args.calls:5.1%}"
+              + (f" (delay {delay * 1000:.0f}ms)" if hedge else "") + f"  failed {len(failures)}")
+
+    # Outage: every request fails after the per-call timeout, then the upstream recovers
+    openai_utils.OPENAI_TIMEOUT_SECONDS = args.timeout_seconds
+    openai_utils.openai_callers.clear()
+    os.environ["OPENAI_BREAKER_RESET_SECONDS"] = "2"
+    caller = openai_utils.get_openai_caller()
+    stub.down_for, stub.slow_every = args.timeout_seconds, 0
+    for phase, calls in (("outage", args.outage_calls), ("probe", 1), ("recovered", args.outage_calls)):
+        if phase == "probe":
+            stub.down_for = None
+            time.sleep(caller.breaker.reset_seconds)  # until the breaker lets a probe through
+        start = time.perf_counter()
+        latencies, failures, fast = timed_calls(openai_utils, prompts(calls), args.concurrency)
+        seconds = [s for s, _ in failures] + latencies
+        print(f"{phase:9s}  {len(latencies):3d} answered, {len(failures):3d} failed ({len(fast)} fast), "
+              f"mean {statistics.mean(seconds) * 1000:6.0f}ms per call, {time.perf_counter() - start:5.1f}s in all, "
+              f"breaker {caller.breaker.state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Bytes scanned by every named BigQuery query of the app, as the tables grow.
+
+Runs each loader (login, testing, validation, visualization, admin,
+batch pipeline and the point lookups of openai_utils) against
+the stub tables at every --scales multiple of the fixture sizes. The stub
+answers dry runs with the bytes of the columns a query references (see
+FakeBigQueryClient.scanned_bytes). Prints the top offenders from the cost
+log after each scale, with the growth since the first scale and the queries
+the --budget would have blocked, then the cost of a budget check whose
+dry run is cached.
+
+Usage:
+    python benchmarks/measure_query_costs.py [--scales 1,10] [--budget 2MB]
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from stubs import install_stubs
+import fixtures
+
+
+def make_tables(scale):
+    metadata = fixtures.make_metadata(num_tasks=fixtures.NUM_TASKS * scale)
+    return {
+        "metadataTable": metadata,
+        "evaluationEvents": fixtures.make_results(metadata, num_sessions=50 * scale),
+        "UserInfo": fixtures.make_users(num_users=500 * scale),
+    }
+
+
+def loaders(tables):
+    import Testing
+    import admin
+    import batch_pipeline
+    import main as main_page
+    import openai_utils
+    import validation
+    import visualization
+
+    metadata = tables["metadataTable"]
+    task_id, session_id = metadata["task_id"].iloc[0], tables["evaluationEvents"]["sessionId"].iloc[0]
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+    return [
+        main_page.load_user_data_from_bigquery,
+        Testing.load_test_case_data,
+        validation.load_steps_data_from_bigquery,
+        lambda: visualization.load_result_data(session_id, "questionResult", since),
+        admin.load_results_data,
+        admin.load_userinfo_page,
+        admin.count_users,
+        batch_pipeline.load_pending_questions,
+        lambda: openai_utils.get_annotator_metadata_from_bigquery(task_id),
+        lambda: openai_utils.get_extracted_data_from_bigquery(f"gs://gaia-benchmark-dataset/{task_id}.pdf"),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1,10", help="Comma-separated multiples of the fixture table sizes.")
+    parser.add_argument("--budget", default="2MB", help="Per-query budget, as for BIGQUERY_BYTES_BUDGET.")
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    os.environ["BIGQUERY_COST_LOG"] = os.path.join(tempfile.mkdtemp(prefix="query-costs-"), "costs.jsonl")
+    os.environ["BIGQUERY_BUDGET_MODE"] = "warn"  # run every query, and flag the ones over budget
+    os.environ["BIGQUERY_BYTES_BUDGET"] = args.budget
+    install_stubs()
+    import streamlit as st
+    import query_cost
+
+    for scale in (int(s) for s in args.scales.split(",")):
+        tables = make_tables(scale)
+        install_stubs(tables=tables)
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        query_cost._estimates.clear()
+        for load in loaders(tables):
+            try:
+                load()
+            except RuntimeError:
+                pass  # the fixtures lack columns some point lookups read; their dry runs are recorded all the same
+
+        print(f"\nTables at {scale}x the fixture sizes ({len(tables['metadataTable'])} tasks); budget {args.budget}")
+        offenders = query_cost.top_offenders(query_cost.load_query_costs(), args.top)
+        for row in offenders.itertuples(index=False):
+            growth = "" if row.growth != row.growth else f"x{row.growth:5.1f}"
+            print(f"  {row.name:42s} {query_cost.format_bytes(row.latest_bytes):>9s} {row.budget_used:7.1%}  "
+                  f"{growth:6s} {'OVER BUDGET' if row.latest_bytes > row.budget else ''}")
+
+    # A check whose estimate is cached: what every query pays between dry runs
+    from google.cloud import bigquery
+    client, query = bigquery.Client(), "SELECT email FROM `stub-project.stub_dataset.UserInfo`"
+    query_cost.check_query(client, "cached", query)
+    start, n = time.perf_counter(), 10000
+    for _ in range(n):
+        query_cost.check_query(client, "cached", query)
+    print(f"\nBudget check with a cached dry run: {(time.perf_counter() - start) / n * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
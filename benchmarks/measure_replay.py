@@ -0,0 +1,169 @@
+"""
+Record an evaluation session into a cassette and replay it offline.
+
+The session (run in a child process) loads the testing, validation,
+visualization and admin pages' data, answers --tasks questions (every
+other one streamed) with their attachments read from GCS, records the
+question and steps results, and ingests the attachments with
+dataflow/DataFromFile.py's process_task, as the app and the ingest would.
+
+- record: the session runs against the stubs, which sleep for
+  --bigquery-latency, --openai-latency and --gcs-latency seconds like the
+  live services would, with CASSETTE_MODE=record;
+- replay: the same session runs without the stubs (no client can reach a
+  service) from the cassette, as fast as possible (CASSETTE_LATENCY=0)
+  and with the recorded latency (CASSETTE_LATENCY=1).
+
+Prints the duration of each run, the cassette's size and calls, how the
+replayed calls were matched, and whether every replayed result (answers,
+DataFrames, extracted text) is identical to the recorded one. Exits
+non-zero if not.
+
+Usage:
+    python benchmarks/measure_replay.py [--tasks 12] [--openai-latency 0.3]
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+from stubs import REPO_ROOT
+import fixtures
+
+BENCHMARKS_DIR = os.path.join(REPO_ROOT, "benchmarks")
+EXTENSIONS = [".txt", ".csv", ".jsonld", ".xml", ".pdb", ".zip", ".xlsx", ".pdf", ".pptx"]
+
+# Child process: one evaluation session, recorded against the stubs or replayed from the cassette
+CHILD_SCRIPT = """
+import hashlib, json, os, pickle, sys, tempfile, time
+sys.path.insert(0, {benchmarks_dir!r})
+workdir, mode, latency, output = sys.argv[1], sys.argv[2], float(sys.argv[3]), sys.argv[6]
+for name in ("GCS_CACHE_DIR", "LEDGER_DIR", "CHECKPOINT_DIR"):
+    os.environ[name] = tempfile.mkdtemp(prefix=name.lower() + "-")
+os.environ["BIGQUERY_COST_LOG"] = os.path.join(os.environ["LEDGER_DIR"], "costs.jsonl")
+import stubs  # only puts streamlit_app/ and dataflow/ on sys.path
+if mode == "record":
+    with open(workdir + "/fixtures.pkl", "rb") as f:
+        tables, objects, service_latency = pickle.load(f)
+    stubs.install_stubs(tables=tables, objects=objects, latency=service_latency)
+else:
+    # The configuration the recording ran with; nothing else of the stubs
+    for name, value in (("PROJECT_ID", "stub-project"), ("DATASET_ID", "stub_dataset"), ("TABLE_ID", "metadataTable")):
+        os.environ.setdefault(name, value)
+import cassette
+cassette.install_cassette(workdir + "/session.cassette.jsonl.gz", mode, latency)
+
+import datetime, uuid
+import Testing, admin, openai_utils, validation, visualization
+import main as main_page
+from evaluation_events import make_event, record_events
+import DataFromFile, extractors
+
+digest = lambda value: hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:16]
+frame = lambda df: digest(df.to_csv(index=False))
+results, start = {{}}, time.perf_counter()
+session_id = str(uuid.uuid4())  # differs per run, as in the app
+
+df = Testing.load_test_case_data()
+results["testing"] = frame(df)
+results["validation"] = frame(validation.load_steps_data_from_bigquery())
+results["users"] = frame(main_page.load_user_data_from_bigquery())
+results["admin"] = frame(admin.load_results_data())
+results["user_count"] = admin.count_users()
+for i, row in enumerate(df.head(int(sys.argv[4])).itertuples(index=False)):
+    gcs_file_path = f"gs://gaia-benchmark-dataset/attachments/{{row.task_id}}{{sys.argv[5].split(',')[i % 9]}}"
+    if i % 2:
+        answer = "".join(openai_utils.stream_openai_answer(row.Question, "", gcs_file_path, task_id=row.task_id))
+    else:
+        answer = openai_utils.get_openai_answer(row.Question, "", gcs_file_path, task_id=row.task_id)
+    results[f"answer-{{row.task_id}}"] = answer
+    record_events([make_event(row.task_id, session_id, "question", answer, "True", "gpt-4"),
+                   make_event(row.task_id, session_id, "steps", answer, "False", "gpt-4")])
+    outcome, text = DataFromFile.process_task(row.task_id, gcs_file_path)
+    results[f"ingest-{{row.task_id}}"] = [outcome, digest(text)]
+since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)  # differs per run too
+results["visualization"] = frame(visualization.load_result_data(session_id, "questionResult", since))
+seconds = time.perf_counter() - start
+if extractors.extraction_worker is not None:
+    extractors.extraction_worker.stop()
+with open(output, "w") as f:
+    json.dump({{"results": results, "seconds": seconds, "stats": cassette.active_cassette.stats()}}, f)
+"""
+
+
+def make_fixtures(num_tasks, n_sentences):
+    metadata = fixtures.make_metadata()
+    metadata["extractedTokenCount"] = metadata["extractedData"].str.len().fillna(0).astype(int) // 4
+    attachments = fixtures.make_attachments(n_sentences=n_sentences)
+    objects = {f"attachments/{task_id}{EXTENSIONS[i % len(EXTENSIONS)]}": attachments[EXTENSIONS[i % len(EXTENSIONS)]]
+               for i, task_id in enumerate(metadata["task_id"].head(num_tasks))}
+    tables = {"metadataTable": metadata, "evaluationEvents": fixtures.make_results(metadata),
+              "UserInfo": fixtures.make_users()}
+    return tables, objects
+
+
+def run_session(workdir, mode, latency, tasks):
+    script = CHILD_SCRIPT.format(benchmarks_dir=BENCHMARKS_DIR)
+    env = {name: value for name, value in os.environ.items() if not name.startswith("CASSETTE_")}
+    if mode == "replay":
+        # No credentials: the replay must not need them
+        for name in ("OPENAI_API_KEY", "GOOGLE_APPLICATION_CREDENTIALS"):
+            env.pop(name, None)
+    name = os.path.join(workdir, f"{mode}-{latency}")
+    with open(name + ".log", "wb") as log:
+        start = time.perf_counter()
+        child = subprocess.run([sys.executable, "-c", script, workdir, mode, str(latency), str(tasks),
+                                ",".join(EXTENSIONS), name + ".json"], stdout=log, stderr=subprocess.STDOUT, env=env)
+        wall = time.perf_counter() - start
+    if child.returncode:
+        with open(name + ".log", errors="replace") as log:
+            sys.exit(f"{log.read()[-3000:]}\nThe {mode} session exited with {child.returncode}")
+    with open(name + ".json") as f:
+        return json.load(f), wall
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=12)
+    parser.add_argument("--filler-sentences", type=int, default=120)
+    parser.add_argument("--bigquery-latency", type=float, default=0.1)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--gcs-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    tables, objects = make_fixtures(args.tasks, args.filler_sentences)
+    latency = {"bigquery": args.bigquery_latency, "openai": args.openai_latency, "gcs": args.gcs_latency}
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "fixtures.pkl"), "wb") as f:
+            pickle.dump((tables, objects, latency), f)
+        recorded, recorded_wall = run_session(workdir, "record", 0, args.tasks)
+        runs = [("replay, no latency", *run_session(workdir, "replay", 0, args.tasks)),
+                ("replay, recorded latency", *run_session(workdir, "replay", 1, args.tasks))]
+        cassette_path = os.path.join(workdir, "session.cassette.jsonl.gz")
+        cassette_bytes = os.path.getsize(cassette_path)
+        summary = subprocess.run([sys.executable, os.path.join(REPO_ROOT, "streamlit_app", "cassette.py"),
+                                  cassette_path], capture_output=True, text=True).stdout
+
+    print(f"{args.tasks} questions; stub latency BigQuery {args.bigquery_latency * 1000:.0f}ms, "
+          f"OpenAI {args.openai_latency * 1000:.0f}ms, GCS {args.gcs_latency * 1000:.0f}ms")
+    print(f"cassette: {cassette_bytes / 1e3:.1f} KB, {recorded['stats']['recorded']} calls")
+    print("\n".join("  " + line for line in summary.splitlines()[1:]))
+    print(f"{'recorded (stubs)':26s} session {recorded['seconds']:6.2f}s  process {recorded_wall:6.2f}s")
+    identical = True
+    for label, replayed, wall in runs:
+        same = replayed["results"] == recorded["results"]
+        identical &= same
+        stats = replayed["stats"]
+        print(f"{label:26s} session {replayed['seconds']:6.2f}s  process {wall:6.2f}s  "
+              f"matched {stats['exact']} exact, {stats['loose']} loose, {stats['missed']} missed  "
+              f"results identical {same}")
+    if not identical:
+        sys.exit("A replayed session returned different results from the recorded one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Rerun latency of the Streamlit pages.
+
+Drives the testing, validation and visualization pages with Streamlit's
+AppTest against the offline stubs and fixtures, clicks each button a few
+times and reports, per interaction:
+
+- full_rerun_ms: wall time of a whole-script rerun (what every click cost
+  before the pages were split into fragments);
+- fragment_ms: time spent in the span of the fragment the button belongs
+  to, i.e. what the same click costs when Streamlit reruns only that fragment.
+
+AppTest always reruns the whole script, so fragment_ms is read from the
+tracing spans the fragments emit rather than timed directly.
+
+Usage:
+    python benchmarks/measure_reruns.py [--repeat 5]
+"""
+import argparse
+import logging
+import statistics
+import time
+
+from stubs import STREAMLIT_APP_DIR
+import fixtures
+
+APP_SCRIPT = """
+import sys
+sys.path[:0] = [{app_dir!r}, {benchmark_dir!r}]
+import stubs
+if not getattr(stubs, "rerun_stubs_installed", False):
+    import fixtures
+    metadata = fixtures.make_metadata()
+    stubs.install_stubs(tables={{
+        "metadataTable": metadata,
+        "evaluationEvents": fixtures.make_results(metadata),  # as the latest-state query returns it
+        "UserInfo": fixtures.make_users(),
+    }})
+    stubs.rerun_stubs_installed = True
+
+import streamlit as st
+from tracing import start_span
+page = st.session_state["page"]
+with start_span("page.rerun", page=page):
+    if page == "testing":
+        from Testing import testing_page
+        testing_page()
+    elif page == "validation":
+        from validation import validation_page
+        validation_page()
+    elif page == "visualization":
+        from visualization import visualization_page
+        visualization_page()
+"""
+
+# page -> (session state to start from, [(button label to click, span of the fragment it belongs to)])
+SCENARIOS = {
+    "testing": ({}, [("Answer", "fragment.testing_answer"), ("Validate", "fragment.testing_validation")]),
+    "validation": ({}, [("Answer", "fragment.validation_answer"), ("Validate", "fragment.validation_validate")]),
+    "visualization": ({"user_email": "bench@example.com"}, [
+        ("Overview", "fragment.overview"),
+        ("Outcome from Question", "fragment.question_outcome"),
+        ("Outcome from Steps", "fragment.steps_outcome"),
+        ("Overall Outcome", "fragment.overall_outcome"),
+    ]),
+}
+
+
+def _click(app, label):
+    for button in app.button:
+        if button.label == label:
+            button.click()
+            return
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def measure_page(page, repeat):
+    import os
+    from streamlit.testing.v1 import AppTest
+    import tracing
+
+    metadata = fixtures.make_metadata()
+    results = fixtures.make_results(metadata)
+    state, interactions = SCENARIOS[page]
+    script = APP_SCRIPT.format(app_dir=STREAMLIT_APP_DIR, benchmark_dir=os.path.dirname(os.path.abspath(__file__)))
+
+    app = AppTest.from_string(script, default_timeout=60)
+    # Silence the bare-mode warnings of touching session state outside a script run
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    app.session_state["page"] = page
+    app.session_state["session_id"] = results["sessionId"].iloc[0]
+    app.session_state["selected_test_case"] = metadata["Question"].iloc[0]
+    for key, value in state.items():
+        app.session_state[key] = value
+    app.run()  # first run loads the data and warms the caches
+    if app.exception:
+        raise RuntimeError(f"{page} page failed: {app.exception[0].message}")
+    if page == "validation":
+        app.selectbox[0].select_index(1).run()
+
+    report = {}
+    for label, fragment_span in [("(no interaction)", None)] + interactions:
+        full, fragment = [], []
+        for _ in range(repeat):
+            if fragment_span:
+                _click(app, label)
+            tracing.exporter.spans.clear()
+            start = time.perf_counter()
+            app.run()
+            full.append((time.perf_counter() - start) * 1000)
+            fragment.append(sum(
+                (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6
+                for span in tracing.exporter.spans if span["name"] == fragment_span
+            ))
+        report[label] = {"full_rerun_ms": statistics.median(full), "fragment_ms": statistics.median(fragment)}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'page':14s} {'interaction':24s} {'full rerun':>12s} {'fragment':>10s}")
+    for page in SCENARIOS:
+        for label, timings in measure_page(page, args.repeat).items():
+            fragment = f"{timings['fragment_ms']:.1f}ms" if timings["fragment_ms"] else "-"
+            print(f"{page:14s} {label:24s} {timings['full_rerun_ms']:10.1f}ms {fragment:>10s}")
+
+
+if __name__ == "__main__":
+    main()
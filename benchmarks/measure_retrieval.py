@@ -0,0 +1,95 @@
+"""
+Prompt size and retrieval latency with the BM25 attachment index.
+
+For every fixture task with attachment text, a sentence holding a fact
+the question asks about is planted at a random position in the text, and
+the text is indexed as dataflow/DataFromFile.py does at ingest. The
+fixture attachments are short; --filler-sentences pads each one to the
+size of a several-page PDF. Then:
+
+- prompt tokens of the testing-page prompt with the whole text versus
+  only the retrieved chunks (and how many prompts exceed the token limit);
+- recall: how often the planted sentence is among the retrieved chunks;
+- index build time per task, and retrieval time per question, first
+  with the stored index (parsed from JSON) and then from the
+  in-process cache.
+
+Usage:
+    python benchmarks/measure_retrieval.py [--top-k 4] [--filler-sentences 400]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from stubs import install_stubs
+import fixtures
+
+RARE_TERMS = ["quokka", "zeppelin", "obsidian", "marmalade", "saxophone", "glacier", "tungsten", "origami"]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--filler-sentences", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    install_stubs(tables={})
+    import retrieval
+    from openai_utils import PROMPT_TOKEN_LIMIT, build_task_context, get_token_count
+
+    top_k = args.top_k or retrieval.RETRIEVAL_TOP_K
+    rng = random.Random(fixtures.SEED)
+    full_tokens, excerpt_tokens, build_ms, stored_ms, cached_ms = [], [], [], [], []
+    found = over_limit_full = over_limit_excerpt = 0
+
+    for i, case in enumerate(fixtures.make_metadata().itertuples(index=False)):
+        if not isinstance(case.extractedData, str):
+            continue
+        term = f"{RARE_TERMS[i % len(RARE_TERMS)]} {RARE_TERMS[(i // len(RARE_TERMS)) % len(RARE_TERMS)]}"
+        fact = f"The {term} total is {rng.randint(1000, 9999)}."
+        sentences = (case.extractedData + " " + fixtures._paragraph(rng, args.filler_sentences)).split(". ")
+        sentences.insert(rng.randrange(len(sentences) + 1), fact.rstrip("."))
+        text = ". ".join(sentences)
+        question = f"{case.Question} What is the {term} total?"
+
+        start = time.perf_counter()
+        stored_index = retrieval.index_to_json(retrieval.build_index(text))
+        build_ms.append((time.perf_counter() - start) * 1000)
+
+        retrieval._index_cache.clear()
+        start = time.perf_counter()
+        excerpt = retrieval.relevant_excerpt(question, text, stored_index, top_k)
+        stored_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        retrieval.relevant_excerpt(question, text, stored_index, top_k)
+        cached_ms.append((time.perf_counter() - start) * 1000)
+
+        found += fact.rstrip(".") in excerpt
+        full = get_token_count(f"Context:\nQuestion: {question}\nExtracted Data: {text}\n\n\nQuestion: {question}")[0]
+        retrieved = get_token_count(f"Context:\n{build_task_context(question, text, stored_index)}\n\nQuestion: {question}")[0]
+        full_tokens.append(full)
+        excerpt_tokens.append(retrieved)
+        over_limit_full += full > PROMPT_TOKEN_LIMIT
+        over_limit_excerpt += retrieved > PROMPT_TOKEN_LIMIT
+
+    n = len(full_tokens)
+    print(f"{n} attachment tasks, top {top_k} chunks of {retrieval.CHUNK_WORDS} words")
+    print(f"prompt tokens, whole text:  mean {statistics.mean(full_tokens):7.0f}  max {max(full_tokens):6d}  "
+          f"over limit {over_limit_full}")
+    print(f"prompt tokens, retrieved:   mean {statistics.mean(excerpt_tokens):7.0f}  max {max(excerpt_tokens):6d}  "
+          f"over limit {over_limit_excerpt}")
+    print(f"saved {1 - sum(excerpt_tokens) / sum(full_tokens):.1%} of attachment-task prompt tokens")
+    print(f"planted fact retrieved in {found}/{n} ({found / n:.1%})")
+    for label, values in [("index build (ingest)", build_ms), ("retrieval, stored index", stored_ms),
+                          ("retrieval, cached index", cached_ms)]:
+        print(f"{label:24s} p50 {percentile(values, 0.5):7.3f}ms  p95 {percentile(values, 0.95):7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Hit rate, false hits and lookup latency of the semantic answer cache.
+
+For every fixture task a validation-page prompt (test case, first steps,
+extracted data) is answered once, then variants of it are looked up:
+
+- should hit: the same prompt, different whitespace, different case and
+  punctuation, one word of the steps replaced (a typo fix);
+- should miss: the next step instead, one more step, a changed number.
+
+Prints the hit rate per variant, the lookup latency percentiles and the
+time to reload the index from disk. Exits with status 1 if more than
+--max-false-hits should-miss variants were answered from the cache.
+
+Usage:
+    python benchmarks/measure_semantic_cache.py [--threshold 0.9] [--max-edit 12]
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from stubs import STREAMLIT_APP_DIR  # noqa: F401  (puts streamlit_app/ on sys.path)
+import fixtures
+
+SHOULD_HIT = ["same prompt", "whitespace", "case and punctuation", "one word replaced"]
+SHOULD_MISS = ["next step", "one more step", "changed number"]
+PARAMS = ("gpt-4", 0.2, 150, 0.3)
+
+
+def prompt_for(question, steps, extracted_data):
+    context = f"Test Case: {question}\nSteps: {steps}\n"
+    if extracted_data:
+        context += f"Extracted Data: {extracted_data}\n"
+    return f"Context:\n{context}\n\nQuestion: {question}"
+
+
+def variants(rng, question, steps, extracted_data):
+    """Return the base prompt and {variant: prompt}; steps has at least three entries."""
+    base_steps = " ".join(steps[:2]) + " See page 12."
+    words = base_steps.split()
+    position = rng.randrange(len(words) - 3)
+    typo_fixed = " ".join(words[:position] + [words[position] + "s"] + words[position + 1:])
+    base = prompt_for(question, base_steps, extracted_data)
+    return base, {
+        "same prompt": base,
+        "whitespace": re.sub(r" ", "  ", base).replace("\n", "\n\n"),
+        "case and punctuation": prompt_for(question, re.sub(r"[.,]", "", base_steps.lower()), extracted_data),
+        "one word replaced": prompt_for(question, typo_fixed, extracted_data),
+        "next step": prompt_for(question, " ".join([steps[0], steps[2]]) + " See page 12.", extracted_data),
+        "one more step": prompt_for(question, " ".join(steps[:3]) + " See page 12.", extracted_data),
+        "changed number": prompt_for(question, base_steps.replace("page 12", "page 13"), extracted_data),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--max-edit", type=float, default=None)
+    parser.add_argument("--max-false-hits", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from ablation import split_steps
+    from semantic_cache import SemanticAnswerCache
+
+    path = os.path.join(tempfile.mkdtemp(), "semantic-cache.jsonl")
+    cache = SemanticAnswerCache(path=path, threshold=args.threshold, max_edit=args.max_edit, audit_rate=0)
+    rng = random.Random(fixtures.SEED)
+    hits = {name: 0 for name in SHOULD_HIT + SHOULD_MISS}
+    tasks = 0
+    for case in fixtures.make_metadata().itertuples(index=False):
+        steps = split_steps(case.Steps)
+        if len(steps) < 3:
+            continue
+        base, prompts = variants(rng, case.Question, steps, case.extractedData)
+        cache.add(case.task_id, PARAMS, cache.lookup(case.task_id, PARAMS, base), f"answer {case.task_id}")
+        for name, prompt in prompts.items():
+            hits[name] += cache.lookup(case.task_id, PARAMS, prompt).answer is not None
+        tasks += 1
+
+    print(f"{tasks} tasks, threshold {cache.threshold}, max edit {cache.max_edit:g}")
+    for name in SHOULD_HIT + SHOULD_MISS:
+        expected = "hit" if name in SHOULD_HIT else "miss"
+        print(f"  {name:22s} should {expected:4s}  hit rate {hits[name] / tasks:6.1%}")
+    stats = cache.stats()
+    print(f"lookups {stats['lookups']}: p50 {stats['lookup_p50_ms']:.3f}ms, p95 {stats['lookup_p95_ms']:.3f}ms")
+
+    start = time.perf_counter()
+    reloaded = SemanticAnswerCache(path=path)
+    print(f"reloaded {reloaded.size()} entries from disk in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    false_hits = sum(hits[name] for name in SHOULD_MISS)
+    print(f"near-duplicate hit rate {sum(hits[n] for n in SHOULD_HIT[1:]) / (tasks * 3):.1%}, "
+          f"false hits {false_hits}")
+    if false_hits > args.max_false_hits:
+        raise SystemExit(f"{false_hits} false hits (allowed: {args.max_false_hits})")
+
+
+if __name__ == "__main__":
+    main()
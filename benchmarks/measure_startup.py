@@ -0,0 +1,87 @@
+"""
+Cold-start cost of the Streamlit app.
+
+Each measurement runs in a fresh interpreter, like a newly scaled-up replica:
+
+- import_main_ms: importing streamlit_app/main.py (module-level work only);
+- login_render_ms: the first AppTest run of main.py, i.e. rendering the
+  login page (Streamlit's own import is excluded);
+- loaded: which heavy libraries were actually loaded by the time the login
+  page rendered. No cloud client can have been constructed if its library
+  was never loaded.
+
+The real client libraries are used (the benchmark stubs import them eagerly),
+with placeholder credentials, since nothing should talk to the cloud before
+the user logs in.
+
+Usage:
+    python benchmarks/measure_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from stubs import STREAMLIT_APP_DIR
+
+HEAVY_MODULES = ["google.cloud.bigquery", "google.cloud.storage", "openai", "tiktoken",
+                 "matplotlib.pyplot", "pandas"]
+
+CHILD_SCRIPT = r"""
+import json, os, sys, time
+app_dir, mode, heavy_modules = sys.argv[1], sys.argv[2], sys.argv[3].split(",")
+sys.path.insert(0, app_dir)
+os.chdir(app_dir)
+
+if mode == "import":
+    start = time.perf_counter()
+    import main
+    elapsed = time.perf_counter() - start
+else:
+    import logging
+    from streamlit.testing.v1 import AppTest
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(app_dir, "main.py"), default_timeout=120).run()
+    elapsed = time.perf_counter() - start
+    if app.exception:
+        sys.exit(f"main.py failed: {app.exception[0].message}")
+
+def is_loaded(name):
+    module = sys.modules.get(name)
+    # importlib.util.LazyLoader modules stay _LazyModule until first attribute access
+    return module is not None and type(module).__name__ != "_LazyModule"
+
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in heavy_modules if is_loaded(m)]}))
+"""
+
+
+def run_child(mode):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "startup-measurement")
+    env.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "startup-measurement.json")
+    env.setdefault("PROJECT_ID", "startup-project")
+    env.setdefault("DATASET_ID", "startup_dataset")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, STREAMLIT_APP_DIR, mode, ",".join(HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for mode, label in [("import", "import_main_ms"), ("render", "login_render_ms")]:
+        runs = [run_child(mode) for _ in range(args.repeat)]
+        print(f"{label:16s} {statistics.median(run['ms'] for run in runs):8.1f}  "
+              f"(min {min(run['ms'] for run in runs):.1f})")
+        print(f"{'':16s} loaded: {', '.join(runs[-1]['loaded']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Micro-benchmarks for the evaluation hot paths.
+
+Runs offline against the stubs in stubs.py and the synthetic fixtures in
+fixtures.py, writes the results as JSON, and compares the medians with a
+stored baseline. The comparison uses the fastest repeat (min_us), which is
+the least noisy statistic on shared machines. Any benchmark slower than the baseline by more than the
+tolerance (or missing from the run) makes the script exit with status 1.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # run and compare
+    python benchmarks/run_benchmarks.py --save-baseline      # record a new baseline
+    python benchmarks/run_benchmarks.py --filter extract_    # run a subset (with --save-baseline,
+                                                             # only that subset is re-recorded)
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from stubs import install_stubs
+import fixtures
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+
+
+def measure(fn, repeat=5):
+    """Time fn with timeit, auto-ranging the loop count; returns per-call timings in microseconds."""
+    fn()  # warm up lazy imports and caches outside the timed region
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    timings = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_us": statistics.median(timings),
+        "min_us": min(timings),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def openai_utils_benchmarks(metadata):
+    import openai_utils
+
+    short_prompt = metadata["Question"].iloc[0]
+    long_prompt = " ".join(metadata["extractedData"].dropna().head(5))
+    question = metadata["Question"].iloc[1]
+    context = f"Question: {question}\nExtracted Data: {metadata['extractedData'].dropna().iloc[0]}\n"
+    keys = [f"prompt-{i}" for i in range(1000)]
+
+    def fifo_cache_put_get():
+        cache = openai_utils.FIFOCache()
+        for key in keys:
+            cache.put(key, key)
+            cache.get(key)
+
+    counter = iter(range(10 ** 9))
+
+    # Attachment reads go through a throwaway disk cache so runs don't share state
+    openai_utils.gcs_cache = openai_utils.GCSFileCache(tempfile.mkdtemp(prefix="benchmark-gcs-cache-"))
+    attachment_path = "stub-bucket/attachment.txt"
+
+    def get_openai_answer_cache_miss():
+        # A fresh question every call so the FIFO cache never hits
+        openai_utils.get_openai_answer(f"{question} #{next(counter)}", context)
+
+    return {
+        "get_token_count_short": lambda: openai_utils.get_token_count(short_prompt),
+        "get_token_count_long": lambda: openai_utils.get_token_count(long_prompt),
+        "fifo_cache_1000_put_get": fifo_cache_put_get,
+        "build_prompt": lambda: openai_utils.build_prompt(question, context),
+        "get_openai_answer_cache_miss": get_openai_answer_cache_miss,
+        "get_openai_answer_cache_hit": lambda: openai_utils.get_openai_answer(question, context),
+        "read_gcs_file_disk_cache_hit": lambda: openai_utils.read_gcs_file(attachment_path),
+    }
+
+
+def validation_benchmarks(metadata):
+    from validation import remove_final_answer_from_steps
+
+    rows = metadata[["Steps", "Final answer"]].head(50).values.tolist()
+
+    def remove_final_answer_50_cases():
+        for steps, final_answer in rows:
+            remove_final_answer_from_steps(steps.split(". "), final_answer)
+
+    return {"remove_final_answer_from_steps_50_cases": remove_final_answer_50_cases}
+
+
+def scoring_benchmarks(metadata):
+    import pandas as pd
+    from scoring import score_answers, score_answer
+
+    # 20k (generated, expected) pairs built from the fixture answers and steps
+    pairs = metadata[["Steps", "Final answer"]].sample(n=20000, replace=True, random_state=fixtures.SEED)
+    generated = pairs["Steps"].reset_index(drop=True)
+    expected = pd.Series(pairs["Final answer"].tolist())
+    single_generated, single_expected = generated.iloc[0], expected.iloc[0]
+
+    return {
+        "score_answers_20k_pairs": lambda: score_answers(generated, expected),
+        "score_answer_single": lambda: score_answer(single_generated, single_expected),
+    }
+
+
+def page_benchmarks(metadata, results):
+    from Testing import get_test_case_details
+    from visualization import count_results, build_overview_table
+    from admin import count_result_categories
+
+    last_question = metadata["Question"].iloc[-1]
+    session_id = results["sessionId"].iloc[0]
+    session = results[results["sessionId"] == session_id]
+    df_question = session[["questionResult", "task_id"]]
+    df_steps = session[["stepsResult", "task_id"]]
+
+    return {
+        "testing_get_test_case_details": lambda: get_test_case_details(metadata, last_question),
+        "testing_dropdown_options": lambda: ["Select a test case"] + metadata["Question"].tolist(),
+        "visualization_count_results": lambda: count_results(df_steps, "stepsResult", ["True", "False", "Skipped"]),
+        "visualization_build_overview_table": lambda: build_overview_table(df_question, df_steps),
+        "admin_count_result_categories": lambda: count_result_categories(results),
+    }
+
+
+EXTRACTOR_CASES = {
+    # benchmark name: (function name in extractors, attachment extension, extra args)
+    "extract_text_from_excel": ("extract_text_from_excel", ".xlsx", ()),
+    "extract_text_from_pdf": ("extract_text_from_pdf", ".pdf", ()),
+    "extract_text_from_image": ("extract_text_from_image", ".png", ()),
+    "transcribe_audio": ("transcribe_audio", ".wav", ("wav",)),
+    "extract_text_from_csv": ("extract_text_from_csv", ".csv", ()),
+    "extract_text_from_zip": ("extract_text_from_zip", ".zip", ()),
+    "extract_text_from_pdb": ("extract_text_from_pdb", ".pdb", ()),
+    "extract_text_from_jsonld": ("extract_text_from_jsonld", ".jsonld", ()),
+    "extract_text_from_xml": ("extract_text_from_xml", ".xml", ()),
+    "extract_text_from_pptx": ("extract_text_from_pptx", ".pptx", ()),
+    "extract_text_from_file_txt": ("extract_text_from_file", ".txt", ()),
+}
+
+
+def extractor_benchmarks():
+    try:
+        import extractors
+    except ImportError as e:
+        logging.warning(f"Skipping extractor benchmarks, extractors could not be imported: {e}")
+        return {}
+
+    attachments = fixtures.make_attachments()
+    benchmarks = {}
+    for name, (function_name, extension, extra_args) in EXTRACTOR_CASES.items():
+        content = attachments[extension]
+        if content is None:
+            logging.warning(f"Skipping {name}: no fixture builder available for {extension}")
+            continue
+        function = getattr(extractors, function_name)
+        if function_name == "extract_text_from_file":
+            args = (f"attachment{extension}", content)
+        else:
+            args = (content,) + extra_args
+        benchmarks[name] = (lambda function=function, args=args: function(*args))
+    return benchmarks
+
+
+def collect_benchmarks():
+    metadata = fixtures.make_metadata()
+    results = fixtures.make_results(metadata)
+    install_stubs(tables={
+        "metadataTable": metadata,
+        "evaluationEvents": results,  # as the latest-state query returns it
+        "UserInfo": fixtures.make_users(),
+    }, objects={"attachment.txt": metadata["extractedData"].dropna().iloc[0].encode("utf-8")})
+
+    benchmarks = {}
+    benchmarks.update(openai_utils_benchmarks(metadata))
+    benchmarks.update(validation_benchmarks(metadata))
+    benchmarks.update(scoring_benchmarks(metadata))
+    benchmarks.update(page_benchmarks(metadata, results))
+    benchmarks.update(extractor_benchmarks())
+    return benchmarks
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against the baseline."""
+    regressions = []
+    for name, expected in baseline["benchmarks"].items():
+        current = results["benchmarks"].get(name)
+        if current is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        ratio = current["min_us"] / expected["min_us"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{name}: {current['min_us']:.1f}us vs baseline {expected['min_us']:.1f}us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before failing, as a fraction (default 0.5 = 50%%)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform()},
+        "benchmarks": {},
+    }
+    for name, fn in sorted(collect_benchmarks().items()):
+        if args.filter not in name:
+            continue
+        results["benchmarks"][name] = stats = measure(fn, repeat=args.repeat)
+        logging.info(f"{name:45s} {stats['min_us']:12.1f} us/call (median {stats['median_us']:.1f})")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    logging.info(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        baseline = results
+        if args.filter and os.path.exists(args.baseline):
+            # Only replace the entries that were run, keep the rest of the baseline
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            baseline["benchmarks"].update(results["benchmarks"])
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        logging.info(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        logging.error(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        return 1
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.filter:
+        baseline["benchmarks"] = {k: v for k, v in baseline["benchmarks"].items() if args.filter in k}
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        logging.error("PERFORMANCE REGRESSIONS against %s:", args.baseline)
+        for regression in regressions:
+            logging.error(f"  {regression}")
+        return 1
+    logging.info(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Offline stand-ins for the OpenAI, BigQuery, GCS, Vision and speech APIs.
+
+`install_stubs()` patches the real client classes so that the app modules in
+streamlit_app/ and the ingest scripts in dataflow/ can be imported and run
+without network access or credentials. `BatchAPIStub` serves the OpenAI file
+and batch endpoints over local HTTP for streamlit_app/batch_pipeline.py.
+`LATENCY` holds the seconds every stubbed BigQuery, OpenAI and GCS call
+sleeps (0 by default), to make the fakes block like the real services.
+"""
+import email.parser
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREAMLIT_APP_DIR = os.path.join(REPO_ROOT, "streamlit_app")
+DATAFLOW_DIR = os.path.join(REPO_ROOT, "dataflow")
+
+# Make the flat app and ingest modules importable (they use top-level imports)
+for path in (STREAMLIT_APP_DIR, DATAFLOW_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Seconds each stubbed call blocks for: a BigQuery query or insert, an OpenAI completion
+# (until the first streamed token), each further streamed token, and a GCS download
+LATENCY = {"bigquery": 0.0, "openai": 0.0, "openai_token": 0.0, "gcs": 0.0}
+
+
+def _wait(service):
+    if LATENCY[service]:
+        time.sleep(LATENCY[service])
+
+
+class FakeRow(dict):
+    """BigQuery Row stand-in supporting both row['col'] and row.col access."""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeRowIterator:
+    """Rows of a result; to_arrow/to_dataframe read it as an Arrow IPC stream, like the Storage Read API."""
+    def __init__(self, df):
+        self._df = df
+
+    def __iter__(self):
+        for record in self._df.to_dict(orient="records"):
+            # BigQuery rows hold None for NULLs, where pandas columns hold NaN
+            yield FakeRow({key: None if pd.api.types.is_scalar(value) and pd.isna(value) else value
+                           for key, value in record.items()})
+
+    def to_arrow(self, **kwargs):
+        import pyarrow as pa
+
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(self._df, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return pa.ipc.open_stream(sink.getvalue()).read_all()
+
+    def to_dataframe(self, string_dtype=None, **kwargs):
+        import pyarrow as pa
+
+        types_mapper = {pa.string(): string_dtype, pa.large_string(): string_dtype}.get if string_dtype else None
+        return self.to_arrow().to_pandas(types_mapper=types_mapper)
+
+
+class FakeQueryJob:
+    def __init__(self, df, total_bytes_processed=None):
+        self._df = df
+        self.total_bytes_processed = total_bytes_processed
+
+    def result(self):
+        return FakeRowIterator(self._df)
+
+
+class FakeBigQueryClient:
+    """
+    Serves SELECTs from in-memory DataFrames keyed by table name.
+
+    The table is picked by the first known `.table` name appearing in the
+    query, simple column lists are projected, "SELECT COUNT(*) AS name" counts
+    the table's rows and a literal or parameter LIMIT is applied (WHERE is not);
+    DML statements and unknown tables return an empty result; they are
+    recorded in `statements` as (query, job_config) pairs. Dry runs return
+    the bytes BigQuery would bill for the columns of the known tables the
+    query names (every column for `*`).
+    """
+    tables = {}
+    statements = []
+
+    def __init__(self, project=None, **kwargs):
+        self.project = project
+
+    def query(self, query, job_config=None):
+        _wait("bigquery")
+        if getattr(job_config, "dry_run", False):
+            return FakeQueryJob(pd.DataFrame(), total_bytes_processed=self.scanned_bytes(query))
+        statement = query.strip().split(None, 1)[0].upper()
+        if statement != "SELECT":
+            self.statements.append((query, job_config))
+            return FakeQueryJob(pd.DataFrame())
+        for name, df in self.tables.items():
+            if f".{name}`" in query or f".{name}\n" in query:
+                count = re.match(r"\s*SELECT\s+COUNT\(\*\)\s+AS\s+(\w+)\s+FROM\b", query, re.IGNORECASE)
+                if count:
+                    return FakeQueryJob(pd.DataFrame({count.group(1): [len(df)]}))
+                # Project plain "SELECT a, b FROM" column lists; anything fancier returns every column
+                columns = re.match(r"\s*SELECT\s+(\w+(?:\s*,\s*\w+)*)\s+FROM\b", query, re.IGNORECASE)
+                if columns:
+                    names = [column.strip() for column in columns.group(1).split(",")]
+                    if all(column in df.columns for column in names):
+                        df = df[names]
+                limit = re.search(r"\bLIMIT\s+(\d+|@\w+)\s*$", query, re.IGNORECASE)
+                if limit:
+                    value = limit.group(1)
+                    if value.startswith("@"):
+                        parameters = {p.name: p.value for p in getattr(job_config, "query_parameters", [])}
+                        value = parameters[value[1:]]
+                    df = df.head(int(value))
+                return FakeQueryJob(df)
+        return FakeQueryJob(pd.DataFrame())
+
+    def scanned_bytes(self, query):
+        """Logical bytes of the referenced columns: 2 + UTF-8 length per string, 8 per number."""
+        words = set(re.findall(r"\w+", query))
+        select_all = re.search(r"SELECT\s+(\w+\.)?\*", query, re.IGNORECASE) is not None
+        total = 0
+        for name, df in self.tables.items():
+            if f".{name}`" not in query and f".{name}\n" not in query:
+                continue
+            for column in df.columns:
+                if not select_all and not set(re.findall(r"\w+", column)) <= words:
+                    continue
+                values = df[column].dropna()
+                if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                    total += 8 * len(values)
+                else:
+                    total += sum(len(str(value).encode("utf-8")) + 2 for value in values)
+        return total
+
+    def insert_rows_json(self, table, rows, **kwargs):
+        _wait("bigquery")
+        name = str(table).rsplit(".", 1)[-1]
+        existing = self.tables.get(name, pd.DataFrame())
+        self.tables[name] = pd.concat([existing, pd.DataFrame(rows)], ignore_index=True)
+        return []
+
+
+class FakeBlob:
+    def __init__(self, objects, name, bucket=None):
+        self._objects = objects
+        self.name = name
+        self.bucket = bucket
+
+    def exists(self):
+        return self.name in self._objects
+
+    @property
+    def generation(self):
+        # Changes whenever the object's content is replaced, like a GCS generation number
+        content = self._objects.get(self.name)
+        return None if content is None else zlib.crc32(content) + len(content)
+
+    def download_as_bytes(self, if_generation_not_match=None, **kwargs):
+        if if_generation_not_match is not None and str(if_generation_not_match) == str(self.generation):
+            from google.api_core.exceptions import NotModified
+            raise NotModified("Object generation matches if_generation_not_match")
+        _wait("gcs")
+        return self._objects[self.name]
+
+    def download_as_text(self, **kwargs):
+        _wait("gcs")
+        return self._objects[self.name].decode("utf-8", errors="ignore")
+
+
+class FakeBucket:
+    def __init__(self, objects, name):
+        self._objects = objects
+        self.name = name
+
+    def blob(self, name):
+        return FakeBlob(self._objects, name, self)
+
+
+class FakeStorageClient:
+    """Serves blobs from an in-memory {object_name: bytes} map shared by all buckets."""
+    objects = {}
+
+    def __init__(self, project=None, **kwargs):
+        self.project = project
+
+    def bucket(self, name):
+        return FakeBucket(self.objects, name)
+
+
+class FakeVisionClient:
+    def text_detection(self, image=None):
+        class _Annotation:
+            description = "STUB OCR TEXT"
+
+        class _Response:
+            text_annotations = [_Annotation()]
+
+        return _Response()
+
+
+def fake_chat_completion(model=None, messages=None, stream=False, **kwargs):
+    """Echo a short deterministic answer in the ChatCompletion response shape."""
+    prompt = messages[-1]["content"] if messages else ""
+    answer = f"Stub answer ({len(prompt)} prompt chars)."
+    _wait("openai")
+    if stream:
+        return _stream_chunks(answer)
+    return {
+        "choices": [{"message": {"role": "assistant", "content": answer}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4},
+    }
+
+
+def _stream_chunks(answer):
+    for i, word in enumerate(answer.split()):
+        if i:
+            _wait("openai_token")
+        yield {"choices": [{"delta": {"content": word + " "}}]}
+
+
+class BatchAPIStub:
+    """
+    Local HTTP server mimicking the OpenAI /files and /batches endpoints.
+
+    Batches move validating -> in_progress -> completed on successive
+    retrievals (`polls_to_complete`), answering each request line with
+    fake_chat_completion(); custom_ids listed in `fail_ids` get an error line.
+
+        with BatchAPIStub() as stub:   # points openai.api_base at the stub
+            batch_pipeline.run_pipeline(poll_interval=0)
+    """
+
+    def __init__(self, polls_to_complete=2, fail_ids=()):
+        self.polls_to_complete = polls_to_complete
+        self.fail_ids = set(fail_ids)
+        self.files = {}
+        self.batches = {}
+        self._ids = itertools.count(1)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def __enter__(self):
+        import openai
+        self._previous_base = openai.api_base
+        openai.api_base = self.url
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        import openai
+        openai.api_base = self._previous_base
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _new_file(self, content, purpose):
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content),
+                               "purpose": purpose, "content": content}
+        return file_id
+
+    def _complete(self, batch):
+        output, errors = [], []
+        for line in self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            if custom_id in self.fail_ids:
+                errors.append({"id": f"batch_req_{custom_id}", "custom_id": custom_id, "response": None,
+                               "error": {"code": "stub_error", "message": "Failed by BatchAPIStub"}})
+                continue
+            body = fake_chat_completion(**request["body"])
+            output.append({"id": f"batch_req_{custom_id}", "custom_id": custom_id, "error": None,
+                           "response": {"status_code": 200, "request_id": custom_id, "body": body}})
+        to_jsonl = lambda rows: "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+        batch["output_file_id"] = self._new_file(to_jsonl(output), "batch_output") if output else None
+        batch["error_file_id"] = self._new_file(to_jsonl(errors), "batch_output") if errors else None
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output),
+                                   "failed": len(errors)}
+        batch["status"] = "completed"
+
+    def _retrieve(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["_polls"] += 1
+        if batch["status"] != "completed":
+            if batch["_polls"] >= self.polls_to_complete:
+                self._complete(batch)
+            else:
+                batch["status"] = "in_progress"
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/v1/files":
+                    message = email.parser.BytesParser().parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+                    fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                              for part in message.get_payload()}
+                    file_id = stub._new_file(fields["file"], fields["purpose"].decode())
+                    return self._send(200, {k: v for k, v in stub.files[file_id].items() if k != "content"})
+                if self.path == "/v1/batches":
+                    params = json.loads(body)
+                    batch_id = f"batch_{next(stub._ids)}"
+                    stub.batches[batch_id] = {"id": batch_id, "object": "batch", "status": "validating",
+                                              "_polls": 0, **params}
+                    return self._send(200, stub._retrieve(batch_id))
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_GET(self):
+                match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+                if match and match.group(1) in stub.batches:
+                    return self._send(200, stub._retrieve(match.group(1)))
+                match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+                if match and match.group(1) in stub.files:
+                    return self._send(200, stub.files[match.group(1)]["content"], "application/octet-stream")
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        return Handler
+
+
+def install_stubs(tables=None, objects=None, latency=None):
+    """Patch the cloud and OpenAI clients with the fakes above; latency updates LATENCY."""
+    os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+    os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "stub-credentials.json")
+    os.environ.setdefault("PROJECT_ID", "stub-project")
+    os.environ.setdefault("DATASET_ID", "stub_dataset")
+    os.environ.setdefault("TABLE_ID", "metadataTable")
+
+    import openai
+    from google.cloud import bigquery, storage
+
+    LATENCY.update(latency or {})
+    FakeBigQueryClient.tables = dict(tables or {})
+    FakeBigQueryClient.statements = []
+    FakeStorageClient.objects = dict(objects or {})
+    openai.ChatCompletion.create = staticmethod(fake_chat_completion)
+    bigquery.Client = FakeBigQueryClient
+    storage.Client = FakeStorageClient
+
+    try:
+        from google.cloud import vision
+        vision.ImageAnnotatorClient = FakeVisionClient
+    except ImportError:
+        pass
+
+    try:
+        import speech_recognition
+        speech_recognition.Recognizer.recognize_google = lambda self, audio_data, **kwargs: "stub transcript"
+    except ImportError:
+        pass
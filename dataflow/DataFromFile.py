@@ -0,0 +1,256 @@
+import argparse
+import logging
+from google.cloud import storage, bigquery
+import os
+import json
+import tiktoken
+import sys
+
+# Shared helpers (tracing) live with the Streamlit app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+from tracing import start_span, bind_attributes, latency_report, format_report
+from retrieval import build_index, index_to_json
+from checkpoint import FAILED, ProgressJournal, journal_path
+from query_cost import guarded_query
+from isolation import OK, IsolatedWorker, format_profile
+from cassette import install_from_env
+# The extractors (shared with the Streamlit app) and the extraction worker
+import extractors
+from extractors import EXTRACT_MEMORY_MB, EXTRACT_TIMEOUT_SECONDS, extract_text_isolated, extraction_profile
+
+# Record or replay the GCS, BigQuery, Vision and speech calls when CASSETTE_MODE is set
+install_from_env()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+# Set up your Google Cloud project and bucket details
+project = 'damg7245-assignment1-436117'
+bucket_name = 'gaia-benchmark-dataset'
+table_id = 'damg7245-assignment1-436117.validationDataset001.metadataTable'
+
+# Lazily created Google Cloud Storage and BigQuery clients, so importing this module connects nowhere
+storage_client = None
+bigquery_client = None
+
+def get_storage_client():
+    global storage_client
+    if storage_client is None:
+        storage_client = storage.Client(project=project)
+    return storage_client
+
+def get_bigquery_client():
+    global bigquery_client
+    if bigquery_client is None:
+        bigquery_client = bigquery.Client(project=project)
+    return bigquery_client
+
+def read_gcs_file(bucket_name, file_path):
+    """
+    Read a file from Google Cloud Storage.
+    
+    Args:
+    bucket_name (str): Name of the GCS bucket
+    file_path (str): Path to the file within the bucket
+    
+    Returns:
+    bytes: Content of the file, or None if it does not exist
+
+    Raises:
+    RuntimeError: If the file cannot be read (so the task is retried)
+    """
+    try:
+        with start_span("gcs.read_file", gcs_file_path=file_path) as span:
+            bucket = get_storage_client().bucket(bucket_name)
+            blob = bucket.blob(file_path)
+            if not blob.exists():
+                logging.warning(f"File does not exist: {file_path}")
+                return None
+            content = blob.download_as_bytes()
+            span.set_attribute("bytes", len(content))
+        return content
+    except Exception as e:
+        logging.error(f"Error reading file from GCS: {file_path}. Error: {str(e)}")
+        raise RuntimeError(f"Error reading file from GCS: {file_path}: {e}")
+
+def count_tokens(text):
+    """Token count of the extracted text (cl100k_base, as used by the answer path)."""
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+def build_retrieval_index(text):
+    """Chunked BM25 index of the extracted text as JSON, used to put only the relevant chunks in prompts."""
+    with start_span("retrieval.build_index", chars=len(text)):
+        return index_to_json(build_index(text))
+
+def update_bigquery(task_id, extracted_text):
+    """
+    Update the BigQuery table with extracted text, its token count and its BM25
+    retrieval index (see streamlit_app/retrieval.py) for a given task_id.
+    
+    Args:
+    task_id (str): The task ID to update
+    extracted_text (str): The extracted text to be inserted
+
+    Raises:
+    RuntimeError: If the update fails (so the task is retried)
+    """
+    try:
+        if not extracted_text:
+            logging.warning(f"No text to update for task_id {task_id}")
+            return
+
+        update_query = f"""
+            UPDATE `{table_id}`
+            SET extractedData = @extracted_text,
+                extractedTokenCount = @token_count,
+                extractedIndex = @extracted_index
+            WHERE task_id = @task_id
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("extracted_text", "STRING", extracted_text),
+                bigquery.ScalarQueryParameter("token_count", "INT64", count_tokens(extracted_text)),
+                bigquery.ScalarQueryParameter("extracted_index", "STRING", build_retrieval_index(extracted_text)),
+                bigquery.ScalarQueryParameter("task_id", "STRING", task_id),
+            ]
+        )
+        with start_span("bigquery.update_extracted_data", task_id=task_id, chars=len(extracted_text)):
+            query_job = guarded_query(get_bigquery_client(), "dataflow.update_extracted_data", update_query, job_config)
+            query_job.result()  # Wait for the query to finish
+        logging.info(f"Updated task_id {task_id} with extracted data.")
+    except Exception as e:
+        logging.error(f"Failed to update BigQuery for task_id {task_id}: {str(e)}")
+        raise RuntimeError(f"Failed to update BigQuery for task_id {task_id}: {e}")
+
+def process_task(task_id, file_path):
+    """
+    Extract the attachment of one task and store its text in BigQuery.
+
+    Returns:
+    tuple: (outcome, stored text) with outcome "updated", "invalid_path", "missing_file", "no_text",
+    or "extract_timeout", "extract_memory" or "extract_crashed" when the extractor went over its caps
+    """
+    # Validate file path
+    if file_path is None:
+        logging.warning(f"Invalid file path for task_id {task_id}: None")
+        return "invalid_path", None
+
+    if not file_path.startswith('gs://'):
+        logging.warning(f"Invalid GCS file path format for task_id {task_id}: {file_path}")
+        return "invalid_path", None
+
+    # Extract GCS path and read file content
+    gcs_path = file_path.replace('gs://gaia-benchmark-dataset/', '')
+    file_content = read_gcs_file(bucket_name, gcs_path)
+    if file_content is None:
+        logging.warning(f"File not found in GCS for task_id {task_id}: {gcs_path}")
+        return "missing_file", None
+
+    # Extract text from file, in the worker process under the time and memory caps
+    outcome, extracted_text = extract_text_isolated(file_path, file_content)
+    if outcome not in (OK, "unsupported"):
+        return f"extract_{outcome}", None
+
+    if not extracted_text:
+        logging.warning(f"No text extracted for task_id {task_id}")
+        return "no_text", None
+
+    # Truncate extracted_text if it's too long
+    max_length = 1048576  # BigQuery's maximum string length
+    if len(extracted_text) > max_length:
+        extracted_text = extracted_text[:max_length]
+        logging.warning(f"Truncated extracted text for task_id {task_id}")
+
+    # Update BigQuery with extracted text
+    update_bigquery(task_id, extracted_text)
+    return "updated", extracted_text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract the text of every task's attachment into the metadata table. Finished task_ids "
+                    "are journaled (see streamlit_app/checkpoint.py), so a rerun after a crash resumes where it stopped.")
+    parser.add_argument("--journal", default=journal_path(f"extract-{table_id}"),
+                        help="Progress journal of finished task_ids (default: in CHECKPOINT_DIR).")
+    parser.add_argument("--restart", action="store_true", help="Forget the journal and extract every task again.")
+    parser.add_argument("--max-attempts", type=int, help="Attempts per task before it is recorded as failed.")
+    parser.add_argument("--backoff", type=float, help="Seconds before the first retry of a task, doubled per retry.")
+    parser.add_argument("--timeout", type=float, default=EXTRACT_TIMEOUT_SECONDS,
+                        help="Seconds an extraction may run before its worker process is killed.")
+    parser.add_argument("--memory-mb", type=int, default=EXTRACT_MEMORY_MB,
+                        help="Memory (MB) an extraction may allocate in its worker process (0: no cap).")
+    parser.add_argument("--profile", help="Also write the per-format extraction profile to this JSON file.")
+    args = parser.parse_args(argv)
+
+    extractors.extraction_worker = IsolatedWorker("extract", args.timeout, args.memory_mb)
+
+    journal = ProgressJournal(args.journal, args.max_attempts, args.backoff)
+    if args.restart:
+        journal.reset()
+    elif len(journal):
+        logging.info(f"Resuming from {args.journal}: {len(journal.items()) - len(journal.items(FAILED))} tasks "
+                     f"finished, {len(journal.items(FAILED))} to retry")
+
+    # Query to get task_ids from BigQuery table
+    query = f"""
+        SELECT task_id, gcs_file_path
+        FROM `{table_id}`
+        WHERE task_id IS NOT NULL
+    """
+    query_job = guarded_query(get_bigquery_client(), "dataflow.list_tasks", query)
+    rows = query_job.result()
+
+    # Main processing loop
+    skipped_files = 0
+    total_files = 0
+    for row in rows:
+        total_files += 1
+        task_id = row.task_id
+        if journal.done(task_id):
+            skipped_files += 1
+            continue
+        bind_attributes(task_id=task_id)  # tag the read/extract/update spans of this task
+        journal.run(task_id, lambda: process_task(task_id, row.gcs_file_path))
+    journal.close()
+    extractors.extraction_worker.stop()
+
+    # Log summary information (over the whole journal, so a resumed run reports the same totals)
+    logging.info(f"Total files processed: {len(journal.items('updated'))}")
+    logging.info(f"Total files: {total_files} ({skipped_files} finished in an earlier run)")
+    logging.info(f"Extraction profile of this run ({extractors.extraction_worker.starts} worker processes started):\n"
+                 f"{format_profile(extraction_profile.summary())}")
+    if args.profile:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(extraction_profile.summary(), f, indent=2)
+
+    invalid_paths = journal.items("invalid_path")
+    if invalid_paths:
+        logging.warning("The following task_ids have invalid file paths:")
+        for task_id in invalid_paths:
+            logging.warning(task_id)
+
+    missing_files = journal.items("missing_file")
+    if missing_files:
+        logging.warning("The following task_ids do not have corresponding files in the bucket:")
+        for task_id in missing_files:
+            logging.warning(task_id)
+
+    for outcome, reason in (("extract_timeout", f"took longer than {args.timeout:.0f}s to extract"),
+                            ("extract_memory", f"needed more than {args.memory_mb}MB to extract"),
+                            ("extract_crashed", "crashed the extraction worker")):
+        task_ids = journal.items(outcome)
+        if task_ids:
+            logging.warning(f"The following task_ids {reason} and are not retried (see --timeout and --memory-mb):")
+            for task_id in task_ids:
+                logging.warning(task_id)
+
+    failed = journal.items(FAILED)
+    if failed:
+        logging.warning(f"The following task_ids failed and will be retried by the next run ({args.journal}):")
+        for task_id in failed:
+            logging.warning(task_id)
+
+    logging.info("Per-span latency:\n" + format_report(latency_report()))
+
+# Main execution
+if __name__ == "__main__":
+    main()
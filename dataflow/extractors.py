@@ -0,0 +1,253 @@
+"""
+Attachment text extractors, shared by the ingest (dataflow/DataFromFile.py) and the
+Streamlit app, which extracts attachments that have no stored extraction.
+
+Importing this module creates no client and forks nothing: the Vision client is
+created per image, and the extraction worker process on the first isolated extraction.
+"""
+import io
+import logging
+import openpyxl
+import fitz  # PyMuPDF
+from PIL import Image
+import pytesseract
+import csv
+from pydub import AudioSegment
+import speech_recognition as sr
+from google.cloud import vision
+import os
+import tempfile
+import librosa
+import soundfile as sf
+import zipfile
+import json
+from pptx import Presentation
+import xml.etree.ElementTree as ET
+import sys
+import time
+
+# Shared helpers (tracing, isolation) live with the Streamlit app
+STREAMLIT_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app')
+if STREAMLIT_APP_DIR not in sys.path:
+    sys.path.insert(0, STREAMLIT_APP_DIR)
+from tracing import start_span
+from isolation import OK, ERROR, IsolatedError, IsolatedWorker, WorkProfile, outcome_of
+
+def extract_text_from_file(file_path, file_content):
+    """
+    Extract text from various file types, in this process (errors are logged and give "").
+    The ingest and the app use extract_text_isolated instead.
+    
+    Args:
+    file_path (str): Path to the file
+    file_content (bytes): Content of the file
+    
+    Returns:
+    str: Extracted text from the file
+    """
+    if file_content is None:
+        logging.warning(f"No content for file: {file_path}")
+        return ""
+    
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    with start_span("extract.file", format=file_extension, bytes=len(file_content)) as span:
+        text = _extract_text_by_extension(file_path, file_extension, file_content)
+        span.set_attribute("chars", len(text))
+    return text
+
+def _extract_text_by_extension(file_path, file_extension, file_content):
+    """Dispatch to the extractor registered for the file extension."""
+    extractor = EXTRACTORS.get(file_extension)
+    if extractor is None:
+        logging.warning(f"Unsupported file type: {file_extension}")
+        return ""
+    try:
+        return extractor(file_content, file_extension)
+    except MemoryError:
+        raise  # so a zip member over the worker's memory cap stops the whole file
+    except Exception as e:
+        logging.error(f"Error extracting text from {file_path}: {str(e)}")
+        return ""
+
+def extract_text_from_excel(file_content):
+    """Extract text from Excel files."""
+    workbook = openpyxl.load_workbook(io.BytesIO(file_content), data_only=True)
+    text = []
+    for sheet in workbook.sheetnames:
+        worksheet = workbook[sheet]
+        for row in worksheet.iter_rows(values_only=True):
+            text.append(" ".join(str(cell) for cell in row if cell is not None))
+    return "\n".join(text)
+
+def extract_text_from_pdf(file_content):
+    """Extract text from PDF files."""
+    pdf_document = fitz.open(stream=file_content, filetype="pdf")
+    text = []
+    for page in pdf_document:
+        text.append(page.get_text())
+    return "\n".join(text)
+
+def extract_text_from_image(file_content):
+    """Extract text from image files using Google Cloud Vision API."""
+    client = vision.ImageAnnotatorClient()
+    image = vision.Image(content=file_content)
+    response = client.text_detection(image=image)
+    texts = response.text_annotations
+    
+    if texts:
+        return texts[0].description
+    else:
+        return ""
+
+def transcribe_audio(file_content, file_extension):
+    """Transcribe audio files to text."""
+    # Load the audio file using librosa
+    audio_data, sample_rate = librosa.load(io.BytesIO(file_content), sr=None)
+    
+    # Save as a temporary WAV file
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
+        sf.write(temp_wav.name, audio_data, sample_rate)
+        wav_path = temp_wav.name
+
+    try:
+        recognizer = sr.Recognizer()
+        with sr.AudioFile(wav_path) as source:
+            audio_data = recognizer.record(source)
+            return recognizer.recognize_google(audio_data)
+    finally:
+        # Ensure the temporary file is removed
+        try:
+            os.remove(wav_path)
+        except FileNotFoundError:
+            logging.warning(f"Temporary file {wav_path} not found for deletion")
+
+def extract_text_from_csv(file_content):
+    """Extract text from CSV files."""
+    csv_content = file_content.decode('utf-8', errors='ignore').splitlines()
+    csv_reader = csv.reader(csv_content)
+    text = []
+    for row in csv_reader:
+        text.append(" ".join(row))
+    return "\n".join(text)
+
+def extract_text_from_zip(file_content):
+    """Extract text from ZIP files by processing each contained file."""
+    with zipfile.ZipFile(io.BytesIO(file_content)) as zip_file:
+        text = []
+        for file_name in zip_file.namelist():
+            with zip_file.open(file_name) as file:
+                content = file.read()
+                text.append(extract_text_from_file(file_name, content))
+    return "\n".join(text)
+
+def extract_text_from_pdb(file_content):
+    """Extract text from PDB files (assuming they are text-based)."""
+    return file_content.decode('utf-8', errors='ignore')
+
+def extract_text_from_jsonld(file_content):
+    """Extract text from JSONLD files."""
+    json_data = json.loads(file_content)
+    def extract_text(obj):
+        if isinstance(obj, str):
+            return obj
+        elif isinstance(obj, dict):
+            return ' '.join(extract_text(v) for v in obj.values())
+        elif isinstance(obj, list):
+            return ' '.join(extract_text(item) for item in obj)
+        else:
+            return ''
+    return extract_text(json_data)
+
+def extract_text_from_xml(file_content):
+    """Extract text from XML files."""
+    root = ET.fromstring(file_content)
+    text = []
+    for elem in root.iter():
+        if elem.text:
+            text.append(elem.text.strip())
+    return "\n".join(text)
+
+def extract_text_from_pptx(file_content):
+    """Extract text from PowerPoint (PPTX) files."""
+    prs = Presentation(io.BytesIO(file_content))
+    text = []
+    for slide in prs.slides:
+        for shape in slide.shapes:
+            if hasattr(shape, 'text'):
+                text.append(shape.text)
+    return "\n".join(text)
+
+# Extractor registry: format -> (file extensions, function(file_content, file_extension) returning text).
+# Extractors raise on files they cannot read; the ingest runs them in a worker process (see extract_text_isolated).
+EXTRACTOR_FORMATS = {
+    'xlsx': (('.xlsx',), lambda content, ext: extract_text_from_excel(content)),
+    'pdf': (('.pdf',), lambda content, ext: extract_text_from_pdf(content)),
+    'image': (('.png', '.jpg', '.jpeg'), lambda content, ext: extract_text_from_image(content)),
+    'audio': (('.mp3', '.wav', '.ogg'), lambda content, ext: transcribe_audio(content, ext[1:])),
+    'txt': (('.txt',), lambda content, ext: content.decode('utf-8', errors='ignore')),
+    'csv': (('.csv',), lambda content, ext: extract_text_from_csv(content)),
+    'zip': (('.zip',), lambda content, ext: extract_text_from_zip(content)),
+    'pdb': (('.pdb',), lambda content, ext: extract_text_from_pdb(content)),
+    'jsonld': (('.jsonld',), lambda content, ext: extract_text_from_jsonld(content)),
+    'pptx': (('.pptx',), lambda content, ext: extract_text_from_pptx(content)),
+    'xml': (('.xml',), lambda content, ext: extract_text_from_xml(content)),
+}
+
+# File extension -> format, and file extension -> extractor.
+# Also used by the Streamlit app to extract attachments that have no stored extraction.
+FORMAT_BY_EXTENSION = {ext: name for name, (extensions, _) in EXTRACTOR_FORMATS.items() for ext in extensions}
+EXTRACTORS = {ext: extractor for extensions, extractor in EXTRACTOR_FORMATS.values() for ext in extensions}
+
+# Wall-clock and memory caps of the extraction worker process
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "120"))
+EXTRACT_MEMORY_MB = int(os.getenv("EXTRACT_MEMORY_MB", "2048"))
+
+# Per-format runs, MB/s, failures and timeouts of the isolated extractions of this process
+extraction_profile = WorkProfile()
+extraction_worker = None
+
+# Lazily start the extraction worker process, so importing this module forks nothing
+def get_extraction_worker():
+    global extraction_worker
+    if extraction_worker is None:
+        extraction_worker = IsolatedWorker("extract", EXTRACT_TIMEOUT_SECONDS, EXTRACT_MEMORY_MB)
+    return extraction_worker
+
+def run_extractor(file_extension, file_content):
+    """Run the extractor registered for the extension (in the worker process); its exceptions propagate."""
+    return EXTRACTORS[file_extension](file_content, file_extension)
+
+def extract_text_isolated(file_path, file_content):
+    """
+    Extract text in the extraction worker process, under EXTRACT_TIMEOUT_SECONDS and EXTRACT_MEMORY_MB,
+    and record the run in extraction_profile.
+
+    Returns:
+    tuple: (outcome, text) with outcome "ok", "unsupported", "timeout", "memory" or "crashed"
+
+    Raises:
+    RuntimeError: If the extractor raised (so the task is retried)
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    file_format = FORMAT_BY_EXTENSION.get(file_extension)
+    if file_format is None:
+        logging.warning(f"Unsupported file type: {file_extension}")
+        return "unsupported", ""
+
+    with start_span("extract.file", format=file_extension, bytes=len(file_content), isolated=True) as span:
+        start = time.perf_counter()
+        try:
+            text = get_extraction_worker().run(run_extractor, file_extension, file_content)
+            outcome = OK
+        except IsolatedError as e:
+            outcome = outcome_of(e)
+            extraction_profile.record(file_format, len(file_content), time.perf_counter() - start, outcome)
+            span.set_attribute("outcome", outcome)
+            if outcome == ERROR:
+                raise RuntimeError(f"Error extracting text from {file_path}: {e}")
+            logging.error(f"Gave up extracting text from {file_path}: {e}")
+            return outcome, ""
+        extraction_profile.record(file_format, len(file_content), time.perf_counter() - start, outcome)
+        span.set_attributes(outcome=outcome, chars=len(text))
+    return outcome, text
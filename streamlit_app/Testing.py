@@ -3,65 +3,49 @@ import pandas as pd
 from google.cloud import bigquery
 from dotenv import load_dotenv
 import os
-from openai_utils import get_openai_answer, update_testcase_answer_in_bigquery  # Import utilities
+from openai_utils import DEFAULT_MODEL, stream_openai_answer, build_task_context, update_testcase_answer_in_bigquery  # Import utilities
+from evaluation_events import make_event, record_events
+from tracing import start_span, bind_attributes
+from bigquery_reads import query_dataframe
+from scoring import score_answer
 
 # Load environment variables
 load_dotenv()
 
-# Ensure OpenAI API Key is set
-openai_key = os.getenv('OPENAI_API_KEY')
-if not openai_key:
-    st.error("OpenAI API key not found. Make sure it's set in the .env file.")
-
 # BigQuery project details
 project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
 table_id = os.getenv("TABLE_ID")  # Table for test cases and extracted data
-enriched_table = "enrichedMetadata"  # Table for storing results
 
 # Function to load test case data along with extracted data from BigQuery
-@st.cache_data
+# (held once per process and shared by all sessions instead of copied on every rerun)
+@st.cache_resource
 def load_test_case_data():
     """Load test case data along with extracted data from BigQuery."""
     client = bigquery.Client(project=project_id)
     query = f"""
-    SELECT Question, task_id, `Final answer`, extractedData FROM `{project_id}.{dataset_id}.{table_id}`
+    SELECT Question, task_id, `Final answer`, extractedData, extractedIndex FROM `{project_id}.{dataset_id}.{table_id}`
     """
     try:
-        query_job = client.query(query)
-        df = query_job.result().to_dataframe()  # Convert query result to pandas DataFrame
+        with start_span("bigquery.load_test_case_data") as span:
+            df = query_dataframe(client, query, name="testing.load_test_case_data")  # Read the result into a DataFrame through Arrow
+            span.set_attribute("rows", len(df))
         return df
     except Exception as e:
         st.error(f"Error fetching data from BigQuery: {e}")
         return pd.DataFrame()
 
-# Function to update the generated answer, sessionId, questionResult, and stepsResult in enrichedMetadata table
-def update_metadata(task_id: str, generated_answer: str, session_id: str, question_result: str, steps_result: str):
-    """Update the GeneratedAnswer, sessionId, questionResult, and stepsResult columns in the enrichedMetadata table."""
-    client = bigquery.Client(project=project_id)
-    query = f"""
-    UPDATE `{project_id}.{dataset_id}.{enriched_table}`
-    SET GeneratedAnswer = @generated_answer, 
-        sessionId = @session_id, 
-        questionResult = @question_result,
-        stepsResult = @steps_result
-    WHERE task_id = @task_id
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("generated_answer", "STRING", generated_answer),
-            bigquery.ScalarQueryParameter("session_id", "STRING", session_id),
-            bigquery.ScalarQueryParameter("question_result", "STRING", question_result),
-            bigquery.ScalarQueryParameter("steps_result", "STRING", steps_result),
-            bigquery.ScalarQueryParameter("task_id", "STRING", task_id)
-        ]
-    )
+# Function to record the generated answer, questionResult and stepsResult of a session
+def record_question_result(task_id: str, generated_answer: str, session_id: str, question_result: str, steps_result: str,
+                           model: str = DEFAULT_MODEL):
+    """Append a question event and a steps event for the session to the evaluation event log."""
     try:
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for the query to complete
-
-    except Exception as e:
-        st.error(f"Failed to update enrichedMetadata table in BigQuery: {e}")
+        record_events([
+            make_event(task_id, session_id, "question", generated_answer, question_result, model),
+            make_event(task_id, session_id, "steps", None, steps_result, model),
+        ])
+    except RuntimeError as e:
+        st.error(f"Failed to record the result in BigQuery: {e}")
 
 # Add custom CSS for styling
 def add_custom_css():
@@ -121,6 +105,86 @@ def add_custom_css():
         unsafe_allow_html=True
     )
 
+# Dropdown options for the test cases, built once per process alongside the dataset
+@st.cache_resource
+def load_test_case_options():
+    return ["Select a test case"] + load_test_case_data()['Question'].tolist()
+
+# Function to look up the task_id, final answer, extracted data and its retrieval index of a selected test case
+def get_test_case_details(df, question):
+    """Return (task_id, final_answer, extracted_data, extracted_index) for the given question."""
+    row = df.loc[df['Question'] == question].iloc[0]
+    return row['task_id'], row['Final answer'], row['extractedData'], row['extractedIndex']
+
+# Answer panel: generates and shows the answer for the selected test case
+@st.fragment
+def answer_panel():
+    with start_span("fragment.testing_answer"):
+        selected_test_case = st.session_state.selected_test_case
+
+        # Display the generated answer if it exists
+        if st.session_state.answer:
+            st.text_area("Generated Answer:", value=st.session_state.answer, height=100)
+
+        # Generate answer using OpenAI API
+        if st.button('Answer') and selected_test_case != "Select a test case":
+            context = build_task_context(selected_test_case, st.session_state.extracted_data,
+                                         st.session_state.get('extracted_index'))
+
+            # Stream the generated answer into the page as tokens arrive
+            st.markdown("**Generated Answer:**")
+            stream_stats = {}
+            st.session_state.answer = st.write_stream(
+                stream_openai_answer(selected_test_case, context, stats=stream_stats, task_id=st.session_state.task_id)
+            )
+            st.caption(f"Time to first token: {stream_stats.get('time_to_first_token', 0):.2f}s, "
+                       f"total: {stream_stats.get('total_time', 0):.2f}s"
+                       + (f", near-duplicate of a cached prompt (similarity {stream_stats['similarity']:.2f})"
+                          if 'similarity' in stream_stats else ""))
+
+            # Record the generated answer with pending results for this session
+            record_question_result(
+                st.session_state.task_id,
+                st.session_state.answer,
+                st.session_state.session_id,
+                "Pending",  # Default questionResult
+                "Pending"  # Default stepsResult
+            )
+
+# Validation panel: checks the generated answer against the expected answer
+@st.fragment
+def validation_panel():
+    with start_span("fragment.testing_validation"):
+        selected_test_case = st.session_state.selected_test_case
+
+        # Validate the generated answer
+        if st.button("Validate"):
+            if selected_test_case == "Select a test case":
+                st.warning("Please select a test case before validating.")
+            elif not st.session_state.answer:
+                st.warning("Please click 'Answer' to generate an answer before validating.")
+            else:
+                # Set the initial validation results
+                question_result = "False"
+                steps_result = "Pending"
+
+                # Validate if the generated answer contains the final answer (normalized GAIA-style match)
+                if score_answer(st.session_state.answer, st.session_state.final_answer):
+                    st.success("The answer is correct!")
+                    question_result = "True"
+                    steps_result = "Skipped"  # If the answer is correct, set stepsResult to 'Skipped'
+                else:
+                    st.error("The answer is wrong!")
+
+                # Record the validation results for this session
+                record_question_result(
+                    st.session_state.task_id,
+                    st.session_state.answer,
+                    st.session_state.session_id,
+                    question_result,
+                    steps_result
+                )
+
 def testing_page():
     add_custom_css()
 
@@ -137,6 +201,8 @@ def testing_page():
                    - Check if the generated answer is correct.
                 4. **Proceed**:
                    - If validated, click 'NEXT' to move to the next test case.
+                5. **Compare Models**:
+                   - Run the test cases against several models side by side.
                 """, 
                 unsafe_allow_html=True
             )
@@ -150,13 +216,13 @@ def testing_page():
     if df.empty:
         return
 
-    required_columns = ['Question', 'task_id', 'Final answer', 'extractedData']
+    required_columns = ['Question', 'task_id', 'Final answer', 'extractedData', 'extractedIndex']
     if not all(col in df.columns for col in required_columns):
         st.error(f"Missing columns: {', '.join(required_columns)}")
         return
 
     # Dropdown for test cases
-    test_cases = ["Select a test case"] + df['Question'].tolist()
+    test_cases = load_test_case_options()
 
     if 'selected_test_case' not in st.session_state:
         st.session_state.selected_test_case = "Select a test case"
@@ -184,68 +250,20 @@ def testing_page():
 
     # Fetch the task_id, final answer, and extracted data for the selected test case
     if selected_test_case != "Select a test case":
-        st.session_state.task_id = df.loc[df['Question'] == selected_test_case, 'task_id'].values[0]
-        st.session_state.final_answer = df.loc[df['Question'] == selected_test_case, 'Final answer'].values[0]
-        st.session_state.extracted_data = df.loc[df['Question'] == selected_test_case, 'extractedData'].values[0]
-
-    # Display the generated answer if it exists
-    if 'answer' in st.session_state and st.session_state.answer:
-        st.text_area("Generated Answer:", value=st.session_state.answer, height=100)
-
-    # Generate answer using OpenAI API
-    if st.button('Answer') and selected_test_case != "Select a test case":
-        context = f"Question: {selected_test_case}\n"
-        if st.session_state.extracted_data:
-            context += f"Extracted Data: {st.session_state.extracted_data}\n"
-        
-        st.session_state.answer = get_openai_answer(selected_test_case, context)
-        
-        # Display the generated answer
-        st.text_area("Generated Answer:", value=st.session_state.answer, height=100)
-
-        # Store generated answer, sessionId, and validation result in the enrichedMetadata table
-        update_metadata(
-            st.session_state.task_id, 
-            st.session_state.answer, 
-            st.session_state.session_id,
-            "Pending",  # Default questionResult
-            "Pending"  # Default stepsResult
-        )
+        (st.session_state.task_id,
+         st.session_state.final_answer,
+         st.session_state.extracted_data,
+         st.session_state.extracted_index) = get_test_case_details(df, selected_test_case)
+        bind_attributes(task_id=st.session_state.task_id)
+
+    # The answer and validation panels rerun on their own when their buttons are pressed
+    answer_panel()
 
     # Display the expected answer
     st.markdown("**Expected Answer:**")
     st.markdown(f"<div class='highlight-box'>{st.session_state.final_answer}</div>", unsafe_allow_html=True)
 
-    # Validate the generated answer
-    if st.button("Validate"):
-        if selected_test_case == "Select a test case":
-            st.warning("Please select a test case before validating.")
-        elif not st.session_state.answer:
-            st.warning("Please click 'Answer' to generate an answer before validating.")
-        else:
-            generated_answer = st.session_state.answer.strip().lower()
-            final_answer = st.session_state.final_answer.strip().lower()
-
-            # Set the initial validation results
-            question_result = "False"
-            steps_result = "Pending"
-
-            # Validate if the generated answer contains the final answer
-            if final_answer in generated_answer:
-                st.success("The answer is correct!")
-                question_result = "True"
-                steps_result = "Skipped"  # If the answer is correct, set stepsResult to 'Skipped'
-            else:
-                st.error("The answer is wrong!")
-
-            # Update the validation results in the enrichedMetadata table
-            update_metadata(
-                st.session_state.task_id,
-                st.session_state.answer,
-                st.session_state.session_id,
-                question_result,
-                steps_result
-            )
+    validation_panel()
 
     # Next button
     if st.button("NEXT"):
@@ -253,4 +271,9 @@ def testing_page():
             st.warning("Please select a test case before proceeding.")
         else:
             st.session_state.page = 'validation'
-            st.experimental_set_query_params(page='validation')
+            st.query_params["page"] = 'validation'
+
+    # Compare several models on the same test cases
+    if st.button("Compare Models"):
+        st.session_state.page = 'comparison'
+        st.query_params["page"] = 'comparison'
@@ -0,0 +1,150 @@
+"""
+Steps-ablation mode of the validation page.
+
+Instead of sending one hand-picked, edited step at a time, builds every
+prompt variant of a test case's annotator steps -- no steps, each prefix of
+the steps with the final answer removed, and the full steps including the
+final answer -- for one or many test cases, runs them all concurrently and
+scores each. Comparing consecutive prefixes of the same test case gives
+every step's contribution: how often adding it turns a wrong answer right
+(or a right one wrong).
+"""
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+import pandas as pd
+from openai_utils import DEFAULT_MODEL, prepare_prompt
+from comparison import MAX_WORKERS, PRICING_PER_1K_TOKENS, run_completion
+from validation import remove_final_answer_from_steps, step_context
+from tracing import start_span
+from scoring import score_answers
+
+WITH_FINAL_ANSWER = "all steps, final answer kept"
+
+# Function to split a GAIA steps string ("1. ... 2. ...") into its numbered steps
+def split_steps(steps_text: str) -> list:
+    """Split at the step numbers 1., 2., ... in order; text without numbering is a single step."""
+    if not steps_text:
+        return []
+    starts, position, number = [], 0, 1
+    while True:
+        match = re.compile(rf"(?<!\d){number}\.\s").search(steps_text, position)
+        if match is None:
+            break
+        starts.append(match.start())
+        position, number = match.end(), number + 1
+    if not starts:
+        return [steps_text.strip()]
+    starts[0] = 0  # keep any preamble with the first step
+    return [steps_text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(steps_text)])]
+
+# Function to build every ablation variant of one test case
+def build_variants(question: str, steps_text: str, final_answer: str, extracted_data: str = None,
+                   extracted_index: str = None) -> list:
+    """
+    Return a list of dicts with variant, prefix (number of steps used) and context:
+    no steps, steps 1..k with the final answer removed for every k, and all steps with it kept.
+    """
+    steps = split_steps(steps_text)
+    cleaned = remove_final_answer_from_steps(steps, final_answer)
+    variants = [{"variant": "no steps", "prefix": 0, "context": step_context(question, "", extracted_data, extracted_index)}]
+    for k in range(1, len(cleaned) + 1):
+        variants.append({"variant": f"steps 1-{k}" if k > 1 else "step 1", "prefix": k,
+                         "context": step_context(question, " ".join(cleaned[:k]), extracted_data, extracted_index)})
+    variants.append({"variant": WITH_FINAL_ANSWER, "prefix": len(steps),
+                     "context": step_context(question, " ".join(steps), extracted_data, extracted_index)})
+    return variants
+
+# Function to run every variant of the given test cases concurrently and score them
+def run_ablation(cases: pd.DataFrame, config: dict, max_workers: int = MAX_WORKERS) -> pd.DataFrame:
+    """
+    Args:
+    - cases: DataFrame with Question, task_id, Steps, correct_answer, extractedData and extractedIndex columns.
+    - config: dict with model, temperature, max_tokens and top_p.
+
+    Returns:
+    - DataFrame with one row per (task_id, variant) including the answer, correct, latency_ms,
+      token counts and cost_usd.
+    """
+    rows, futures = [], []
+    with start_span("ablation.run", questions=len(cases), model=config["model"]):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for case in cases.itertuples(index=False):
+                for variant in build_variants(case.Question, case.Steps, case.correct_answer, case.extractedData,
+                                                  case.extractedIndex):
+                    fields = {"variant": variant["variant"], "prefix": variant["prefix"]}
+                    try:
+                        prompt, prompt_tokens = prepare_prompt(case.Question, variant["context"])
+                    except ValueError as e:
+                        rows.append({"task_id": case.task_id, **config, **fields, "GeneratedAnswer": "",
+                                     "error": str(e), "cached": False, "prompt_tokens": 0,
+                                     "completion_tokens": 0, "latency_ms": 0.0, "cost_usd": None})
+                        continue
+                    # Copy the context so worker spans keep the session's bound attributes
+                    context = contextvars.copy_context()
+                    futures.append((fields, executor.submit(context.run, run_completion, case.task_id,
+                                                            prompt, prompt_tokens, config)))
+            rows.extend({**future.result(), **fields} for fields, future in futures)
+
+    df = pd.DataFrame(rows)
+    expected = cases.set_index("task_id")["correct_answer"]
+    df["correct"] = score_answers(df["GeneratedAnswer"], df["task_id"].map(expected)).astype(bool)
+    df.loc[df["error"].notna(), "correct"] = False
+    return df
+
+# Function to summarize how much each step adds, from consecutive prefixes of the same test case
+def step_contributions(results: pd.DataFrame) -> pd.DataFrame:
+    prefixes = results[(results["variant"] != WITH_FINAL_ANSWER) & results["error"].isna()]
+    correct = prefixes.pivot_table(index="task_id", columns="prefix", values="correct", aggfunc="first").astype(float)
+    rows = []
+    for k in correct.columns:
+        if k == 0 or k - 1 not in correct.columns:
+            continue
+        pair = correct[[k - 1, k]].dropna()
+        if pair.empty:
+            continue
+        rows.append({
+            "step": k,
+            "test_cases": len(pair),
+            "accuracy_without": pair[k - 1].mean(),
+            "accuracy_with": pair[k].mean(),
+            "contribution": pair[k].mean() - pair[k - 1].mean(),
+            "turned_correct": int(((pair[k] == 1) & (pair[k - 1] == 0)).sum()),
+            "turned_wrong": int(((pair[k] == 0) & (pair[k - 1] == 1)).sum()),
+        })
+    return pd.DataFrame(rows, columns=["step", "test_cases", "accuracy_without", "accuracy_with",
+                                       "contribution", "turned_correct", "turned_wrong"])
+
+# Ablation panel of the validation page (reruns on its own)
+@st.fragment
+def ablation_panel(df_steps):
+    with start_span("fragment.validation_ablation"):
+        questions = df_steps['Question'].tolist()
+        selected = st.session_state.get('selected_test_case')
+        chosen = st.multiselect("Test cases to ablate:", questions,
+                                default=[selected] if selected in questions else [])
+        models = list(PRICING_PER_1K_TOKENS)
+        model = st.selectbox("Model:", models, index=models.index(DEFAULT_MODEL) if DEFAULT_MODEL in models else 0)
+
+        if st.button("Run Ablation"):
+            if not chosen:
+                st.warning("Please select at least one test case.")
+            else:
+                cases = df_steps[df_steps['Question'].isin(chosen)]
+                config = {"model": model, "temperature": 0.2, "max_tokens": 150, "top_p": 0.3}
+                with st.spinner(f"Running every step prefix of {len(cases)} test cases..."):
+                    st.session_state.ablation_results = run_ablation(cases, config)
+
+        if "ablation_results" in st.session_state:
+            results = st.session_state.ablation_results
+            st.subheader("Per-step contribution")
+            st.dataframe(step_contributions(results), hide_index=True)
+
+            st.subheader("Variants")
+            accuracy = results.groupby("variant", sort=False)["correct"].mean()
+            st.caption(f"Accuracy with no steps: {accuracy.get('no steps', 0):.0%}, "
+                       f"with all steps and the final answer kept: {accuracy.get(WITH_FINAL_ANSWER, 0):.0%}")
+            st.dataframe(results[["task_id", "variant", "prefix", "GeneratedAnswer", "correct",
+                                  "latency_ms", "prompt_tokens", "cost_usd", "error"]], hide_index=True)
@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 from google.cloud import bigquery
 from dotenv import load_dotenv
 import os
+from tracing import start_span, latency_report, format_report
+from bigquery_reads import query_dataframe
+from results_schema import RESULTS_LOOKBACK_DAYS
+from evaluation_events import latest_results_query
+from charts import CHART_CACHE_ENTRIES, new_figure, set_count_axis, figure_to_png
+from usage_ledger import load_usage, summarize_usage
+from query_cost import guarded_query, load_query_costs, top_offenders
 
 # Load environment variables
 load_dotenv()
@@ -11,49 +17,159 @@ load_dotenv()
 # BigQuery project details
 project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
-enriched_table = "enrichedMetadata"  # Table containing questionResult, stepsResult
 
-# Function to load user details from BigQuery UserInfo table
-def load_userinfo_data():
-    """Load user details from BigQuery UserInfo table."""
+# Columns shown in the user listing (never the password)
+USER_COLUMNS = ["email", "firstName", "lastName", "fullName", "feedback"]
+
+# Users per page of the listing and how long a page / the total count stay cached
+USERS_PAGE_SIZE = int(os.getenv("ADMIN_USERS_PAGE_SIZE", "50"))
+USERS_CACHE_TTL_SECONDS = int(os.getenv("ADMIN_USERS_CACHE_TTL_SECONDS", "300"))
+
+# Function to build the WHERE clause shared by the user page and count queries
+def user_filter(search: str, after_email: str = None):
+    """Return (WHERE clause, query parameters) matching the search on email prefix or full name, after `after_email`."""
+    conditions, parameters = [], []
+    if search:
+        conditions.append("(STARTS_WITH(LOWER(email), @search) OR STRPOS(LOWER(fullName), @search) > 0)")
+        parameters.append(bigquery.ScalarQueryParameter("search", "STRING", search.strip().lower()))
+    if after_email is not None:
+        conditions.append("email > @after_email")
+        parameters.append(bigquery.ScalarQueryParameter("after_email", "STRING", after_email))
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), parameters
+
+# Function to load one page of user details from BigQuery UserInfo table
+@st.cache_data(ttl=USERS_CACHE_TTL_SECONDS, max_entries=256, show_spinner=False)
+def load_userinfo_page(search: str = "", after_email: str = None, page_size: int = USERS_PAGE_SIZE):
+    """
+    Load up to `page_size` users ordered by email, starting after `after_email` (keyset pagination).
+
+    Returns (DataFrame of USER_COLUMNS, whether a next page exists). One extra row is fetched
+    to tell whether there is a next page; it is not returned.
+    """
     client = bigquery.Client(project=project_id)
+    where, parameters = user_filter(search, after_email)
     query = f"""
-    SELECT firstName, lastName, email, fullName, feedback, password
+    SELECT {', '.join(USER_COLUMNS)}
     FROM `{project_id}.{dataset_id}.UserInfo`
+    {where}
+    ORDER BY email
+    LIMIT @page_size
     """
-    try:
-        query_job = client.query(query)
-        df = query_job.result().to_dataframe()  # Convert query result to pandas DataFrame
-        return df
-    except Exception as e:
-        st.error(f"Error fetching user details from BigQuery: {e}")
-        return pd.DataFrame()
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=parameters + [bigquery.ScalarQueryParameter("page_size", "INT64", page_size + 1)]
+    )
+    with start_span("bigquery.load_userinfo_page", page_size=page_size) as span:
+        df = query_dataframe(client, query, job_config, name="admin.load_userinfo_page")
+        span.set_attribute("rows", len(df))
+    return df.head(page_size)[USER_COLUMNS], len(df) > page_size
+
+# Function to count the users matching the search (cached, a full scan of the email/name columns)
+@st.cache_data(ttl=USERS_CACHE_TTL_SECONDS, max_entries=64, show_spinner=False)
+def count_users(search: str = "") -> int:
+    client = bigquery.Client(project=project_id)
+    where, parameters = user_filter(search)
+    query = f"""
+    SELECT COUNT(*) AS total
+    FROM `{project_id}.{dataset_id}.UserInfo`
+    {where}
+    """
+    with start_span("bigquery.count_users"):
+        job_config = bigquery.QueryJobConfig(query_parameters=parameters)
+        rows = list(guarded_query(client, "admin.count_users", query, job_config).result())
+    return int(rows[0]["total"]) if rows else 0
+
+# User details panel of the admin page: one page of users at a time (reruns on its own)
+@st.fragment
+def user_details_panel():
+    with start_span("fragment.admin_users"):
+        search = st.text_input("Search by email or name:", key="user_search")
+
+        # Stack of keyset cursors: the last email of every page before the current one
+        if st.session_state.get('user_search_applied') != search:
+            st.session_state.user_search_applied = search
+            st.session_state.user_page_cursors = [None]
+        cursors = st.session_state.user_page_cursors
+
+        try:
+            df_users, has_next = load_userinfo_page(search, cursors[-1])
+            total = count_users(search)
+        except Exception as e:
+            st.error(f"Error fetching user details from BigQuery: {e}")
+            return
+
+        if df_users.empty:
+            st.warning("No user data available.")
+            return
+
+        first = (len(cursors) - 1) * USERS_PAGE_SIZE + 1
+        st.caption(f"Users {first}-{first + len(df_users) - 1} of {total}")
+        st.dataframe(df_users, hide_index=True)
+
+        # Move the cursor in the button callbacks so the page rendered next is already the new one
+        previous_column, next_column = st.columns(2)
+        previous_column.button("Previous", disabled=len(cursors) == 1, on_click=cursors.pop)
+        next_column.button("Next", disabled=not has_next, on_click=cursors.append,
+                           args=(df_users['email'].iloc[-1],))
+
+# Usage panel of the admin page: tokens, cost, cache hits and latency from the usage ledger (reruns on its own)
+@st.fragment
+def usage_panel():
+    with start_span("fragment.admin_usage"):
+        # Write out this process's buffered calls first so they are included
+        import openai_utils
+        if openai_utils.usage_ledger is not None:
+            openai_utils.usage_ledger.flush()
+        from comparison import PRICING_PER_1K_TOKENS
+
+        days = st.number_input("Days:", min_value=1, max_value=365, value=7, key="usage_days")
+        group_by = st.radio("Group by:", ["Day", "Model", "Session"], horizontal=True, key="usage_group_by")
+        df = load_usage(days=int(days))
+        if df.empty:
+            st.warning("No model calls recorded yet.")
+            return
+
+        summary = summarize_usage(df, {"Day": "day", "Model": "model", "Session": "session_id"}[group_by],
+                                  PRICING_PER_1K_TOKENS)
+        st.caption(f"{len(df)} calls, {int(summary['total_tokens'].sum())} tokens, "
+                   f"estimated cost ${summary['cost_usd'].sum():.2f}, cache hit rate {df['cache'].ne('miss').mean():.0%}")
+        st.dataframe(summary.sort_values("total_tokens", ascending=False), hide_index=True)
 
 # Function to load results data from BigQuery
-def load_results_data():
-    """Load questionResult and stepsResult data from BigQuery."""
+def load_results_data(days: int = RESULTS_LOOKBACK_DAYS):
+    """Load the latest questionResult and stepsResult of every session's tasks from the last `days` days (only those partitions are scanned)."""
     client = bigquery.Client(project=project_id)
     query = f"""
     SELECT 
         questionResult, 
         stepsResult
-    FROM `{project_id}.{dataset_id}.{enriched_table}`
+    FROM ({latest_results_query("WHERE resultAt >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @days DAY)")})
     """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("days", "INT64", days)]
+    )
     try:
-        query_job = client.query(query)
-        df = query_job.result().to_dataframe()  # Convert query result to pandas DataFrame
+        with start_span("bigquery.load_results_data", days=days) as span:
+            df = query_dataframe(client, query, job_config, name="admin.load_results_data")  # Read the result into a DataFrame through Arrow
+            span.set_attribute("rows", len(df))
         return df
     except Exception as e:
         st.error(f"Error fetching data from BigQuery: {e}")
         return pd.DataFrame()
 
+# Function to count the True/False categories shown in the admin graph
+def count_result_categories(df):
+    """Return (true_question_count, true_steps_count, false_steps_count)."""
+    question_counts = df['questionResult'].value_counts()
+    steps_counts = df['stepsResult'].value_counts()
+    return question_counts.get('True', 0), steps_counts.get('True', 0), steps_counts.get('False', 0)
+
 # Function to plot the bar chart
 def plot_visualization(true_question, true_steps, false_steps):
     labels = ['Questions', 'Steps', 'Null']
     counts = [true_question, true_steps, false_steps]
     colors = ['darkgreen', 'purple', 'orange']
 
-    fig, ax = plt.subplots(figsize=(5, 4))  # Set smaller figure size
+    fig, ax = new_figure(figsize=(5, 4))  # Set smaller figure size
     bars = ax.bar(labels, counts, color=colors)
 
     # Annotate bars with their heights
@@ -61,13 +177,18 @@ def plot_visualization(true_question, true_steps, false_steps):
         height = bar.get_height()
         ax.text(bar.get_x() + bar.get_width() / 2, height + 0.1, f'{int(height)}', ha='center', fontsize=10)
 
-    ax.set_ylim(0, max(counts) + 1)
+    set_count_axis(ax, counts)  # Y-axis from 0 with integer ticks
     ax.set_title("True/False Distribution")
     ax.set_ylabel("Count")
     ax.set_xlabel("Category")
-    ax.yaxis.set_major_locator(plt.MultipleLocator(1))  # Y-axis increments by 1
 
-    st.pyplot(fig)
+    return fig
+
+# Function to render the admin bar chart as PNG, cached by its counts
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES)
+def render_visualization(true_question, true_steps, false_steps):
+    with start_span("chart.render", title="True/False Distribution"):
+        return figure_to_png(plot_visualization(true_question, true_steps, false_steps))
 
 # Admin Page
 def admin_page():
@@ -83,7 +204,7 @@ def admin_page():
         
         # Redirect to the login screen
         st.session_state.page = 'login'
-        st.experimental_set_query_params(page='login')
+        st.query_params["page"] = 'login'
 
     # State for toggling visibility of the user details
     if 'show_user_details' not in st.session_state:
@@ -95,11 +216,7 @@ def admin_page():
 
     # If the button is clicked, show or hide the user details
     if st.session_state.show_user_details:
-        df_userinfo = load_userinfo_data()
-        if df_userinfo.empty:
-            st.warning("No user data available.")
-        else:
-            st.dataframe(df_userinfo)
+        user_details_panel()
 
     # State for toggling visibility of the graph
     if 'show_visualization' not in st.session_state:
@@ -117,12 +234,78 @@ def admin_page():
             st.warning("No data available to display.")
         else:
             # Count True/False values from questionResult and stepsResult
-            true_question_count = df['questionResult'].value_counts().get('True', 0)
-            true_steps_count = df['stepsResult'].value_counts().get('True', 0)
-            false_steps_count = df['stepsResult'].value_counts().get('False', 0)
+            true_question_count, true_steps_count, false_steps_count = count_result_categories(df)
+
+            st.caption(f"Results from the last {RESULTS_LOOKBACK_DAYS} days")
 
             # Plot the graph with the counted values
-            plot_visualization(true_question_count, true_steps_count, false_steps_count)
+            png = render_visualization(int(true_question_count), int(true_steps_count), int(false_steps_count))
+            st.image(png, width="stretch")
+
+    # State for toggling visibility of the usage ledger
+    if 'show_usage' not in st.session_state:
+        st.session_state.show_usage = False
+
+    # Add "Usage Ledger" button to toggle token, cost and latency aggregations of the model calls
+    if st.button("Usage Ledger"):
+        st.session_state.show_usage = not st.session_state.show_usage
+
+    if st.session_state.show_usage:
+        usage_panel()
+
+    # State for toggling visibility of the latency report
+    if 'show_latency_report' not in st.session_state:
+        st.session_state.show_latency_report = False
+
+    # Add "Latency Report" button to toggle the per-span latency summary
+    if st.button("Latency Report"):
+        st.session_state.show_latency_report = not st.session_state.show_latency_report
+
+    # Show latency percentiles and histograms of the spans recorded by this process
+    if st.session_state.show_latency_report:
+        report = latency_report()
+        if not report:
+            st.warning("No spans recorded yet.")
+        else:
+            summary = pd.DataFrame.from_dict(report, orient='index').drop(columns=['histogram'])
+            st.dataframe(summary.sort_values('p95_ms', ascending=False))
+            st.code(format_report(report))
+
+    # State for toggling visibility of the semantic answer cache statistics
+    if 'show_semantic_cache' not in st.session_state:
+        st.session_state.show_semantic_cache = False
+
+    # Add "Semantic Answer Cache" button to toggle the cache statistics
+    if st.button("Semantic Answer Cache"):
+        st.session_state.show_semantic_cache = not st.session_state.show_semantic_cache
+
+    # Show the hit rate, audited false hits and lookup latency of the semantic answer cache of this process
+    if st.session_state.show_semantic_cache:
+        import openai_utils
+        st.subheader("Semantic Answer Cache")
+        st.caption("Hit rate, audited false hits and lookup latency of this process's cache")
+        if openai_utils.semantic_cache is None:
+            st.info("The semantic answer cache is disabled or has not been used yet.")
+        else:
+            st.dataframe(pd.DataFrame([openai_utils.semantic_cache.stats()]), hide_index=True)
+
+    # State for toggling visibility of the query costs
+    if 'show_query_costs' not in st.session_state:
+        st.session_state.show_query_costs = False
+
+    # Add "Query Costs" button to toggle the top offenders of the BigQuery cost log
+    if st.button("Query Costs"):
+        st.session_state.show_query_costs = not st.session_state.show_query_costs
+
+    # Show the bytes each named BigQuery query would scan, from the dry runs of the cost guard
+    if st.session_state.show_query_costs:
+        st.subheader("Query Costs")
+        st.caption("Bytes each named BigQuery query would scan, from the dry runs in the cost log")
+        offenders = top_offenders(load_query_costs())
+        if offenders.empty:
+            st.info("No query costs logged yet.")
+        else:
+            st.dataframe(offenders, hide_index=True)
 
 # Run the admin page function
 if __name__ == "__main__":
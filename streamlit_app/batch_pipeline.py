@@ -0,0 +1,300 @@
+"""
+Nightly full-suite runs through the OpenAI Batch API.
+
+Renders every pending GAIA question into a Batch API request file using the
+same prompt logic as get_openai_answer, uploads it, starts a batch, polls
+until it finishes and appends the scored answers to the evaluation event
+log in batched streaming inserts. Batch requests are billed at half price and do not count
+against the interactive rate limits.
+
+Usage:
+    python batch_pipeline.py run [--all] [--model gpt-4]
+    python batch_pipeline.py render|submit|wait|ingest ...
+
+Set OPENAI_API_BASE to point the pipeline at a local stub of the endpoints
+(see benchmarks/stubs.py: BatchAPIStub).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+import openai
+import pandas as pd
+from openai.api_resources.abstract import CreateableAPIResource, ListableAPIResource
+from google.cloud import bigquery
+from dotenv import load_dotenv
+from openai_utils import DEFAULT_MODEL, build_task_context, prepare_prompt, chat_messages, get_usage_ledger
+from evaluation_events import EVENTS_TABLE, INSERT_BATCH_SIZE, make_event, record_events
+from tracing import start_span
+from bigquery_reads import query_dataframe
+from scoring import score_answers
+from checkpoint import ProgressJournal, journal_path
+
+# Load environment variables
+load_dotenv()
+
+# BigQuery project details
+project_id = os.getenv("PROJECT_ID")
+dataset_id = os.getenv("DATASET_ID")
+table_id = os.getenv("TABLE_ID")  # Table for test cases and extracted data
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+DEFAULT_REQUESTS_PATH = "batch_requests.jsonl"
+INGEST_CHUNK_TASKS = INSERT_BATCH_SIZE // 2  # two events (question, steps) per task
+
+
+class Batch(CreateableAPIResource, ListableAPIResource):
+    """The /batches resource, which the pinned openai client does not ship."""
+    OBJECT_NAME = "batches"
+
+
+# Function to load the questions to answer from BigQuery
+def load_pending_questions(include_answered: bool = False) -> pd.DataFrame:
+    """Questions never answered in any session (every question with include_answered)."""
+    client = bigquery.Client(project=project_id)
+    pending_filter = "" if include_answered else f"""
+    WHERE NOT EXISTS (
+        SELECT 1 FROM `{project_id}.{dataset_id}.{EVENTS_TABLE}` e
+        WHERE e.task_id = m.task_id AND e.stage = 'question' AND e.answer IS NOT NULL AND e.answer != ''
+    )"""
+    query = f"""
+    SELECT m.Question, m.task_id, m.`Final answer`, m.extractedData, m.extractedIndex
+    FROM `{project_id}.{dataset_id}.{table_id}` m
+    {pending_filter}
+    """
+    try:
+        with start_span("bigquery.load_pending_questions") as span:
+            df = query_dataframe(client, query, name="batch_pipeline.load_pending_questions")
+            span.set_attribute("rows", len(df))
+        return df
+    except Exception as e:
+        raise RuntimeError(f"Error fetching pending questions from BigQuery: {e}")
+
+# Function to render questions as Batch API chat completion requests
+def render_requests(questions: pd.DataFrame, path: str, model: str = DEFAULT_MODEL,
+                    temperature: float = 0.2, max_tokens: int = 150, top_p: float = 0.3) -> int:
+    """Write one request line per question (custom_id = task_id) and return the number written."""
+    written = 0
+    with open(path, "w") as f:
+        for row in questions.itertuples(index=False):
+            try:
+                prompt, _ = prepare_prompt(row.Question, build_task_context(row.Question, row.extractedData,
+                                                                           row.extractedIndex))
+            except ValueError as e:
+                print(f"Skipping task_id {row.task_id}: {e}")
+                continue
+            request = {
+                "custom_id": row.task_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": chat_messages(prompt),
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "top_p": top_p,
+                },
+            }
+            f.write(json.dumps(request) + "\n")
+            written += 1
+    return written
+
+# Function to upload a request file and start a batch
+def submit_batch(path: str) -> str:
+    try:
+        with start_span("openai.batch_submit") as span:
+            with open(path, "rb") as f:
+                input_file = openai.File.create(file=f, purpose="batch")
+            batch = Batch.create(input_file_id=input_file["id"], endpoint=CHAT_COMPLETIONS_ENDPOINT,
+                                 completion_window=COMPLETION_WINDOW)
+            span.set_attribute("batch_id", batch["id"])
+        return batch["id"]
+    except Exception as e:
+        raise RuntimeError(f"Error submitting batch to OpenAI: {e}")
+
+# Function to poll a batch until it reaches a final status
+def wait_for_batch(batch_id: str, poll_interval: float = 30, timeout: float = 26 * 3600) -> dict:
+    deadline = time.monotonic() + timeout
+    with start_span("openai.batch_wait", batch_id=batch_id) as span:
+        while True:
+            batch = Batch.retrieve(batch_id)
+            if batch["status"] in FINAL_STATUSES:
+                span.set_attributes(status=batch["status"], **(batch.get("request_counts") or {}))
+                return batch
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Batch {batch_id} still {batch['status']} after {timeout:.0f}s.")
+            time.sleep(poll_interval)
+
+# Function to download and parse the output file of a finished batch
+def download_results(batch: dict) -> pd.DataFrame:
+    """
+    Return a DataFrame of task_id, GeneratedAnswer, error, prompt_tokens and completion_tokens
+    for every line of the output and error files.
+    """
+    rows = []
+    for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+        if not file_id:
+            continue
+        content = openai.File.download(file_id).decode("utf-8")
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            body = response.get("body") or {}
+            usage = body.get("usage") or {}
+            tokens = {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+            if response.get("status_code") == 200 and body.get("choices"):
+                answer = body["choices"][0]["message"]["content"].strip()
+                rows.append({"task_id": result["custom_id"], "GeneratedAnswer": answer, "error": None, **tokens})
+            else:
+                error = result.get("error") or body.get("error") or {"status_code": response.get("status_code")}
+                rows.append({"task_id": result["custom_id"], "GeneratedAnswer": None, "error": json.dumps(error),
+                             **tokens})
+    return pd.DataFrame(rows, columns=["task_id", "GeneratedAnswer", "error", "prompt_tokens", "completion_tokens"])
+
+# Function to record the token usage of every batch request in the usage ledger
+def record_batch_usage(results: pd.DataFrame, session_id: str, model: str = DEFAULT_MODEL) -> int:
+    ledger = get_usage_ledger()
+    for row in results.itertuples(index=False):
+        ledger.record(model, row.prompt_tokens, row.completion_tokens, cache="miss", source="batch",
+                      task_id=row.task_id, session_id=session_id)
+    ledger.flush()
+    return len(results)
+
+# Function to derive the event id of a batch answer, the same in every attempt to ingest it
+def batch_event_id(session_id: str, task_id: str, stage: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{session_id}/{task_id}/{stage}"))
+
+# Function to record batch answers and their scores in the evaluation event log (and their usage in the ledger)
+def ingest_results(results: pd.DataFrame, questions: pd.DataFrame, session_id: str,
+                   model: str = DEFAULT_MODEL, journal: ProgressJournal = None) -> int:
+    """
+    Ingest INGEST_CHUNK_TASKS results at a time. With a journal, every task_id is journaled once its
+    chunk is written and task_ids already in it are skipped, so an interrupted ingest resumes
+    where it stopped; event ids are derived from the batch session and task, so a chunk written
+    again is deduplicated by the streaming insert. Token usage is recorded in the ledger after a
+    chunk is written (and journaled), once per request.
+    """
+    if journal is not None:
+        results = results[~results["task_id"].map(journal.done)]
+    expected = questions.set_index("task_id")["Final answer"]
+    ingested = 0
+    for start in range(0, len(results), INGEST_CHUNK_TASKS):
+        chunk = results.iloc[start:start + INGEST_CHUNK_TASKS]
+        answered = chunk[chunk["GeneratedAnswer"].notna()]
+        correct = score_answers(answered["GeneratedAnswer"], answered["task_id"].map(expected))
+
+        events = []
+        for task_id, answer, is_correct in zip(answered["task_id"], answered["GeneratedAnswer"], correct):
+            events.append(make_event(task_id, session_id, "question", answer, str(is_correct), model,
+                                     batch_event_id(session_id, task_id, "question")))
+            # Correct answers skip the steps validation, as on the testing page
+            events.append(make_event(task_id, session_id, "steps", None, "Skipped" if is_correct else "Pending",
+                                     model, batch_event_id(session_id, task_id, "steps")))
+        if events:
+            with start_span("batch.ingest_results", rows=len(answered), session_id=session_id):
+                if journal is None:
+                    record_events(events)
+                else:
+                    journal.retry(f"ingest of {len(answered)} answers", lambda: record_events(events))
+        ingested += len(answered)
+
+        if journal is None:
+            record_batch_usage(chunk, session_id, model)
+            continue
+        # Usage is recorded once the chunk is journaled; rows journaled by an earlier run were
+        # skipped above, so a retried or resumed ingest doesn't count a request twice
+        for row in chunk.itertuples(index=False):
+            if row.GeneratedAnswer is None or pd.isna(row.GeneratedAnswer):
+                journal.record(row.task_id, "request_failed", detail=row.error)
+            else:
+                journal.record(row.task_id, "ingested", row.GeneratedAnswer)
+        record_batch_usage(chunk, session_id, model)
+    return ingested
+
+# Function to run the whole pipeline
+def run_pipeline(path: str = DEFAULT_REQUESTS_PATH, include_answered: bool = False,
+                 poll_interval: float = 30, **sampling) -> dict:
+    """
+    The submitted batch id is journaled, so a run interrupted while waiting for or ingesting the
+    batch picks the same batch up again instead of submitting a new one.
+    """
+    with ProgressJournal(journal_path(f"batch-run-{table_id}")) as run_journal:
+        if run_journal.done("batch"):
+            batch_id = run_journal.entries["batch"]["detail"]
+            questions = load_pending_questions(include_answered=True)
+            written = None  # taken from the batch's request counts below
+            print(f"Resuming batch {batch_id} of an interrupted run")
+        else:
+            questions = load_pending_questions(include_answered)
+            written = render_requests(questions, path, **sampling)
+            print(f"Rendered {written} of {len(questions)} questions to {path}")
+            if not written:
+                return {"requests": 0, "ingested": 0}
+            batch_id = submit_batch(path)
+            run_journal.record("batch", "submitted", detail=batch_id)
+            print(f"Submitted batch {batch_id}")
+        batch = wait_for_batch(batch_id, poll_interval)
+        print(f"Batch {batch_id} {batch['status']}: {dict(batch.get('request_counts') or {})}")
+        if written is None:
+            written = (batch.get("request_counts") or {}).get("total", 0)
+
+        results = download_results(batch)
+        with ProgressJournal(journal_path(f"ingest-{batch_id}")) as journal:
+            if len(journal):
+                print(f"Skipping {len(journal)} results ingested by the interrupted run")
+            ingest_results(results, questions, session_id=f"batch-{batch_id}",
+                           model=sampling.get("model", DEFAULT_MODEL), journal=journal)
+            ingested = len(journal.items("ingested"))  # including those of an interrupted run
+        run_journal.reset()  # the batch is done; the next run submits a new one
+    failed = int(results["error"].notna().sum())
+    print(f"Ingested {ingested} answers into {EVENTS_TABLE}; {failed} requests failed")
+    return {"batch_id": batch_id, "status": batch["status"], "requests": written,
+            "ingested": ingested, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "render", "submit", "wait", "ingest"])
+    parser.add_argument("--path", default=DEFAULT_REQUESTS_PATH, help="Batch request file to write or upload.")
+    parser.add_argument("--batch-id", help="Batch to wait for or ingest.")
+    parser.add_argument("--all", action="store_true", help="Include questions that already have an answer.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--temperature", type=float, default=0.2)
+    parser.add_argument("--max-tokens", type=int, default=150)
+    parser.add_argument("--top-p", type=float, default=0.3)
+    parser.add_argument("--poll-interval", type=float, default=30)
+    args = parser.parse_args(argv)
+    sampling = {"model": args.model, "temperature": args.temperature,
+                "max_tokens": args.max_tokens, "top_p": args.top_p}
+
+    if args.command == "run":
+        run_pipeline(args.path, args.all, args.poll_interval, **sampling)
+    elif args.command == "render":
+        written = render_requests(load_pending_questions(args.all), args.path, **sampling)
+        print(f"Rendered {written} requests to {args.path}")
+    elif args.command == "submit":
+        print(submit_batch(args.path))
+    elif not args.batch_id:
+        parser.error(f"{args.command} needs --batch-id")
+    elif args.command == "wait":
+        print(json.dumps(wait_for_batch(args.batch_id, args.poll_interval), default=str))
+    else:
+        batch = Batch.retrieve(args.batch_id)
+        if batch["status"] != "completed":
+            sys.exit(f"Batch {args.batch_id} is {batch['status']}, not completed.")
+        results = download_results(batch)
+        with ProgressJournal(journal_path(f"ingest-{args.batch_id}")) as journal:
+            ingested = ingest_results(results, load_pending_questions(True), session_id=f"batch-{args.batch_id}",
+                                      model=args.model, journal=journal)
+        print(f"Ingested {ingested} answers into {EVENTS_TABLE}")
+
+
+if __name__ == "__main__":
+    main()
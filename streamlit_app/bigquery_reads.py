@@ -0,0 +1,82 @@
+"""
+Arrow fast path for BigQuery reads.
+
+`query_dataframe` runs a query and downloads its result as Arrow record
+batches: through the BigQuery Storage Read API when
+google-cloud-bigquery-storage is installed (and BIGQUERY_STORAGE_API is not
+"false"), else through the REST API, whose pages are decoded straight into
+Arrow columns. Either way the DataFrame is built from the Arrow table with
+string columns kept in their Arrow buffers (pandas' pyarrow-backed string
+dtype) instead of one Python str per cell, so reading wide columns such as
+extractedData is bounded by bandwidth rather than per-row conversion.
+
+The library itself reads small results (those that fit in the first REST
+page) over REST, and the Storage Read API is turned off for the process if
+the credentials may not create read sessions.
+"""
+import os
+import sys
+import threading
+
+from tracing import start_span
+from query_cost import guarded_query
+
+BIGQUERY_STORAGE_ENABLED = os.getenv("BIGQUERY_STORAGE_API", "true").lower() in ("1", "true", "yes")
+
+_bqstorage_client = None
+_bqstorage_lock = threading.Lock()
+
+
+# Function to get the shared Storage Read API client (None if the library is not installed or it is disabled)
+def get_bqstorage_client():
+    global _bqstorage_client, BIGQUERY_STORAGE_ENABLED
+    if not BIGQUERY_STORAGE_ENABLED:
+        return None
+    with _bqstorage_lock:
+        if _bqstorage_client is None:
+            try:
+                from google.cloud import bigquery_storage
+            except ImportError:
+                BIGQUERY_STORAGE_ENABLED = False
+                return None
+            _bqstorage_client = bigquery_storage.BigQueryReadClient()
+    return _bqstorage_client
+
+
+# Function to turn the Storage Read API off for this process after a permission error
+def disable_bqstorage(error):
+    global BIGQUERY_STORAGE_ENABLED
+    BIGQUERY_STORAGE_ENABLED = False
+    print(f"BigQuery Storage Read API unavailable, reading over REST: {error}", file=sys.stderr)
+
+
+# pyarrow-backed strings that compare and test like the object strings they replace (missing values are NaN)
+def string_dtype():
+    import numpy as np
+    import pandas as pd
+
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:
+        return None  # pandas < 2.3: keep the library's default
+
+
+# Function to run a query and read its result into a DataFrame through Arrow
+def query_dataframe(client, query: str, job_config=None, name: str = "unnamed"):
+    """`name` identifies the query to the bytes-scanned profiler and budget (query_cost.py)."""
+    from google.api_core.exceptions import Forbidden, PermissionDenied
+
+    query_job = guarded_query(client, name, query, job_config)
+    bqstorage_client = get_bqstorage_client()
+    with start_span("bigquery.read_arrow", storage_api=bqstorage_client is not None) as span:
+        try:
+            df = query_job.result().to_dataframe(bqstorage_client=bqstorage_client, create_bqstorage_client=False,
+                                                 string_dtype=string_dtype())
+        except (Forbidden, PermissionDenied) as e:
+            if bqstorage_client is None:
+                raise
+            disable_bqstorage(e)
+            span.set_attribute("storage_api", False)
+            df = query_job.result().to_dataframe(create_bqstorage_client=False, string_dtype=string_dtype())
+        span.set_attributes(rows=len(df), bytes=int(df.memory_usage().sum()))
+    return df
@@ -0,0 +1,496 @@
+"""
+Record and replay the external calls of the app and the ingest.
+
+With CASSETTE_MODE=record, the OpenAI chat completions, BigQuery queries
+(and dry runs) and streaming inserts, GCS object reads, and the Vision and
+speech calls of the extractors go to the real services as usual, and each
+call is appended to the cassette CASSETTE_PATH with its response and its
+latency. With CASSETTE_MODE=replay, the same calls are answered from the
+cassette without network or credentials, after sleeping CASSETTE_LATENCY
+times the recorded latency (0 by default: as fast as possible; 1: as
+recorded). Streamed completions replay their chunks with the recorded
+gaps. Errors are recorded and raised again.
+
+A call is matched on its service, operation and request: the model,
+messages and sampling parameters of a completion, the text and parameter
+values of a query, the rows of an insert, the bucket and object of a read.
+Calls that match several recorded ones get them in recorded order, and
+the last one again once they run out. A call whose request has no exact
+match (a query parameter holding the current time, an insert of new event
+ids) falls back to the recorded calls of the same operation on the same
+query, table or model, in order. A call with no match at all raises
+CassetteMiss. Replay with the configuration (.env) of the recording, and
+the on-disk caches (GCS_CACHE_DIR) as empty as they were.
+
+The cassette is a file of gzip members, one JSON line each, appended with
+single writes (so the extraction worker process records into the same
+file). Result sets are stored as Arrow IPC streams and bytes as base64.
+
+`install_from_env()` is called by the entry points (main.py,
+dataflow/DataFromFile.py) before they create any client.
+"""
+import base64
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+DEFAULT_CASSETTE_PATH = os.path.join(tempfile.gettempdir(), "model-evaluation-cassette.jsonl.gz")
+RECORD, REPLAY = "record", "replay"
+
+active_cassette = None
+
+
+class CassetteMiss(RuntimeError):
+    """A replayed call that was not recorded."""
+
+
+# Function to hash a JSON-serializable request
+def request_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+# Functions to store bytes and Arrow tables in a JSON entry
+def encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_bytes(text: str) -> bytes:
+    return base64.b64decode(text)
+
+
+def encode_table(table) -> str:
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return encode_bytes(sink.getvalue().to_pybytes())
+
+
+def decode_table(text: str):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(decode_bytes(text)).read_all()
+
+
+# Function to rebuild a recorded exception (as a RuntimeError if its class can't be imported or built)
+def rebuild_error(error: dict) -> Exception:
+    module_name, _, class_name = error["type"].rpartition(".")
+    try:
+        return getattr(importlib.import_module(module_name), class_name)(error["message"])
+    except Exception:
+        return RuntimeError(f"{error['type']}: {error['message']}")
+
+
+# Function to read every complete entry of a cassette file
+def read_entries(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    entries = []
+    while data:
+        member = zlib.decompressobj(wbits=31)
+        try:
+            chunk = member.decompress(data)
+        except zlib.error:
+            break
+        if not member.eof:
+            break  # a call still being written, or cut short
+        entries.extend(json.loads(line) for line in chunk.splitlines() if line.strip())
+        data = member.unused_data
+    return entries
+
+
+class Cassette:
+    """Recorded calls, appended to (record) or served from (replay) a cassette file."""
+
+    def __init__(self, path, mode, latency=0.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Invalid cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counts = {"recorded": 0, "exact": 0, "loose": 0, "missed": 0}
+        self.exact, self.loose, self.served = {}, {}, {}
+        if mode == RECORD:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        else:
+            for entry in read_entries(path):
+                self.exact.setdefault(entry["key"], []).append(entry)
+                self.loose.setdefault(entry["loose"], []).append(entry)
+
+    def record(self, service, op, key, loose, seconds, response=None, error=None, request=None):
+        entry = {"service": service, "op": op, "key": key, "loose": loose, "seconds": round(seconds, 6),
+                 "request": request}
+        if error is not None:
+            entry["error"] = {"type": f"{type(error).__module__}.{type(error).__qualname__}", "message": str(error)}
+        else:
+            entry["response"] = response
+        # One write per call, so concurrent writers (threads, the extraction worker) don't interleave
+        os.write(self.fd, gzip.compress((json.dumps(entry, default=str) + "\n").encode("utf-8"), compresslevel=6))
+        with self.lock:
+            self.counts["recorded"] += 1
+
+    def lookup(self, service, op, key, loose, request=None):
+        """Return the next recorded entry for the call; raises CassetteMiss if there is none."""
+        with self.lock:
+            for kind, index, index_key in (("exact", self.exact, key), ("loose", self.loose, loose)):
+                entries = index.get(index_key)
+                if entries:
+                    position = self.served.get((kind, index_key), 0)
+                    self.served[(kind, index_key)] = position + 1
+                    self.counts[kind] += 1
+                    return entries[min(position, len(entries) - 1)]
+            self.counts["missed"] += 1
+        raise CassetteMiss(f"{service}.{op} was not recorded in {self.path}: {request}")
+
+    def wait(self, seconds):
+        if self.latency and seconds:
+            time.sleep(seconds * self.latency)
+
+    def call(self, service, op, key, loose, live, encode, decode, request=None):
+        """
+        Record: run live(), record encode(result) (or its exception) and return the result.
+        Replay: return decode(recorded response), or raise the recorded exception.
+        """
+        if self.mode == RECORD:
+            start = time.perf_counter()
+            try:
+                result = live()
+            except Exception as e:
+                self.record(service, op, key, loose, time.perf_counter() - start, error=e, request=request)
+                raise
+            response, result = encode(result)
+            self.record(service, op, key, loose, time.perf_counter() - start, response, request=request)
+            return result
+        entry = self.lookup(service, op, key, loose, request)
+        self.wait(entry["seconds"])
+        if "error" in entry:
+            raise rebuild_error(entry["error"])
+        return decode(entry["response"])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts, mode=self.mode, path=self.path)
+
+
+# Function to round-trip a response through JSON, so recorded and replayed calls return the same types
+def as_json(response):
+    return json.loads(json.dumps(response))
+
+
+# Function to record or replay the chat completions (streamed or not)
+def patch_openai(cassette):
+    import openai
+
+    live_create = openai.ChatCompletion.create
+
+    def create(**kwargs):
+        request = {k: v for k, v in kwargs.items() if k not in ("request_timeout", "api_key")}
+        stream = bool(kwargs.get("stream"))
+        key = request_key("chat", request)
+        loose = request_key("chat", kwargs.get("model"), stream)
+        summary = f"{kwargs.get('model')} {str(kwargs.get('messages'))[-120:]}"
+        if stream:
+            return _stream(cassette, key, loose, summary, lambda: live_create(**kwargs))
+        return cassette.call("openai", "chat", key, loose, lambda: live_create(**kwargs),
+                             encode=lambda response: (as_json(response), as_json(response)),
+                             decode=lambda response: response, request=summary)
+
+    openai.ChatCompletion.create = staticmethod(create)
+
+
+def _stream(cassette, key, loose, summary, live):
+    """A streamed completion: recorded once it has been read to the end, replayed with its chunk gaps."""
+    if cassette.mode == REPLAY:
+        entry = cassette.lookup("openai", "chat_stream", key, loose, summary)
+        if "error" in entry:
+            cassette.wait(entry["seconds"])
+            raise rebuild_error(entry["error"])
+
+        def replay():
+            previous = 0.0
+            for offset, chunk in zip(entry["response"]["offsets"], entry["response"]["chunks"]):
+                cassette.wait(offset - previous)
+                previous = offset
+                yield chunk
+        return replay()
+
+    start = time.perf_counter()
+    try:
+        response = live()
+    except Exception as e:
+        cassette.record("openai", "chat_stream", key, loose, time.perf_counter() - start, error=e, request=summary)
+        raise
+
+    def record():
+        chunks, offsets = [], []
+        for chunk in response:
+            offsets.append(round(time.perf_counter() - start, 6))
+            chunks.append(as_json(chunk))
+            yield chunk
+        # A stream closed early (the losing copy of a hedged request) is not recorded
+        cassette.record("openai", "chat_stream", key, loose, time.perf_counter() - start,
+                        {"chunks": chunks, "offsets": offsets}, request=summary)
+    return record()
+
+
+class CassetteRow(dict):
+    """BigQuery Row stand-in supporting both row['col'] and row.col access."""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class CassetteRowIterator:
+    def __init__(self, table):
+        self._table = table
+        self.total_rows = table.num_rows
+
+    def __iter__(self):
+        for record in self._table.to_pylist():
+            yield CassetteRow(record)
+
+    def to_arrow(self, **kwargs):
+        return self._table
+
+    def to_dataframe(self, string_dtype=None, **kwargs):
+        import pyarrow as pa
+
+        types_mapper = {pa.string(): string_dtype, pa.large_string(): string_dtype}.get if string_dtype else None
+        return self._table.to_pandas(types_mapper=types_mapper)
+
+
+class CassetteQueryJob:
+    def __init__(self, table=None, total_bytes_processed=None, num_dml_affected_rows=None):
+        self._table = table
+        self.total_bytes_processed = total_bytes_processed
+        self.num_dml_affected_rows = num_dml_affected_rows
+
+    def result(self, **kwargs):
+        return CassetteRowIterator(self._table)
+
+
+def _parameters(job_config):
+    return [parameter.to_api_repr() for parameter in getattr(job_config, "query_parameters", None) or []]
+
+
+# Function to record or replay the queries, dry runs and streaming inserts of every bigquery.Client
+def patch_bigquery(cassette):
+    from google.cloud import bigquery
+
+    live_client_class = bigquery.Client
+
+    class CassetteBigQueryClient:
+        """bigquery.Client whose queries and inserts go through the cassette (other methods: record mode only)."""
+
+        def __init__(self, project=None, **kwargs):
+            self.project = project
+            self._client = live_client_class(project=project, **kwargs) if cassette.mode == RECORD else None
+
+        def __getattr__(self, name):
+            if self._client is None:
+                raise CassetteMiss(f"bigquery.Client.{name} is not recorded")
+            return getattr(self._client, name)
+
+        def query(self, query, job_config=None, **kwargs):
+            dry_run = bool(getattr(job_config, "dry_run", False))
+            op = "dry_run" if dry_run else "query"
+            key = request_key(op, query, _parameters(job_config))
+            loose = request_key(op, query, [p.get("name") for p in _parameters(job_config)])
+
+            def live():
+                job = self._client.query(query, job_config=job_config, **kwargs)
+                if dry_run:
+                    return CassetteQueryJob(total_bytes_processed=job.total_bytes_processed)
+                table = job.result().to_arrow(create_bqstorage_client=False)
+                return CassetteQueryJob(table, getattr(job, "total_bytes_processed", None),
+                                        getattr(job, "num_dml_affected_rows", None))
+
+            def encode(job):
+                response = {"total_bytes_processed": job.total_bytes_processed,
+                            "num_dml_affected_rows": job.num_dml_affected_rows}
+                if job._table is not None:
+                    response["arrow"] = encode_table(job._table)
+                return response, job
+
+            def decode(response):
+                table = decode_table(response["arrow"]) if "arrow" in response else None
+                return CassetteQueryJob(table, response["total_bytes_processed"], response["num_dml_affected_rows"])
+
+            return cassette.call("bigquery", op, key, loose, live, encode, decode, request=" ".join(query.split())[:200])
+
+        def insert_rows_json(self, table, json_rows, **kwargs):
+            key = request_key("insert", str(table), json_rows, kwargs.get("row_ids"))
+            return cassette.call("bigquery", "insert", key, request_key("insert", str(table)),
+                                 lambda: self._client.insert_rows_json(table, json_rows, **kwargs),
+                                 encode=lambda errors: (list(errors), errors), decode=lambda errors: errors,
+                                 request=f"{table} ({len(json_rows)} rows)")
+
+    bigquery.Client = CassetteBigQueryClient
+
+
+# Function to record or replay the object reads of every storage.Client
+def patch_storage(cassette):
+    from google.cloud import storage
+
+    live_client_class = storage.Client
+
+    class CassetteBlob:
+        def __init__(self, bucket, name):
+            self.bucket = bucket
+            self.name = name
+            self.generation = None  # set by a download, as on a real blob
+            self._blob = bucket._bucket.blob(name) if bucket._bucket is not None else None
+
+        def _call(self, op, live, encode, decode, *request):
+            key = request_key(op, self.bucket.name, self.name, *request)
+            return cassette.call("gcs", op, key, key, live, encode, decode,
+                                 request=f"gs://{self.bucket.name}/{self.name}")
+
+        def exists(self, **kwargs):
+            return self._call("exists", lambda: self._blob.exists(**kwargs),
+                              encode=lambda found: (found, found), decode=lambda found: found)
+
+        def download_as_bytes(self, if_generation_not_match=None, **kwargs):
+            def live():
+                content = self._blob.download_as_bytes(if_generation_not_match=if_generation_not_match, **kwargs)
+                return content, self._blob.generation
+
+            def encode(result):
+                content, generation = result
+                self.generation = generation
+                return {"content": encode_bytes(content), "generation": generation}, content
+
+            def decode(response):
+                self.generation = response["generation"]
+                return decode_bytes(response["content"])
+
+            return self._call("download", live, encode, decode, if_generation_not_match is not None)
+
+        def download_as_text(self, encoding="utf-8", **kwargs):
+            return self.download_as_bytes(**kwargs).decode(encoding)
+
+    class CassetteBucket:
+        def __init__(self, client, name):
+            self.name = name
+            self._bucket = client._client.bucket(name) if client._client is not None else None
+
+        def blob(self, name):
+            return CassetteBlob(self, name)
+
+    class CassetteStorageClient:
+        """storage.Client whose object reads go through the cassette."""
+
+        def __init__(self, project=None, **kwargs):
+            self.project = project
+            self._client = live_client_class(project=project, **kwargs) if cassette.mode == RECORD else None
+
+        def bucket(self, name):
+            return CassetteBucket(self, name)
+
+    storage.Client = CassetteStorageClient
+
+
+# Function to record or replay the Vision OCR and speech recognition calls of the extractors
+def patch_extractor_services(cassette):
+    try:
+        from google.cloud import vision
+    except ImportError:
+        vision = None
+    if vision is not None:
+        live_client_class = vision.ImageAnnotatorClient
+
+        class CassetteVisionClient:
+            def __init__(self, **kwargs):
+                self._client = live_client_class(**kwargs) if cassette.mode == RECORD else None
+
+            def text_detection(self, image=None, **kwargs):
+                key = request_key("text_detection", hashlib.sha256(image.content).hexdigest())
+
+                def encode(response):
+                    return {"descriptions": [a.description for a in response.text_annotations]}, response
+
+                def decode(response):
+                    return SimpleNamespace(text_annotations=[SimpleNamespace(description=d)
+                                                             for d in response["descriptions"]])
+
+                return cassette.call("vision", "text_detection", key, key,
+                                     lambda: self._client.text_detection(image=image, **kwargs), encode, decode,
+                                     request=f"image of {len(image.content)} bytes")
+
+        vision.ImageAnnotatorClient = CassetteVisionClient
+
+    try:
+        import speech_recognition
+    except ImportError:
+        return
+    live_recognize = speech_recognition.Recognizer.recognize_google
+
+    def recognize_google(self, audio_data, **kwargs):
+        raw = audio_data.get_raw_data()
+        key = request_key("recognize_google", hashlib.sha256(raw).hexdigest(), kwargs)
+        return cassette.call("speech", "recognize_google", key, key,
+                             lambda: live_recognize(self, audio_data, **kwargs),
+                             encode=lambda text: (text, text), decode=lambda text: text,
+                             request=f"audio of {len(raw)} bytes")
+
+    speech_recognition.Recognizer.recognize_google = recognize_google
+
+
+# Function to patch the clients to record into or replay from a cassette
+def install_cassette(path=None, mode=REPLAY, latency=0.0):
+    global active_cassette
+    if active_cassette is not None:
+        return active_cassette
+    cassette = Cassette(path or DEFAULT_CASSETTE_PATH, mode, latency)
+    if mode == REPLAY:
+        # Nothing is sent anywhere; the clients only need these to be set
+        os.environ.setdefault("OPENAI_API_KEY", "cassette-replay")
+        os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "cassette-replay.json")
+    patch_openai(cassette)
+    patch_bigquery(cassette)
+    patch_storage(cassette)
+    patch_extractor_services(cassette)
+    active_cassette = cassette
+    return cassette
+
+
+# Function to install the cassette configured by CASSETTE_MODE, CASSETTE_PATH and CASSETTE_LATENCY (if any)
+def install_from_env():
+    mode = os.getenv("CASSETTE_MODE", "").lower()
+    if not mode or mode == "off":
+        return None
+    return install_cassette(os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH), mode,
+                            float(os.getenv("CASSETTE_LATENCY", "0")))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a cassette: recorded calls and seconds per operation.")
+    parser.add_argument("path", nargs="?", default=os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH))
+    args = parser.parse_args(argv)
+    summary = {}
+    for entry in read_entries(args.path):
+        stats = summary.setdefault(f"{entry['service']}.{entry['op']}", {"calls": 0, "seconds": 0.0, "errors": 0})
+        stats["calls"] += 1
+        stats["seconds"] += entry["seconds"]
+        stats["errors"] += "error" in entry
+    print(f"{args.path}: {os.path.getsize(args.path) / 1e6:.2f} MB")
+    for name, stats in sorted(summary.items()):
+        print(f"{name:28s} {stats['calls']:6d} calls {stats['seconds']:9.2f}s recorded {stats['errors']:4d} errors")
+
+
+if __name__ == "__main__":
+    main()
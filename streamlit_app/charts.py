@@ -0,0 +1,42 @@
+"""
+Chart rendering shared by the results pages.
+
+Charts are drawn on standalone matplotlib Figures rather than through
+pyplot: pyplot keeps every figure it creates alive until plt.close(), so a
+long-running Streamlit process grew with every rerun that drew a chart. A
+standalone Figure is freed as soon as it has been rendered to PNG.
+
+The pages cache the PNG bytes by the chart's counts (see
+visualization.render_bar_chart and admin.render_visualization), so a rerun
+with unchanged data shows the cached image instead of drawing it again.
+"""
+import io
+import os
+
+# Number of distinct charts kept per cached render function
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", "128"))
+
+# Same output st.pyplot produces by default
+PNG_OPTIONS = {"format": "png", "dpi": 200, "bbox_inches": "tight"}
+
+
+# Function to create a figure that is not tracked by pyplot
+def new_figure(figsize):
+    """Return (fig, ax) for a standalone Figure with a single Axes."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
+# Function to give a count axis integer ticks without one tick per unit
+def set_count_axis(ax, counts):
+    """Start the Y-axis at 0 with a little headroom and at most ~10 integer ticks."""
+    from matplotlib.ticker import MaxNLocator
+    ax.set_ylim(0, max(counts) + 1)
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+# Function to render a figure to PNG bytes and release it
+def figure_to_png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **PNG_OPTIONS)
+    fig.clear()
+    return buffer.getvalue()
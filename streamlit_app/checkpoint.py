@@ -0,0 +1,151 @@
+"""
+Progress journal for long ingest and evaluation runs.
+
+A run records every item it finishes (a task_id, or any other key) as one
+JSON line: the item, its outcome, the sha256 of its output, the number of
+attempts so far and the time. Each line is flushed and fsync'd before the
+run moves on, so after a crash or a kill the journal holds every item that
+was finished, and at most the item that was in flight is done again. The
+work itself must be idempotent (an UPDATE ... SET, an insert with insert
+ids) for a resumed run to end with the same results as an uninterrupted one.
+
+On restart the journal is replayed (the last line of an item wins, a torn
+last line is dropped) and `run` skips finished items. Items whose last
+outcome is "failed" are retried, and every attempt is retried with
+exponential backoff (CHECKPOINT_MAX_ATTEMPTS attempts, the first retry
+after CHECKPOINT_BACKOFF_SECONDS) before the item is recorded as failed.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+FAILED = "failed"
+DEFAULT_CHECKPOINT_DIR = os.path.join(tempfile.gettempdir(), "model-evaluation-checkpoints")
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_SECONDS = 2
+
+
+# Function to hash the output of an item (None for items without output)
+def output_hash(output):
+    if output is None:
+        return None
+    if not isinstance(output, bytes):
+        output = str(output).encode("utf-8")
+    return hashlib.sha256(output).hexdigest()
+
+
+# Function to build the journal path of a named run in CHECKPOINT_DIR
+def journal_path(name: str) -> str:
+    directory = os.getenv("CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return os.path.join(directory, f"{safe_name}.jsonl")
+
+
+class ProgressJournal:
+    """Append-only, fsync'd JSONL journal of the items a run has finished."""
+
+    def __init__(self, path, max_attempts=None, backoff_seconds=None):
+        self.path = path
+        self.max_attempts = int(max_attempts or os.getenv("CHECKPOINT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.backoff_seconds = float(backoff_seconds if backoff_seconds is not None
+                                     else os.getenv("CHECKPOINT_BACKOFF_SECONDS", DEFAULT_BACKOFF_SECONDS))
+        self.entries = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._replay()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) < len(data):
+            # Drop a line torn by a kill mid-write, so the next entry starts on its own line
+            with open(self.path, "r+b") as f:
+                f.truncate(len(complete))
+        for line in complete.decode("utf-8").splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self.entries[entry["item"]] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def reset(self):
+        """Forget every item, to start the run over."""
+        self.entries = {}
+        self.file.truncate(0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def done(self, item) -> bool:
+        entry = self.entries.get(str(item))
+        return entry is not None and entry["outcome"] != FAILED
+
+    def outcome(self, item):
+        entry = self.entries.get(str(item))
+        return entry and entry["outcome"]
+
+    def items(self, outcome=None) -> list:
+        """Finished items (with the given outcome), in the order they were first recorded."""
+        return [item for item, entry in self.entries.items() if outcome is None or entry["outcome"] == outcome]
+
+    def record(self, item, outcome: str, output=None, attempts: int = 1, detail: str = None) -> dict:
+        """Append an entry for item and wait for it to reach the disk."""
+        item = str(item)
+        previous = self.entries.get(item)
+        if previous and previous["outcome"] == FAILED:
+            attempts += previous["attempts"]
+        entry = {"item": item, "outcome": outcome, "sha256": output_hash(output), "attempts": attempts,
+                 "detail": detail, "ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds")}
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries[item] = entry
+        return entry
+
+    def retry(self, item, work):
+        """Call work(), retrying exceptions with exponential backoff; the last exception is re-raised."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return work()
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.backoff_seconds * 2 ** (attempt - 1)
+                logging.warning(f"Attempt {attempt} for {item} failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def run(self, item, work):
+        """
+        Call work() (with retries) for an unfinished item and record the outcome. work returns
+        (outcome, output). Returns the journal entry, or None if the item was already finished.
+        """
+        if self.done(item):
+            return None
+        attempts = []
+
+        def attempt():
+            attempts.append(time.monotonic())
+            return work()
+
+        try:
+            outcome, output = self.retry(item, attempt)
+        except Exception as e:
+            logging.error(f"Giving up on {item} after {len(attempts)} attempts: {e}")
+            return self.record(item, FAILED, attempts=len(attempts), detail=str(e)[:500])
+        return self.record(item, outcome, output, attempts=len(attempts))
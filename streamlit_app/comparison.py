@@ -0,0 +1,220 @@
+"""
+Multi-model comparison mode.
+
+Runs the same set of test cases against several model/sampling configs
+concurrently and compares accuracy, latency and token cost side by side.
+Prompts and their token counts are built once per question and shared by
+every config; results are stored per (model, config) in the
+enrichedMetadataComparison table next to enrichedMetadata.
+"""
+import contextvars
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+import pandas as pd
+from google.cloud import bigquery
+from dotenv import load_dotenv
+import os
+from openai_utils import build_task_context, prepare_prompt, get_completion, get_token_count
+from tracing import start_span, bind_attributes
+from scoring import score_answers
+from Testing import load_test_case_data
+
+# Load environment variables
+load_dotenv()
+
+# BigQuery project details
+project_id = os.getenv("PROJECT_ID")
+dataset_id = os.getenv("DATASET_ID")
+table_id = os.getenv("TABLE_ID")  # Table for test cases and extracted data
+comparison_table = "enrichedMetadataComparison"  # One row per (task_id, model, config) and session
+
+# Number of OpenAI requests in flight at once
+MAX_WORKERS = int(os.getenv("COMPARISON_MAX_WORKERS", "8"))
+
+# USD per 1K (prompt, completion) tokens, used for the cost column
+PRICING_PER_1K_TOKENS = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+# Columns of a comparison result row (run_completion), before scoring
+RESULT_COLUMNS = ["task_id", "model", "temperature", "max_tokens", "top_p", "GeneratedAnswer", "error", "cached",
+                  "prompt_tokens", "completion_tokens", "latency_ms", "cost_usd"]
+
+DEFAULT_CONFIGS = [
+    {"model": "gpt-4", "temperature": 0.2, "max_tokens": 150, "top_p": 0.3},
+    {"model": "gpt-3.5-turbo", "temperature": 0.2, "max_tokens": 150, "top_p": 0.3},
+]
+
+# Function to describe a config in tables and charts
+def config_label(config: dict) -> str:
+    return f"{config['model']} (t={config['temperature']}, top_p={config['top_p']}, max={config['max_tokens']})"
+
+# Function to estimate the cost of a completion in USD (None for unknown models)
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    pricing = PRICING_PER_1K_TOKENS.get(model)
+    if pricing is None:
+        return None
+    return (prompt_tokens * pricing[0] + completion_tokens * pricing[1]) / 1000
+
+# Function to build every prompt once, shared by all configs
+def prepare_prompts(test_cases: pd.DataFrame) -> dict:
+    """Return task_id -> (prompt, token_count), or task_id -> error message if the prompt cannot be built."""
+    prompts = {}
+    for row in test_cases.itertuples(index=False):
+        try:
+            prompts[row.task_id] = prepare_prompt(row.Question, build_task_context(row.Question, row.extractedData,
+                                                                                   row.extractedIndex))
+        except ValueError as e:
+            prompts[row.task_id] = str(e)
+    return prompts
+
+# Function to run one prompt against one config and time it (also used by the steps ablation)
+def run_completion(task_id: str, prompt: str, prompt_tokens: int, config: dict) -> dict:
+    """Return a result row with the answer, error, latency_ms, token counts and cost_usd."""
+    start = time.perf_counter()
+    bind_attributes(task_id=task_id)  # tags the call in the usage ledger (workers run in a copied context)
+    result = {"task_id": task_id, **config, "GeneratedAnswer": "", "error": None, "cached": False}
+    try:
+        with start_span("comparison.completion", task_id=task_id, model=config["model"]):
+            answer, usage, cached = get_completion(prompt, config["model"], config["temperature"],
+                                                   config["max_tokens"], config["top_p"])
+        result["GeneratedAnswer"] = answer
+        result["cached"] = cached
+        result["prompt_tokens"] = usage.get("prompt_tokens", prompt_tokens)
+        result["completion_tokens"] = usage.get("completion_tokens") or get_token_count(answer)[0]
+    except RuntimeError as e:
+        result["error"] = str(e)
+        result["prompt_tokens"], result["completion_tokens"] = prompt_tokens, 0
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    result["cost_usd"] = estimate_cost(config["model"], result["prompt_tokens"], result["completion_tokens"])
+    return result
+
+# Function to run every test case against every config concurrently
+def run_comparison(test_cases: pd.DataFrame, configs: list, max_workers: int = MAX_WORKERS) -> pd.DataFrame:
+    """
+    Args:
+    - test_cases: DataFrame with Question, task_id, Final answer, extractedData and extractedIndex columns.
+    - configs: list of dicts with model, temperature, max_tokens and top_p.
+
+    Returns:
+    - DataFrame with one row per (task_id, config) including the answer, questionResult,
+      latency_ms, token counts and cost_usd.
+    """
+    prompts = prepare_prompts(test_cases)
+    results = []
+    with start_span("comparison.run", questions=len(test_cases), configs=len(configs)):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for task_id, prepared in prompts.items():
+                for config in configs:
+                    if isinstance(prepared, str):
+                        results.append({"task_id": task_id, **config, "GeneratedAnswer": "", "error": prepared,
+                                        "cached": False, "prompt_tokens": 0, "completion_tokens": 0,
+                                        "latency_ms": 0.0, "cost_usd": None})
+                        continue
+                    # Copy the context so worker spans keep the session's bound attributes
+                    context = contextvars.copy_context()
+                    futures.append(executor.submit(context.run, run_completion, task_id, *prepared, config))
+            results.extend(future.result() for future in futures)
+
+    df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    expected = test_cases.set_index("task_id")["Final answer"]
+    df["questionResult"] = score_answers(df["GeneratedAnswer"], df["task_id"].map(expected)).map(str)
+    df.loc[df["error"].notna(), "questionResult"] = "Error"
+    df["config"] = [config_label(row) for row in df.to_dict("records")]
+    return df
+
+# Function to summarize comparison results per config
+def summarize_comparison(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per config with accuracy, errors and cache hits. Latency, tokens and cost are those of
+    the calls that reached the model: answers served from a cache return at once and cost nothing.
+    """
+    called = ~results["cached"].astype(bool)
+    results = results.assign(latency_ms=results["latency_ms"].where(called).astype(float),
+                             prompt_tokens=results["prompt_tokens"].where(called, 0).astype(int),
+                             completion_tokens=results["completion_tokens"].where(called, 0).astype(int),
+                             cost_usd=results["cost_usd"].where(called).astype(float))
+    grouped = results.groupby("config", sort=False)
+    summary = pd.DataFrame({
+        "questions": grouped.size(),
+        "accuracy": grouped["questionResult"].apply(lambda s: (s == "True").mean()),
+        "errors": grouped["error"].count(),
+        "cache_hits": grouped["cached"].sum(),
+        "mean_latency_ms": grouped["latency_ms"].mean(),
+        "p95_latency_ms": grouped["latency_ms"].quantile(0.95),
+        "prompt_tokens": grouped["prompt_tokens"].sum(),
+        "completion_tokens": grouped["completion_tokens"].sum(),
+        "cost_usd": grouped["cost_usd"].sum(min_count=1),
+    })
+    return summary.rename_axis("config").reset_index()
+
+# Function to store comparison results in BigQuery
+def save_comparison_results(results: pd.DataFrame, session_id: str):
+    """Append the comparison rows to the enrichedMetadataComparison table."""
+    client = bigquery.Client(project=project_id)
+    columns = ["task_id", "model", "temperature", "max_tokens", "top_p", "GeneratedAnswer",
+               "questionResult", "latency_ms", "prompt_tokens", "completion_tokens", "cost_usd", "error"]
+    rows = results[columns].astype(object).where(results[columns].notna(), None).to_dict("records")
+    result_at = datetime.datetime.now(datetime.timezone.utc).isoformat()  # partitioning column
+    for row in rows:
+        row["sessionId"] = session_id
+        row["resultAt"] = result_at
+    try:
+        with start_span("bigquery.save_comparison_results", rows=len(rows)):
+            errors = client.insert_rows_json(f"{project_id}.{dataset_id}.{comparison_table}", rows)
+        if errors:
+            st.error(f"Failed to store some comparison results: {errors}")
+    except Exception as e:
+        st.error(f"Failed to update {comparison_table} table in BigQuery: {e}")
+
+def comparison_page():
+    st.title("Model Comparison")
+
+    df = load_test_case_data()  # the testing page's cached test cases
+    if df.empty:
+        return
+
+    questions = st.multiselect("Test cases (leave empty to use all):", df["Question"].tolist())
+    test_cases = df[df["Question"].isin(questions)] if questions else df
+
+    st.markdown("**Models and sampling configs:**")
+    configs = st.data_editor(pd.DataFrame(DEFAULT_CONFIGS), num_rows="dynamic", key="comparison_configs")
+    configs = [
+        {"model": str(row["model"]), "temperature": float(row["temperature"]),
+         "max_tokens": int(row["max_tokens"]), "top_p": float(row["top_p"])}
+        for row in configs.dropna().to_dict("records")
+    ]
+
+    if st.button("Run Comparison"):
+        if not configs:
+            st.warning("Please add at least one model config.")
+        elif test_cases.empty:
+            st.warning("There are no test cases to run.")
+        else:
+            with st.spinner(f"Running {len(test_cases)} test cases against {len(configs)} configs..."):
+                results = run_comparison(test_cases, configs)
+            save_comparison_results(results, st.session_state.get("session_id", "session_id_missing"))
+            st.session_state.comparison_results = results
+
+    if "comparison_results" in st.session_state:
+        results = st.session_state.comparison_results
+        summary = summarize_comparison(results)
+        st.subheader("Summary")
+        st.dataframe(summary, hide_index=True)
+        st.bar_chart(summary.set_index("config")["accuracy"])
+
+        st.subheader("Answers")
+        answers = results.pivot_table(index="task_id", columns="config", values="GeneratedAnswer", aggfunc="first")
+        st.dataframe(answers)
+
+    if st.button("Back to Testing"):
+        st.session_state.page = 'testing'
+        st.query_params["page"] = 'testing'
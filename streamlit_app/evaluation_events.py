@@ -0,0 +1,93 @@
+"""
+Append-only log of evaluation results.
+
+Every answer and validation is written as an immutable row of the
+evaluationEvents table (task_id, sessionId, model, stage, answer, result,
+resultAt) with a streaming insert, instead of an UPDATE of the task's
+single row in enrichedMetadata. Concurrent sessions no longer overwrite
+each other's results, and a write is an append rather than a DML job.
+
+Stages:
+- "question": answer is the GeneratedAnswer, result the questionResult;
+- "steps": answer is the StepsGeneratedAnswer, result the stepsResult.
+A NULL answer or result leaves the earlier value of that column in place.
+
+latest_results_query derives the latest state per (sessionId, task_id) in
+enrichedMetadata's columns. Readers inline it with their own WHERE, so the
+filter on resultAt still prunes partitions; results_schema.py installs the
+unfiltered query as the enrichedMetadataLatest view.
+"""
+import datetime
+import os
+import uuid
+
+from google.cloud import bigquery
+from dotenv import load_dotenv
+from tracing import start_span
+
+# Load environment variables
+load_dotenv()
+
+# BigQuery project details
+project_id = os.getenv("PROJECT_ID")
+dataset_id = os.getenv("DATASET_ID")
+EVENTS_TABLE = "evaluationEvents"
+LATEST_RESULTS_VIEW = "enrichedMetadataLatest"
+
+# Rows per streaming insert request
+INSERT_BATCH_SIZE = 500
+
+# Function to build one evaluation event
+def make_event(task_id: str, session_id: str, stage: str, answer: str = None, result: str = None,
+               model: str = None, event_id: str = None) -> dict:
+    return {
+        "eventId": event_id or str(uuid.uuid4()),  # also the insert id, so a retried insert is deduplicated
+        "task_id": task_id,
+        "sessionId": session_id,
+        "model": model,
+        "stage": stage,
+        "answer": answer,
+        "result": result,
+        "resultAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+# Function to append events to the evaluation event log
+def record_events(events: list) -> int:
+    """Stream the events into evaluationEvents in batches of INSERT_BATCH_SIZE and return how many were written."""
+    client = bigquery.Client(project=project_id)
+    table = f"{project_id}.{dataset_id}.{EVENTS_TABLE}"
+    try:
+        with start_span("bigquery.record_events", rows=len(events)):
+            for start in range(0, len(events), INSERT_BATCH_SIZE):
+                batch = events[start:start + INSERT_BATCH_SIZE]
+                errors = client.insert_rows_json(table, batch, row_ids=[event["eventId"] for event in batch])
+                if errors:
+                    raise RuntimeError(f"rows rejected: {errors}")
+        return len(events)
+    except Exception as e:
+        raise RuntimeError(f"Error recording evaluation events in BigQuery: {e}")
+
+# Function to build the query deriving the latest state per session and task from the events
+def latest_results_query(where: str = "") -> str:
+    """
+    SELECT sessionId, task_id, model, GeneratedAnswer, questionResult, StepsGeneratedAnswer,
+    stepsResult and resultAt (the last event) over the events matching `where`.
+    """
+    def latest(column, stage=None):
+        value = f"IF(stage = '{stage}', {column}, NULL)" if stage else column
+        return f"ARRAY_AGG({value} IGNORE NULLS ORDER BY resultAt DESC LIMIT 1)[SAFE_OFFSET(0)]"
+
+    return f"""
+    SELECT
+        sessionId,
+        task_id,
+        {latest('model')} AS model,
+        {latest('answer', 'question')} AS GeneratedAnswer,
+        {latest('result', 'question')} AS questionResult,
+        {latest('answer', 'steps')} AS StepsGeneratedAnswer,
+        {latest('result', 'steps')} AS stepsResult,
+        MAX(resultAt) AS resultAt
+    FROM `{project_id}.{dataset_id}.{EVENTS_TABLE}`
+    {where}
+    GROUP BY sessionId, task_id
+    """
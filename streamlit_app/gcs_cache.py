@@ -0,0 +1,125 @@
+"""
+Local disk cache for GCS attachment downloads.
+
+Entries are keyed on bucket/object/generation. A cached object is served
+from disk without any GCS request while it is fresher than `revalidate_after`
+seconds; after that it is revalidated with a conditional download
+(if_generation_not_match), which costs a 304 when the object is unchanged.
+The cache is size bounded with least-recently-used eviction, and every file
+is written to a temporary name and renamed into place so several Streamlit
+workers can share one directory.
+
+Configured with GCS_CACHE_DIR, GCS_CACHE_MAX_BYTES and
+GCS_CACHE_REVALIDATE_SECONDS.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "model-evaluation-gcs-cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_REVALIDATE_SECONDS = 300
+
+
+class GCSFileCache:
+    """Size-bounded LRU cache of GCS object contents on local disk."""
+
+    def __init__(self, directory=None, max_bytes=None, revalidate_after=None):
+        self.directory = directory or os.getenv("GCS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = int(max_bytes or os.getenv("GCS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.revalidate_after = float(revalidate_after if revalidate_after is not None
+                                      else os.getenv("GCS_CACHE_REVALIDATE_SECONDS", DEFAULT_REVALIDATE_SECONDS))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, bucket_name, object_name):
+        digest = hashlib.sha256(f"{bucket_name}/{object_name}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _data_path(self, entry_path, generation):
+        return f"{entry_path[:-len('.json')]}-{generation}.bin"
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+
+    def _read_entry(self, entry_path):
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+            with open(entry["data_file"], "rb") as f:
+                content = f.read()
+        except (OSError, ValueError, KeyError):
+            return None, None  # missing, half-evicted by another worker, or corrupt: treat as a miss
+        os.utime(entry["data_file"])  # mark as recently used for LRU eviction
+        return entry, content
+
+    def _store(self, entry_path, bucket_name, object_name, generation, content, previous=None):
+        data_path = self._data_path(entry_path, generation)
+        if not os.path.exists(data_path):
+            self._write_atomic(data_path, content)
+        entry = {"bucket": bucket_name, "object": object_name, "generation": generation,
+                 "size": len(content), "data_file": data_path, "validated_at": time.time()}
+        self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+        if previous and previous.get("data_file") != data_path:
+            _remove_quietly(previous["data_file"])  # superseded generation
+        self.evict()
+
+    def get(self, blob):
+        """
+        Return (content_bytes, status) for a storage Blob, where status is
+        "hit" (served from disk), "revalidated" (304 from GCS) or "miss" (downloaded).
+        """
+        entry_path = self._entry_path(blob.bucket.name, blob.name)
+        entry, content = self._read_entry(entry_path)
+        if entry is not None and time.time() - entry["validated_at"] < self.revalidate_after:
+            return content, "hit"
+
+        if entry is not None:
+            from google.api_core.exceptions import NotModified
+            try:
+                fresh = blob.download_as_bytes(if_generation_not_match=entry["generation"])
+            except NotModified:
+                entry["validated_at"] = time.time()
+                self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+                return content, "revalidated"
+        else:
+            fresh = blob.download_as_bytes()
+
+        if blob.generation is not None:
+            self._store(entry_path, blob.bucket.name, blob.name, str(blob.generation), fresh, entry)
+        return fresh, "miss"
+
+    def evict(self):
+        """Delete least recently used objects until the cache fits in max_bytes."""
+        data_files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            data_files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in data_files)
+        for _, size, path in sorted(data_files):
+            if total <= self.max_bytes:
+                break
+            _remove_quietly(path)  # its entry now points at a missing file and reads as a miss
+            total -= size
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,206 @@
+"""
+Run untrusted work (parsing an uploaded file) in a worker process with a
+wall-clock and a memory cap, and profile it per kind.
+
+`IsolatedWorker.run(function, *args)` sends the call to a long-lived worker
+process and waits at most `timeout` seconds for its result. The worker caps
+its heap and anonymous mappings (RLIMIT_DATA) at what it used when it
+started plus `memory_mb`, so an allocation past the cap fails with
+MemoryError inside the worker instead of taking the machine's memory.
+(RLIMIT_AS would also count the address space libraries reserve, such as
+numba's LLVM, and fail them at import.) Where it cannot be set (no
+/proc/self/statm or RLIMIT_DATA, as on macOS and Windows) the worker logs
+a warning and runs without the memory cap. A call that times out, runs
+out of memory or kills the worker (a segfault in a C parser) raises
+IsolationTimeout, IsolationMemoryExceeded or IsolationCrashed, and the
+worker is replaced for the next call. Any other exception is raised as
+IsolatedError with the worker's message, and the worker is kept.
+
+`WorkProfile` records the bytes, seconds and outcome of every call per kind
+(file format) and summarizes them: runs, MB/s over the successful runs,
+failure rate, timeouts, memory kills and crashes.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows: the worker runs without a memory cap
+    resource = None
+
+OK, ERROR, TIMEOUT, MEMORY, CRASHED = "ok", "error", "timeout", "memory", "crashed"
+
+
+class IsolatedError(RuntimeError):
+    """The isolated call raised (the worker survived)."""
+
+
+class IsolationTimeout(IsolatedError):
+    pass
+
+
+class IsolationMemoryExceeded(IsolatedError):
+    pass
+
+
+class IsolationCrashed(IsolatedError):
+    pass
+
+
+# Outcome recorded in a WorkProfile for an exception raised by IsolatedWorker.run
+def outcome_of(error) -> str:
+    if isinstance(error, IsolationTimeout):
+        return TIMEOUT
+    if isinstance(error, IsolationMemoryExceeded):
+        return MEMORY
+    if isinstance(error, IsolationCrashed):
+        return CRASHED
+    return ERROR
+
+
+# Function to read the private data (heap and anonymous mappings) of this process, in bytes
+def _data_size() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[5]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# Function to cap the private data of this process at its current size plus memory_bytes
+def _cap_memory(memory_bytes):
+    """Skipped with a warning where the cap cannot be set (see the module docstring)."""
+    try:
+        limit = _data_size() + memory_bytes
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, resource.getrlimit(resource.RLIMIT_DATA)[1]))
+    except (OSError, AttributeError, ValueError) as e:
+        logging.warning(f"Running the worker without a memory cap, it cannot be set here: {type(e).__name__}: {e}")
+
+
+# Worker process: cap the address space, then run calls until the parent goes away
+def _serve(conn, memory_bytes):
+    if memory_bytes:
+        _cap_memory(memory_bytes)
+    while True:
+        try:
+            function, args = conn.recv()
+        except (EOFError, OSError):
+            return  # the parent closed the pipe or died
+        try:
+            reply = (OK, function(*args))
+        except MemoryError as e:
+            reply = (MEMORY, f"{type(e).__name__}: {e}")
+        except Exception as e:
+            reply = (ERROR, f"{type(e).__name__}: {e}")
+        try:
+            conn.send(reply)
+        except MemoryError as e:
+            conn.send((MEMORY, f"result too large to send: {e}"))
+
+
+class IsolatedWorker:
+    """A worker process that runs one call at a time under a wall-clock and a memory cap."""
+
+    def __init__(self, name, timeout=120, memory_mb=2048, start_method=None):
+        self.name = name
+        self.timeout = timeout
+        self.memory_bytes = int(memory_mb * 2 ** 20) if memory_mb else 0
+        # fork (where available) so the worker starts with the caller's modules already imported
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        self.process = None
+        self.conn = None
+        self.starts = 0
+        self.lock = threading.Lock()
+
+    def _start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_serve, args=(child_conn, self.memory_bytes),
+                                            name=f"{self.name}-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.starts += 1
+
+    def stop(self):
+        """Kill the worker (the next call starts a new one)."""
+        if self.process is None:
+            return
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.process = self.conn = None
+
+    def run(self, function, *args):
+        """Return function(*args) as computed by the worker. function must be importable by name."""
+        with self.lock:
+            if self.process is None or not self.process.is_alive():
+                self.stop()
+                self._start()
+            self.conn.send((function, args))
+            if not self.conn.poll(self.timeout):
+                self.stop()
+                raise IsolationTimeout(f"{self.name} did not finish within {self.timeout:.0f}s")
+            try:
+                status, value = self.conn.recv()
+            except (EOFError, OSError):
+                self.process.join(1)
+                exitcode = self.process.exitcode
+                self.stop()
+                raise IsolationCrashed(f"{self.name} worker died (exit code {exitcode})")
+            if status == MEMORY:
+                self.stop()  # its heap may be left fragmented near the cap
+                raise IsolationMemoryExceeded(f"{self.name} went over {self.memory_bytes // 2 ** 20}MB: {value}")
+            if status == ERROR:
+                raise IsolatedError(value)
+            return value
+
+
+class WorkProfile:
+    """Per-kind runs, bytes, seconds and outcomes of isolated calls."""
+
+    def __init__(self):
+        self.kinds = {}
+        self.lock = threading.Lock()
+
+    def record(self, kind, nbytes, seconds, outcome=OK):
+        with self.lock:
+            stats = self.kinds.setdefault(kind, {"runs": 0, "bytes": 0, "seconds": 0.0, "ok_bytes": 0,
+                                                 "ok_seconds": 0.0, OK: 0, ERROR: 0, TIMEOUT: 0, MEMORY: 0,
+                                                 CRASHED: 0})
+            stats["runs"] += 1
+            stats["bytes"] += nbytes
+            stats["seconds"] += seconds
+            stats[outcome] += 1
+            if outcome == OK:
+                stats["ok_bytes"] += nbytes
+                stats["ok_seconds"] += seconds
+
+    def summary(self) -> dict:
+        """{kind: {runs, mb, seconds, mb_per_s, failure_rate, errors, timeouts, memory, crashes}}."""
+        with self.lock:
+            kinds = {kind: dict(stats) for kind, stats in self.kinds.items()}
+        return {kind: {
+            "runs": stats["runs"],
+            "mb": stats["bytes"] / 1e6,
+            "seconds": stats["seconds"],
+            "mb_per_s": stats["ok_bytes"] / 1e6 / stats["ok_seconds"] if stats["ok_seconds"] else None,
+            "failure_rate": 1 - stats[OK] / stats["runs"],
+            "errors": stats[ERROR],
+            "timeouts": stats[TIMEOUT],
+            "memory": stats[MEMORY],
+            "crashes": stats[CRASHED],
+        } for kind, stats in sorted(kinds.items())}
+
+
+# Function to format a WorkProfile summary as a plain-text table
+def format_profile(summary: dict) -> str:
+    lines = [f"{'format':10s} {'runs':>6s} {'MB':>9s} {'seconds':>9s} {'MB/s':>8s} {'failed':>7s} "
+             f"{'errors':>6s} {'timeouts':>8s} {'memory':>6s} {'crashes':>7s}"]
+    for kind, stats in summary.items():
+        throughput = "-" if stats["mb_per_s"] is None else f"{stats['mb_per_s']:.2f}"
+        lines.append(f"{kind:10s} {stats['runs']:6d} {stats['mb']:9.2f} {stats['seconds']:9.2f} {throughput:>8s} "
+                     f"{stats['failure_rate']:7.1%} {stats['errors']:6d} {stats['timeouts']:8d} "
+                     f"{stats['memory']:6d} {stats['crashes']:7d}")
+    return "\n".join(lines)
@@ -1,18 +1,17 @@
 import streamlit as st
-import pandas as pd
-from Testing import testing_page
-from validation import validation_page
-from visualization import visualization_page
-from admin import admin_page
-from openai_utils import get_question_from_bigquery, get_openai_answer
 from dotenv import load_dotenv
 import os
 import uuid
-from google.cloud import bigquery
+import datetime
+from tracing import start_span, bind_attributes
+from cassette import install_from_env
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Record or replay the OpenAI, BigQuery and GCS calls when CASSETTE_MODE is set (cassette.py)
+install_from_env()
+
 # Ensure that the credentials environment variable is set
 credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 if not credentials_path:
@@ -23,6 +22,9 @@ project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
 userinfo_table = "UserInfo"  # Your BigQuery table
 
+# Pages are imported in main_page when first shown, and pandas and the BigQuery
+# client when first needed, so a new replica renders the login page quickly.
+
 # Hardcoded admin credentials
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123*"
@@ -79,13 +81,17 @@ def add_custom_css():
 # Function to fetch user login data from BigQuery
 def load_user_data_from_bigquery():
     """Load user data from the UserInfo table in BigQuery."""
+    import pandas as pd
+    from google.cloud import bigquery
+    from bigquery_reads import query_dataframe
     client = bigquery.Client(project=project_id)
     query = f"""
     SELECT email, password FROM `{project_id}.{dataset_id}.{userinfo_table}`
     """
     try:
-        query_job = client.query(query)
-        df = query_job.result().to_dataframe()
+        with start_span("bigquery.load_user_data") as span:
+            df = query_dataframe(client, query, name="main.load_user_data")
+            span.set_attribute("rows", len(df))
         return df
     except Exception as e:
         st.error(f"Error fetching data from BigQuery: {e}")
@@ -123,19 +129,21 @@ def admin_login():
             if admin_username == ADMIN_USERNAME and admin_password == ADMIN_PASSWORD:
                 st.success("Admin logged in successfully!")
                 st.session_state.page = 'admin_dashboard'
-                st.experimental_set_query_params(page='admin_dashboard')
+                st.query_params["page"] = 'admin_dashboard'
             else:
                 st.error("Invalid credentials. Please try again.")
 
 # Helper function to navigate between pages
 def navigate_to(page):
     st.session_state.page = page
-    st.experimental_set_query_params(page=page)
+    st.query_params["page"] = page
 
 # Function to generate and store a session_id after login/signup
 def generate_session_id():
     if 'session_id' not in st.session_state:
         st.session_state['session_id'] = str(uuid.uuid4())  # Generate a unique session_id
+        # Results of this session are written after this, so readers can skip older partitions
+        st.session_state['session_started'] = datetime.datetime.now(datetime.timezone.utc)
     return st.session_state['session_id']
 
 # Main page with user login, admin access, and page navigation
@@ -182,17 +190,28 @@ def main_page():
         signup_page()  # Call the signup page logic
 
     elif st.session_state.page == 'testing':
+        from Testing import testing_page
         testing_page()  # Call the function from Testing.py
 
     elif st.session_state.page == 'validation':
+        from validation import validation_page
         validation_page()  # Call the function from validation.py
 
     elif st.session_state.page == 'visualization':
+        from visualization import visualization_page
         visualization_page()  # Call the function from visualization.py
 
+    elif st.session_state.page == 'comparison':
+        from comparison import comparison_page
+        comparison_page()  # Call the function from comparison.py
+
     elif st.session_state.page == 'admin_dashboard':
+        from admin import admin_page
         admin_page()  # Call the function from admin.py
 
 # Main Entry Point
 if __name__ == "__main__":
-    main_page()
+    # Tag every span of this rerun with the user's session
+    bind_attributes(session_id=st.session_state.get('session_id'))
+    with start_span("page.rerun", page=st.session_state.get('page', 'login')):
+        main_page()
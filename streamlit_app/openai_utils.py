@@ -1,41 +1,114 @@
-import openai
-import tiktoken
+import itertools
 import os
-from google.cloud import bigquery
+import sys
+import time
+import threading
 from collections import OrderedDict
 from dotenv import load_dotenv
-from google.cloud import storage
+from tracing import start_span, new_span, end_span
+from gcs_cache import GCSFileCache
+from retrieval import relevant_excerpt
+from usage_ledger import UsageLedger
+from resilience import CircuitBreaker, HedgedCaller, UpstreamUnavailable
+from query_cost import guarded_query
 
 # Load .env file if present
 load_dotenv()
 
-# Set up OpenAI API Key from environment variable
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# OpenAI API Key from environment variable
+openai_api_key = os.getenv('OPENAI_API_KEY')
 
-if openai.api_key is None:
+if openai_api_key is None:
     raise EnvironmentError("OpenAI API key is not set in the environment.")
 
+# The OpenAI, BigQuery, GCS and tiktoken libraries are imported on first use rather
+# than here, so importing this module (and the pages using it) stays cheap.
+
+# OpenAI SDK, imported and configured on first use
+def get_openai():
+    import openai
+    openai.api_key = openai_api_key
+    return openai
+
 # Cache setup (FIFO)
 class FIFOCache:
     def __init__(self, capacity=10):
         self.cache = OrderedDict()
         self.capacity = capacity
+        self.lock = threading.Lock()  # answers may be generated from worker threads
 
     def get(self, key):
         return self.cache.get(key, None)
 
     def put(self, key, value):
-        if len(self.cache) >= self.capacity:
-            self.cache.popitem(last=False)  # FIFO removal
-        self.cache[key] = value
+        with self.lock:
+            if key not in self.cache and len(self.cache) >= self.capacity:
+                self.cache.popitem(last=False)  # FIFO removal
+            self.cache[key] = value
 
 cache = FIFOCache()
 
+# Token/cost ledger of every model call and cache hit (usage_ledger.py)
+usage_ledger = None
+
+# Shared usage ledger, created on first use
+def get_usage_ledger():
+    global usage_ledger
+    if usage_ledger is None:
+        usage_ledger = UsageLedger()
+    return usage_ledger
+
+# Function to record a model call or cache hit that started at `start` (perf_counter) in the usage ledger
+def record_usage(model, start, prompt_tokens=0, completion_tokens=0, cache="miss", source="chat",
+                 estimated=False, task_id=None):
+    get_usage_ledger().record(model, prompt_tokens, completion_tokens, (time.perf_counter() - start) * 1000,
+                              cache, source, estimated, task_id)
+
+# Timeouts, hedged requests and circuit breaker of the chat completion calls (resilience.py)
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+openai_callers = {}
+
+# Shared callers for complete and streamed responses, created on first use
+def get_openai_caller(stream=False):
+    """Streamed calls are hedged on the time to their first token; both share one circuit breaker."""
+    if not openai_callers:
+        breaker = CircuitBreaker("openai", int(os.getenv("OPENAI_BREAKER_FAILURES", "5")),
+                                 float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30")))
+        for streamed in (False, True):
+            openai_callers[streamed] = HedgedCaller(
+                "openai.stream" if streamed else "openai", timeout=OPENAI_TIMEOUT_SECONDS, hedge=OPENAI_HEDGE_ENABLED,
+                quantile=float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.95")),
+                min_delay=float(os.getenv("OPENAI_HEDGE_MIN_DELAY_SECONDS", "0.5")),
+                initial_delay=float(os.getenv("OPENAI_HEDGE_INITIAL_DELAY_SECONDS", "5")), breaker=breaker)
+    return openai_callers[stream]
+
+# Invalid or unauthorized requests are the caller's fault, not a sign of an unhealthy upstream
+def is_upstream_failure(error):
+    import openai
+    return not isinstance(error, (openai.error.InvalidRequestError, openai.error.AuthenticationError,
+                                  openai.error.PermissionError))
+
+# Semantic near-duplicate answer cache (semantic_cache.py), opt-in with SEMANTIC_CACHE_ENABLED
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+semantic_cache = None
+
+# Shared semantic cache, loaded from disk on first use; None when disabled
+def get_semantic_cache():
+    global semantic_cache
+    if semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+        from semantic_cache import SemanticAnswerCache
+        semantic_cache = SemanticAnswerCache()
+    return semantic_cache
+
 # Token management using cl100k_base for GPT-4 and GPT-3.5-turbo
 def get_token_count(text, model="gpt-4"):
     try:
-        enc = tiktoken.get_encoding("cl100k_base")
-        tokens = enc.encode(text)
+        with start_span("tiktoken.count", chars=len(text)) as span:
+            import tiktoken
+            enc = tiktoken.get_encoding("cl100k_base")
+            tokens = enc.encode(text)
+            span.set_attribute("tokens", len(tokens))
         return len(tokens), tokens
     except Exception as e:
         raise RuntimeError(f"Error while counting tokens: {e}")
@@ -47,6 +120,7 @@ table_id = os.getenv("TABLE_ID")
 
 # GCP BigQuery Data Retrieval
 def get_question_from_bigquery():
+    from google.cloud import bigquery
     client = bigquery.Client(project=project_id)
     query = f"""
     SELECT 
@@ -56,14 +130,16 @@ def get_question_from_bigquery():
     LIMIT 1
     """
     try:
-        query_job = client.query(query)
-        results = query_job.result()
+        with start_span("bigquery.get_question"):
+            query_job = guarded_query(client, "openai_utils.get_question", query)
+            results = query_job.result()
         for row in results:
             return row["question"], row["task_id"]
     except Exception as e:
         raise RuntimeError(f"Error retrieving question from BigQuery: {e}")
 
 def get_annotator_metadata_from_bigquery(task_id):
+    from google.cloud import bigquery
     client = bigquery.Client(project=project_id)
     query = f"""
     SELECT Annotator_Metadata, Number_of_tools, Tools, How_long_did_this_take,
@@ -78,8 +154,9 @@ def get_annotator_metadata_from_bigquery(task_id):
         ]
     )
     try:
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
+        with start_span("bigquery.get_annotator_metadata", task_id=task_id):
+            query_job = guarded_query(client, "openai_utils.get_annotator_metadata", query, job_config)
+            results = query_job.result()
         for row in results:
             return {
                 "annotator_metadata": row['Annotator_Metadata'],
@@ -94,57 +171,357 @@ def get_annotator_metadata_from_bigquery(task_id):
     except Exception as e:
         raise RuntimeError(f"Error retrieving metadata from BigQuery: {e}")
 
-# Function to read file content from Google Cloud Storage
-def read_gcs_file(gcs_file_path):
+# The attachment extractors live with the ingest scripts
+DATAFLOW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataflow')
+# Attachments the extractors can't read without their ingest dependencies, but that are already text
+PLAIN_TEXT_EXTENSIONS = ('.txt', '.csv', '.json', '.jsonld', '.xml', '.md', '.py', '.pdb')
+
+_storage_client = None
+gcs_cache = None
+
+# Shared storage client, created on first use
+def get_storage_client():
+    global _storage_client
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client()
+    return _storage_client
+
+# Shared attachment disk cache, created on first use
+def get_gcs_cache():
+    global gcs_cache
+    if gcs_cache is None:
+        gcs_cache = GCSFileCache()
+    return gcs_cache
+
+# Function to read raw file bytes from Google Cloud Storage, through the local disk cache
+def read_gcs_bytes(gcs_file_path):
     try:
-        client = storage.Client()
-        bucket_name, file_name = gcs_file_path.split("/", 1)
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(file_name)
-        return blob.download_as_text()
+        with start_span("gcs.read_file", gcs_file_path=gcs_file_path) as span:
+            bucket_name, file_name = gcs_file_path.removeprefix("gs://").split("/", 1)
+            blob = get_storage_client().bucket(bucket_name).blob(file_name)
+            data, cache_status = get_gcs_cache().get(blob)
+            span.set_attributes(bytes=len(data), cache=cache_status)
+        return data
     except Exception as e:
         raise RuntimeError(f"Error reading file from GCS: {e}")
 
-# OpenAI API call with chat-based model
-def get_openai_answer(question: str, context: str, gcs_file_path: str = None,
-                      temperature: float = 0.2, max_tokens: int = 150, top_p: float = 0.3) -> str:
-    if gcs_file_path:
-        # Check file type and read accordingly
-        if gcs_file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            return "Image files are not supported for text processing."
-        else:
-            gcs_content = read_gcs_file(gcs_file_path)
-            context = f"{gcs_content}\n{context}"
+# Function to read a text file from Google Cloud Storage
+def read_gcs_file(gcs_file_path):
+    return read_gcs_bytes(gcs_file_path).decode("utf-8")
 
-    prompt = f"Context:\n{context}\n\nQuestion: {question}"
+# Function to fetch the text extracted from an attachment by dataflow/DataFromFile.py
+def get_extracted_data_from_bigquery(gcs_file_path):
+    """Return (extractedData, extractedTokenCount), or (None, None) if nothing was stored."""
+    from google.cloud import bigquery
+    client = bigquery.Client(project=project_id)
+    query = f"""
+    SELECT extractedData, extractedTokenCount
+    FROM `{project_id}.{dataset_id}.{table_id}`
+    WHERE gcs_file_path = @gcs_file_path
+    LIMIT 1
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("gcs_file_path", "STRING", gcs_file_path)
+        ]
+    )
+    try:
+        with start_span("bigquery.get_extracted_data", gcs_file_path=gcs_file_path):
+            results = guarded_query(client, "openai_utils.get_extracted_data", query, job_config).result()
+        for row in results:
+            return row['extractedData'], row['extractedTokenCount']
+        return None, None
+    except Exception as e:
+        raise RuntimeError(f"Error retrieving extracted data from BigQuery: {e}")
+
+# Function to extract an attachment's text on demand with the ingest extractor registry
+def extract_gcs_attachment(gcs_file_path):
+    content = read_gcs_bytes(gcs_file_path)
+    extension = os.path.splitext(gcs_file_path)[1].lower()
+    if DATAFLOW_DIR not in sys.path:
+        sys.path.append(DATAFLOW_DIR)
+    try:
+        from extractors import EXTRACTORS, extract_text_isolated
+    except ImportError:
+        # Ingest dependencies (PyMuPDF, Vision, ...) are not installed: only plain text can be read
+        return content.decode("utf-8", errors="ignore") if extension in PLAIN_TEXT_EXTENSIONS else ""
+    if extension not in EXTRACTORS:
+        return ""
+    # As at ingest, in the extraction worker process under its time and memory caps, so an
+    # attachment that hangs or exhausts its parser gives no text instead of taking the app down
+    try:
+        _, text = extract_text_isolated(gcs_file_path, content)
+    except RuntimeError:
+        return ""  # the extractor could not read the file
+    return text
+
+# Attachment text for the prompt: the stored extraction, falling back to extracting it now
+def get_attachment_text(gcs_file_path):
+    """Return (text, token_count) for the attachment at gcs_file_path."""
+    with start_span("attachment.get_text", gcs_file_path=gcs_file_path) as span:
+        text, token_count = get_extracted_data_from_bigquery(gcs_file_path)
+        span.set_attribute("source", "stored" if text else "extracted")
+        if not text:
+            text, token_count = extract_gcs_attachment(gcs_file_path), None
+        if text and token_count is None:
+            token_count, _ = get_token_count(text)
+    return text or "", token_count or 0
+
+DEFAULT_MODEL = "gpt-4"
+PROMPT_TOKEN_LIMIT = 8192
+
+# Build the prompt sent to the model and count its tokens, prepending the attachment text when given
+def prepare_prompt(question: str, context: str, gcs_file_path: str = None, attachment=None):
+    """
+    Return (prompt, token_count); raises ValueError if the prompt exceeds the token limit.
+
+    `attachment` is an already loaded (text, token_count) pair; otherwise it is
+    looked up for gcs_file_path with get_attachment_text(). Only the chunks of
+    the attachment relevant to the question are kept. When it is used whole,
+    its stored token count is added to the count of the rest of the prompt
+    instead of tokenizing the attachment again.
+    """
+    if attachment is None and gcs_file_path:
+        attachment = get_attachment_text(gcs_file_path)
+    attachment_text, attachment_tokens = attachment or ("", 0)
+    if attachment_text:
+        excerpt = relevant_excerpt(question, attachment_text)
+        if len(excerpt) < len(attachment_text):
+            attachment_text, attachment_tokens = excerpt, get_token_count(excerpt)[0]
 
+    prompt = f"Context:\n{context}\n\nQuestion: {question}"
     token_count, _ = get_token_count(prompt)
-    if token_count > 8192:
+    if attachment_text:
+        prompt = f"Context:\n{attachment_text}\n{context}\n\nQuestion: {question}"
+        token_count += attachment_tokens
+
+    if token_count > PROMPT_TOKEN_LIMIT:
         raise ValueError("Prompt exceeds token limit.")
+    return prompt, token_count
+
+def build_prompt(question: str, context: str, gcs_file_path: str = None) -> str:
+    return prepare_prompt(question, context, gcs_file_path)[0]
+
+# Answers depend on the model and sampling parameters as well as the prompt
+def answer_cache_key(prompt: str, model: str, temperature: float, max_tokens: int, top_p: float):
+    return (model, temperature, max_tokens, top_p, prompt)
+
+# Context for a testing-page question: the question plus the relevant chunks of the text extracted from its attachment
+def build_task_context(question: str, extracted_data: str = None, extracted_index: str = None) -> str:
+    context = f"Question: {question}\n"
+    # A missing extraction reads from BigQuery as NaN (see bigquery_reads.string_dtype), which is truthy
+    if isinstance(extracted_data, str) and extracted_data:
+        context += f"Extracted Data: {relevant_excerpt(question, extracted_data, extracted_index)}\n"
+    return context
+
+# Chat messages sent for a prompt (shared by the live, streaming and batch paths)
+def chat_messages(prompt: str):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+# Look a prompt up in the semantic cache after an exact-cache miss
+def semantic_lookup(task_id: str, key: tuple, prompt: str):
+    """
+    Return (answer, match): answer is a near-duplicate's cached answer to serve (None otherwise),
+    match is passed to semantic_store once the model has answered (None when the cache is off).
+    Audited hits are returned with answer None so that the model is asked anyway.
+    """
+    semantic = get_semantic_cache() if task_id else None
+    if semantic is None:
+        return None, None
+    match = semantic.lookup(task_id, key[:-1], prompt)
+    if match.answer is not None and not semantic.should_audit():
+        return match.answer, match
+    return None, match
 
-    cached_answer = cache.get(prompt)
+# Store the model's answer in the semantic cache, checking it against an audited hit
+def semantic_store(task_id: str, key: tuple, match, answer: str):
+    if match is None or not answer:
+        return
+    if match.answer is not None:
+        semantic_cache.record_audit(task_id, match, answer)
+    semantic_cache.add(task_id, key[:-1], match, answer)
+
+# Single chat completion for an already built prompt, going through the answer caches
+def get_completion(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.2,
+                   max_tokens: int = 150, top_p: float = 0.3, task_id: str = None):
+    """
+    Return (answer, usage, cached); usage is the response's token usage dict ({} on a cache hit).
+
+    With a task_id, a near-duplicate prompt of the same task may be answered from the semantic cache.
+    Every call is recorded in the usage ledger, with the response's token usage.
+    """
+    start = time.perf_counter()
+    key = answer_cache_key(prompt, model, temperature, max_tokens, top_p)
+    cached_answer = cache.get(key)
     if cached_answer:
-        return cached_answer
+        record_usage(model, start, cache="exact", task_id=task_id)
+        return cached_answer, {}, True
+    semantic_answer, match = semantic_lookup(task_id, key, prompt)
+    if semantic_answer:
+        record_usage(model, start, cache="semantic", task_id=task_id)
+        return semantic_answer, {}, True
+
+    openai = get_openai()
+
+    # The usage of a hedged request that lost the race is billed all the same
+    def discard(response):
+        usage = response.get('usage') or {}
+        record_usage(model, start, usage.get('prompt_tokens'), usage.get('completion_tokens'), source="hedge",
+                     task_id=task_id)
 
     try:
+        with start_span("openai.chat_completion", model=model) as span:
+            response = get_openai_caller().call(
+                lambda: openai.ChatCompletion.create(
+                    model=model,
+                    messages=chat_messages(prompt),
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    request_timeout=OPENAI_TIMEOUT_SECONDS
+                ),
+                discard=discard, counts_as_failure=is_upstream_failure)
+            usage = dict(response.get('usage') or {})
+            span.set_attributes(prompt_tokens=usage.get('prompt_tokens'),
+                                completion_tokens=usage.get('completion_tokens'))
+        answer = response['choices'][0]['message']['content'].strip()
+        record_usage(model, start, usage.get('prompt_tokens'), usage.get('completion_tokens'), task_id=task_id)
+        cache.put(key, answer)
+        semantic_store(task_id, key, match, answer)
+        return answer, usage, False
+    except UpstreamUnavailable as e:
+        # While OpenAI is down, a near-duplicate's answer that was picked for an audit beats an error
+        if match is not None and match.answer is not None:
+            record_usage(model, start, cache="semantic", task_id=task_id)
+            return match.answer, {}, True
+        raise RuntimeError(f"Error generating answer from OpenAI: {e}")
+    except Exception as e:
+        raise RuntimeError(f"Error generating answer from OpenAI: {e}")
+
+# OpenAI API call with chat-based model
+def get_openai_answer(question: str, context: str, gcs_file_path: str = None,
+                      temperature: float = 0.2, max_tokens: int = 150, top_p: float = 0.3,
+                      model: str = DEFAULT_MODEL, task_id: str = None) -> str:
+    prompt = build_prompt(question, context, gcs_file_path)
+    answer, _, _ = get_completion(prompt, model, temperature, max_tokens, top_p, task_id)
+    return answer
+
+# Streaming variant of get_openai_answer: yields answer tokens as they arrive
+def stream_openai_answer(question: str, context: str, gcs_file_path: str = None,
+                         temperature: float = 0.2, max_tokens: int = 150, top_p: float = 0.3,
+                         stats: dict = None, model: str = DEFAULT_MODEL, task_id: str = None):
+    """
+    Yield the answer in chunks as the chat completion streams in.
+
+    The assembled answer is stored in the same caches as get_openai_answer. If a
+    `stats` dict is passed it is filled with `time_to_first_token` and
+    `total_time` (seconds) and `cached`, plus `similarity` when the answer came
+    from the semantic cache. Streamed responses have no usage block, so the
+    call is recorded in the usage ledger with tiktoken counts.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+
+    prompt, prompt_tokens = prepare_prompt(question, context, gcs_file_path)
+    key = answer_cache_key(prompt, model, temperature, max_tokens, top_p)
+
+    cached_answer = cache.get(key)
+    if cached_answer:
+        elapsed = time.perf_counter() - start
+        stats.update(time_to_first_token=elapsed, total_time=elapsed, cached=True)
+        record_usage(model, start, cache="exact", source="stream", task_id=task_id)
+        yield cached_answer
+        return
+
+    semantic_answer, match = semantic_lookup(task_id, key, prompt)
+    if semantic_answer:
+        elapsed = time.perf_counter() - start
+        stats.update(time_to_first_token=elapsed, total_time=elapsed, cached=True, similarity=match.similarity)
+        record_usage(model, start, cache="semantic", source="stream", task_id=task_id)
+        yield semantic_answer
+        return
+
+    openai = get_openai()
+
+    # Open the stream and read up to its first token, the part of the call that is hedged
+    def open_stream():
         response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            model=model,
+            messages=chat_messages(prompt),
             max_tokens=max_tokens,
             temperature=temperature,
-            top_p=top_p
+            top_p=top_p,
+            stream=True,
+            request_timeout=OPENAI_TIMEOUT_SECONDS
         )
-        answer = response['choices'][0]['message']['content'].strip()
-        cache.put(prompt, answer)
-        return answer
+        first_chunks = []
+        for chunk in response:
+            first_chunks.append(chunk)
+            if chunk['choices'][0].get('delta', {}).get('content'):
+                break
+        return response, first_chunks
+
+    # Close the stream of a hedged request that lost the race, recording what it was billed
+    def discard(opened):
+        response, first_chunks = opened
+        if hasattr(response, "close"):
+            response.close()
+        record_usage(model, start, prompt_tokens, len(first_chunks), source="hedge", estimated=True, task_id=task_id)
+
+    # The span is not made current because the caller runs between yields
+    span = new_span("openai.chat_completion_stream", model=model)
+    response = None
+    try:
+        response, first_chunks = get_openai_caller(stream=True).call(open_stream, discard=discard,
+                                                                      counts_as_failure=is_upstream_failure)
+        parts = []
+        for chunk in itertools.chain(first_chunks, response):
+            token = chunk['choices'][0].get('delta', {}).get('content')
+            if not token:
+                continue
+            if not parts:
+                stats['time_to_first_token'] = time.perf_counter() - start
+                span.set_attribute("time_to_first_token_ms", stats['time_to_first_token'] * 1000)
+            parts.append(token)
+            yield token
+        span.set_attribute("chunks", len(parts))
+    except UpstreamUnavailable as e:
+        span.record_exception(e)
+        if match is None or match.answer is None:
+            raise RuntimeError(f"Error generating answer from OpenAI: {e}")
+        parts = None  # serve the near-duplicate's answer that was picked for an audit, below
     except Exception as e:
+        span.record_exception(e)
+        if response is not None and is_upstream_failure(e):
+            get_openai_caller(stream=True).breaker.record_failure()  # the stream broke off after its first token
         raise RuntimeError(f"Error generating answer from OpenAI: {e}")
+    finally:
+        end_span(span)
+
+    if parts is None:
+        elapsed = time.perf_counter() - start
+        stats.update(time_to_first_token=elapsed, total_time=elapsed, cached=True, similarity=match.similarity)
+        record_usage(model, start, cache="semantic", source="stream", task_id=task_id)
+        yield match.answer
+        return
+
+    answer = "".join(parts).strip()
+    if not parts:
+        stats['time_to_first_token'] = time.perf_counter() - start
+    stats.update(total_time=time.perf_counter() - start, cached=False)
+    record_usage(model, start, prompt_tokens, get_token_count(answer)[0] if answer else 0, source="stream",
+                 estimated=True, task_id=task_id)
+    if answer:
+        cache.put(key, answer)
+        semantic_store(task_id, key, match, answer)
 
 # Function to update the TestcaseAnswer in BigQuery
 def update_testcase_answer_in_bigquery(task_id: str, validation_result: str):
+    from google.cloud import bigquery
     client = bigquery.Client(project=project_id)
     query = f"""
     UPDATE `{project_id}.{dataset_id}.{table_id}`
@@ -158,13 +535,15 @@ def update_testcase_answer_in_bigquery(task_id: str, validation_result: str):
         ]
     )
     try:
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for the query to finish
+        with start_span("bigquery.update_testcase_answer", task_id=task_id):
+            query_job = guarded_query(client, "openai_utils.update_testcase_answer", query, job_config)
+            query_job.result()  # Wait for the query to finish
     except Exception as e:
         raise RuntimeError(f"Error updating TestcaseAnswer in BigQuery: {e}")
 
 # Function to update the ValidationStepsAnswer in BigQuery
 def update_validation_steps_answer_in_bigquery(task_id: str, validation_result: str):
+    from google.cloud import bigquery
     client = bigquery.Client(project=project_id)
     query = f"""
     UPDATE `{project_id}.{dataset_id}.{table_id}`
@@ -178,8 +557,9 @@ def update_validation_steps_answer_in_bigquery(task_id: str, validation_result:
         ]
     )
     try:
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for the query to finish
+        with start_span("bigquery.update_validation_steps_answer", task_id=task_id):
+            query_job = guarded_query(client, "openai_utils.update_validation_steps_answer", query, job_config)
+            query_job.result()  # Wait for the query to finish
         print(f"Updated ValidationStepsAnswer for task_id {task_id} with {validation_result}")
     except Exception as e:
         raise RuntimeError(f"Error updating ValidationStepsAnswer in BigQuery: {e}")
@@ -0,0 +1,203 @@
+"""
+Bytes-scanned profiler and cost guard for BigQuery queries.
+
+Before a named query runs, `check_query` dry-runs it (free, and answered
+without reading any data) to get the bytes it would process, records the
+estimate, and raises QueryBudgetExceeded instead of running it when the
+estimate is over the query's budget. Budgets are BIGQUERY_BYTES_BUDGET
+(default 1 GB) for every query, with per-name overrides in
+BIGQUERY_BYTES_BUDGETS ("admin.load_results_data=5GB,main.load_user_data=200MB").
+With BIGQUERY_BUDGET_MODE=warn, queries over budget are reported on stderr
+and run anyway; with BIGQUERY_DRY_RUN=false the guard is off.
+
+Estimates are cached per query text for BIGQUERY_DRY_RUN_TTL_SECONDS
+(default 300), so a query asked again with other parameter values does not
+pay for another dry run. Every dry run is appended as a JSON line to
+BIGQUERY_COST_LOG, which `load_query_costs` and `top_offenders` summarize
+per query name; `python query_cost.py [log]` prints the top offenders.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from tracing import start_span
+
+DEFAULT_BUDGET_BYTES = 10 ** 9
+DEFAULT_COST_LOG = os.path.join(tempfile.gettempdir(), "model-evaluation-query-costs.jsonl")
+UNITS = {"": 1, "B": 1, "KB": 10 ** 3, "MB": 10 ** 6, "GB": 10 ** 9, "TB": 10 ** 12}
+
+DRY_RUN_ENABLED = os.getenv("BIGQUERY_DRY_RUN", "true").lower() in ("1", "true", "yes")
+BUDGET_MODE = os.getenv("BIGQUERY_BUDGET_MODE", "enforce").lower()
+DRY_RUN_TTL_SECONDS = float(os.getenv("BIGQUERY_DRY_RUN_TTL_SECONDS", "300"))
+COST_LOG = os.getenv("BIGQUERY_COST_LOG", DEFAULT_COST_LOG)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    def __init__(self, name, estimated_bytes, budget_bytes):
+        super().__init__(f"Query {name} would scan {format_bytes(estimated_bytes)}, over its budget of "
+                         f"{format_bytes(budget_bytes)} (set BIGQUERY_BYTES_BUDGETS to raise it)")
+        self.name = name
+        self.estimated_bytes = estimated_bytes
+        self.budget_bytes = budget_bytes
+
+
+# Function to parse a size such as "500MB", "1.5GB" or "1000000"
+def parse_bytes(size: str) -> int:
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", size.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(float(match.group(1)) * UNITS[match.group(2)])
+
+
+# Function to format a byte count for people
+def format_bytes(n: int) -> str:
+    for unit in ("TB", "GB", "MB", "KB"):
+        if n >= UNITS[unit]:
+            return f"{n / UNITS[unit]:.1f} {unit}"
+    return f"{n} B"
+
+
+# Function to read the per-query budgets from the environment
+def load_budgets():
+    """Return (default budget, {query name: budget}) in bytes."""
+    default = parse_bytes(os.getenv("BIGQUERY_BYTES_BUDGET", str(DEFAULT_BUDGET_BYTES)))
+    budgets = {}
+    for item in filter(None, os.getenv("BIGQUERY_BYTES_BUDGETS", "").split(",")):
+        name, _, size = item.partition("=")
+        budgets[name.strip()] = parse_bytes(size)
+    return default, budgets
+
+
+_estimates = {}  # (name, query) -> (bytes, monotonic time of the dry run)
+_estimates_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+# Function to dry-run a query and return the bytes it would process
+def estimate_bytes(client, query: str, job_config=None) -> int:
+    from google.cloud import bigquery
+
+    dry_run_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False,
+                                             query_parameters=list(getattr(job_config, "query_parameters", None) or []))
+    return int(client.query(query, job_config=dry_run_config).total_bytes_processed or 0)
+
+
+# Function to append one dry run to the cost log
+def record_estimate(name: str, query: str, estimated_bytes: int, budget_bytes: int):
+    entry = {"ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"), "name": name,
+             "bytes": estimated_bytes, "budget": budget_bytes, "over_budget": estimated_bytes > budget_bytes,
+             "query_hash": hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]}
+    try:
+        with _log_lock, open(COST_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"Could not record the cost of query {name}: {e}", file=sys.stderr)
+
+
+# Function to check a named query against its budget before it runs
+def check_query(client, name: str, query: str, job_config=None):
+    """
+    Return the estimated bytes of the query (None if the guard is off or the dry run failed).
+    Raises QueryBudgetExceeded if the estimate is over the query's budget and BUDGET_MODE is "enforce".
+    """
+    if not DRY_RUN_ENABLED:
+        return None
+    default_budget, budgets = load_budgets()
+    budget = budgets.get(name, default_budget)
+    key = (name, query)
+    with _estimates_lock:
+        cached = _estimates.get(key)
+    if cached and time.monotonic() - cached[1] < DRY_RUN_TTL_SECONDS:
+        estimated = cached[0]
+    else:
+        try:
+            with start_span("bigquery.dry_run", query_name=name) as span:
+                estimated = estimate_bytes(client, query, job_config)
+                span.set_attributes(bytes=estimated, budget=budget)
+        except Exception as e:
+            # The profiler must not take the query down with it
+            print(f"Dry run of query {name} failed, running it unchecked: {e}", file=sys.stderr)
+            return None
+        with _estimates_lock:
+            _estimates[key] = (estimated, time.monotonic())
+        record_estimate(name, query, estimated, budget)
+    if estimated > budget:
+        if BUDGET_MODE == "enforce":
+            raise QueryBudgetExceeded(name, estimated, budget)
+        print(f"Query {name} scans {format_bytes(estimated)}, over its budget of {format_bytes(budget)}",
+              file=sys.stderr)
+    return estimated
+
+
+# Function to run a named query after checking it against its budget
+def guarded_query(client, name: str, query: str, job_config=None):
+    check_query(client, name, query, job_config)
+    return client.query(query, job_config=job_config)
+
+
+# Function to load the dry runs recorded in the cost log
+def load_query_costs(path=None):
+    import pandas as pd
+
+    path = path or COST_LOG
+    rows = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # a line still being written
+    return pd.DataFrame(rows, columns=["ts", "name", "bytes", "budget", "over_budget", "query_hash"])
+
+
+# Function to rank the named queries by the bytes they scan
+def top_offenders(df, n: int = 10):
+    """
+    One row per query name: dry runs, latest/max bytes, budget and the share of it used,
+    whether it was ever over budget, and the growth from its first to its latest estimate.
+    """
+    import pandas as pd
+
+    if df.empty:
+        return pd.DataFrame(columns=["name", "dry_runs", "latest_bytes", "max_bytes", "budget",
+                                     "budget_used", "over_budget", "growth"])
+    grouped = df.sort_values("ts").groupby("name")
+    summary = pd.DataFrame({
+        "dry_runs": grouped.size(),
+        "latest_bytes": grouped["bytes"].last(),
+        "max_bytes": grouped["bytes"].max(),
+        "budget": grouped["budget"].last(),
+        "over_budget": grouped["over_budget"].any(),
+        "growth": grouped["bytes"].last() / grouped["bytes"].first().where(lambda first: first > 0),
+    })
+    summary["budget_used"] = summary["latest_bytes"] / summary["budget"]
+    columns = ["dry_runs", "latest_bytes", "max_bytes", "budget", "budget_used", "over_budget", "growth"]
+    return summary[columns].sort_values("latest_bytes", ascending=False).head(n).reset_index()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the queries scanning the most bytes, from the cost log.")
+    parser.add_argument("path", nargs="?", default=COST_LOG)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+    summary = top_offenders(load_query_costs(args.path), args.top)
+    if summary.empty:
+        print(f"No dry runs recorded in {args.path}")
+        return
+    for row in summary.itertuples(index=False):
+        growth = "" if row.growth != row.growth else f"  x{row.growth:.2f} since first"
+        print(f"{row.name:40s} {format_bytes(row.latest_bytes):>10s}  {row.budget_used:6.1%} of "
+              f"{format_bytes(row.budget):>8s}{'  OVER BUDGET' if row.over_budget else ''}{growth}")
+
+
+if __name__ == "__main__":
+    main()
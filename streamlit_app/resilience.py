@@ -0,0 +1,230 @@
+"""
+Per-call timeouts, hedged requests and a circuit breaker for upstream calls.
+
+`HedgedCaller.call(attempt)` runs attempt() on a worker thread and waits for
+it. If it has not returned after the hedge delay, a second identical
+attempt is started and whichever returns first wins. The hedge delay is the
+`quantile` (p95) of the latencies of recent attempts, at least `min_delay`;
+`initial_delay` is used until `MIN_SAMPLES` attempts have been timed. So
+about one call in twenty is duplicated, and those are the calls stuck in
+the tail. The client can't interrupt a request in flight, so the losing
+attempt is left to finish on its worker (the attempt should carry its own
+request timeout) and its result is then passed to `discard` (to close a
+stream, or record its usage), as is any result still queued when the call
+returns or gives up. A call without a result after `timeout` seconds raises
+UpstreamTimeout. At most `max_workers` attempts are in flight: no hedge is
+sent when the workers are all busy, and a call that finds them all busy
+(with attempts a hung upstream has not answered) fails at once with
+UpstreamUnavailable.
+
+The caller's CircuitBreaker counts consecutive failed calls. After
+`failures` of them it opens, and calls fail at once with CircuitOpenError
+for `reset_seconds`. Then one probe call is let through (half-open); its
+success closes the breaker and its failure opens it again.
+"""
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import start_span
+
+MIN_SAMPLES = 20
+
+
+class UpstreamUnavailable(RuntimeError):
+    """The upstream did not answer: the call timed out, the circuit breaker is open or every worker is busy."""
+
+
+class UpstreamTimeout(UpstreamUnavailable):
+    pass
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit breaker open), retrying in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class LatencyTracker:
+    """Latencies (seconds) of the last `window` attempts."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q):
+        """The q-quantile of the window, or None with fewer than MIN_SAMPLES samples."""
+        with self.lock:
+            samples = sorted(self.samples)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failures=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may be made now."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == self.OPEN and retry_in <= 0:
+                self.state = self.HALF_OPEN  # let this call through as the probe
+                return
+            raise CircuitOpenError(self.name, max(retry_in, 0))
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class HedgedCaller:
+    """Calls an upstream with a timeout, a hedged second attempt and a circuit breaker."""
+
+    def __init__(self, name, timeout=30, hedge=True, quantile=0.95, min_delay=0.5, initial_delay=5,
+                 breaker_failures=5, breaker_reset_seconds=30, breaker=None, max_workers=64):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.latencies = LatencyTracker()
+        self.breaker = breaker or CircuitBreaker(name, breaker_failures, breaker_reset_seconds)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+
+    def _reserve_worker(self):
+        """Count one more attempt in flight, or return False if every worker is busy."""
+        with self.in_flight_lock:
+            if self.in_flight >= self.max_workers:
+                return False
+            self.in_flight += 1
+            return True
+
+    def _release_worker(self):
+        with self.in_flight_lock:
+            self.in_flight -= 1
+
+    def hedge_delay(self):
+        delay = self.latencies.quantile(self.quantile)
+        delay = self.initial_delay if delay is None else max(delay, self.min_delay)
+        return min(delay, self.timeout)
+
+    def call(self, attempt, discard=None, counts_as_failure=None):
+        """
+        Return the result of the first attempt() to succeed. Raises CircuitOpenError while the
+        breaker is open, UpstreamTimeout after `timeout` seconds, and the last attempt's exception
+        if every attempt failed. Exceptions for which counts_as_failure returns False (invalid
+        requests) don't count towards opening the breaker.
+        """
+        self.breaker.allow()
+        if not self._reserve_worker():
+            raise UpstreamUnavailable(f"{self.name} has {self.max_workers} attempts in flight already")
+        results = queue.Queue()
+        state = {"winner": None, "abandoned": False}
+        lock = threading.Lock()
+
+        def run(index):
+            try:
+                start = time.monotonic()
+                try:
+                    result = attempt()
+                except Exception as e:
+                    results.put((index, None, e))
+                    return
+                self.latencies.add(time.monotonic() - start)
+                with lock:
+                    won = state["winner"] is None and not state["abandoned"]
+                    if won:
+                        state["winner"] = index
+                if won:
+                    results.put((index, result, None))
+                elif discard is not None:
+                    discard(result)
+            finally:
+                self._release_worker()
+
+        def launch(index):
+            # Each attempt runs in a copy of the caller's context, so its spans and bound attributes carry over
+            self.executor.submit(contextvars.copy_context().run, run, index)
+
+        def abandon():
+            # No attempt can win after this; a result queued before it (one that finished
+            # as the call gave up or lost the race) is discarded like a late one
+            with lock:
+                state["abandoned"] = True
+            while True:
+                try:
+                    _, result, error = results.get_nowait()
+                except queue.Empty:
+                    return
+                if error is None and discard is not None:
+                    discard(result)
+
+        with start_span(f"{self.name}.call") as span:
+            start = time.monotonic()
+            deadline = start + self.timeout
+            hedge_at = start + self.hedge_delay() if self.hedge else None
+            launch(0)
+            launched, errors = 1, []
+            while True:
+                wait_until = min(deadline, hedge_at) if launched == 1 and hedge_at else deadline
+                try:
+                    index, result, error = results.get(timeout=max(wait_until - time.monotonic(), 0))
+                except queue.Empty:
+                    if time.monotonic() < deadline:
+                        if launched == 1:
+                            if self._reserve_worker():
+                                launch(1)
+                                launched = 2
+                            else:
+                                hedge_at = None  # every worker is busy: wait for the first attempt alone
+                                span.set_attribute("hedge_skipped", True)
+                        continue
+                    abandon()
+                    self.breaker.record_failure()
+                    span.set_attributes(attempts=launched, outcome="timeout")
+                    raise UpstreamTimeout(f"{self.name} did not answer within {self.timeout:.0f}s")
+                if error is None:
+                    abandon()
+                    self.breaker.record_success()
+                    span.set_attributes(attempts=launched, winner=index, outcome="ok")
+                    return result
+                errors.append(error)
+                if len(errors) == launched:
+                    abandon()
+                    if counts_as_failure is None or counts_as_failure(error):
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()  # the upstream answered, if only to reject the request
+                    span.set_attributes(attempts=launched, outcome="error")
+                    raise error
@@ -0,0 +1,260 @@
+"""
+Schema and migration for the results tables.
+
+evaluationEvents (the append-only result log, see evaluation_events.py),
+enrichedMetadata and enrichedMetadataComparison are partitioned by day on
+resultAt, the time a result was written, and clustered by sessionId,
+task_id and model. The visualization page then only reads the partitions
+written since its session started and the blocks of that session, and the
+admin page only the last RESULTS_LOOKBACK_DAYS days, instead of the whole
+history. `migrate` also (re)creates the enrichedMetadataLatest view with the
+latest state per session and task.
+
+BigQuery cannot re-partition an existing table, so `migrate` copies it into
+a partitioned, clustered table with CREATE TABLE ... AS SELECT, checks that
+the row counts match and swaps the names, keeping the original table as
+<table>_backup_<YYYYMMDD>. Columns the old table lacks are added as NULL,
+and existing rows get the migration time as their resultAt.
+
+`backfill-events` copies the results already in enrichedMetadata into the
+event log once, so sessions from before the event log keep their results.
+
+Usage:
+    python results_schema.py status
+    python results_schema.py migrate [--table enrichedMetadata] [--dry-run]
+    python results_schema.py backfill-events [--dry-run]
+"""
+import argparse
+import datetime
+import os
+
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+from dotenv import load_dotenv
+from evaluation_events import EVENTS_TABLE, LATEST_RESULTS_VIEW, latest_results_query
+
+# Load environment variables
+load_dotenv()
+
+# BigQuery project details
+project_id = os.getenv("PROJECT_ID")
+dataset_id = os.getenv("DATASET_ID")
+
+PARTITION_FIELD = "resultAt"
+CLUSTERING_FIELDS = ["sessionId", "task_id", "model"]
+
+# Window the admin page reads, and the visualization page when its session start is unknown
+RESULTS_LOOKBACK_DAYS = int(os.getenv("RESULTS_LOOKBACK_DAYS", "30"))
+
+# Schema types whose GoogleSQL name differs, for CAST(NULL AS ...)
+SQL_TYPES = {'INTEGER': 'INT64', 'FLOAT': 'FLOAT64', 'BOOLEAN': 'BOOL'}
+
+# Table name -> schema, in the field-dict layout BigQuery's API uses
+RESULTS_TABLES = {
+    EVENTS_TABLE: {
+        'fields': [
+            {'name': 'eventId', 'type': 'STRING', 'mode': 'REQUIRED'},
+            {'name': 'task_id', 'type': 'STRING', 'mode': 'REQUIRED'},
+            {'name': 'sessionId', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'model', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'stage', 'type': 'STRING', 'mode': 'REQUIRED'},
+            {'name': 'answer', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'result', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'resultAt', 'type': 'TIMESTAMP', 'mode': 'REQUIRED'},
+        ]
+    },
+    "enrichedMetadata": {
+        'fields': [
+            {'name': 'task_id', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'sessionId', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'model', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'GeneratedAnswer', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'questionResult', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'StepsGeneratedAnswer', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'stepsResult', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'resultAt', 'type': 'TIMESTAMP', 'mode': 'NULLABLE'},
+        ]
+    },
+    "enrichedMetadataComparison": {
+        'fields': [
+            {'name': 'task_id', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'sessionId', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'model', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'temperature', 'type': 'FLOAT', 'mode': 'NULLABLE'},
+            {'name': 'max_tokens', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+            {'name': 'top_p', 'type': 'FLOAT', 'mode': 'NULLABLE'},
+            {'name': 'GeneratedAnswer', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'questionResult', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'latency_ms', 'type': 'FLOAT', 'mode': 'NULLABLE'},
+            {'name': 'prompt_tokens', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+            {'name': 'completion_tokens', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+            {'name': 'cost_usd', 'type': 'FLOAT', 'mode': 'NULLABLE'},
+            {'name': 'error', 'type': 'STRING', 'mode': 'NULLABLE'},
+            {'name': 'resultAt', 'type': 'TIMESTAMP', 'mode': 'NULLABLE'},
+        ]
+    },
+}
+
+# Function to build the fully qualified name of a table
+def table_ref(name: str) -> str:
+    return f"{project_id}.{dataset_id}.{name}"
+
+# Function to check whether a table already has the results layout
+def has_results_layout(table: bigquery.Table) -> bool:
+    partitioning = table.time_partitioning
+    return (partitioning is not None and partitioning.field == PARTITION_FIELD
+            and partitioning.type_ == bigquery.TimePartitioningType.DAY
+            and list(table.clustering_fields or []) == CLUSTERING_FIELDS)
+
+# Function to create a results table with its partitioning and clustering
+def create_results_table(client: bigquery.Client, name: str) -> bigquery.Table:
+    schema = [bigquery.SchemaField.from_api_repr(field) for field in RESULTS_TABLES[name]['fields']]
+    table = bigquery.Table(table_ref(name), schema=schema)
+    table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY,
+                                                        field=PARTITION_FIELD)
+    table.clustering_fields = CLUSTERING_FIELDS
+    return client.create_table(table)
+
+# Function to build the SELECT list copying an existing table into the results schema
+def migration_select_list(existing: bigquery.Table, name: str) -> str:
+    """Keep every existing column, add missing schema columns as NULL and fill resultAt."""
+    existing_names = {field.name for field in existing.schema}
+    columns = []
+    for field in existing.schema:
+        if field.name == PARTITION_FIELD:
+            columns.append(f"COALESCE(`{field.name}`, CURRENT_TIMESTAMP()) AS `{field.name}`")
+        else:
+            columns.append(f"`{field.name}`")
+    for field in RESULTS_TABLES[name]['fields']:
+        if field['name'] in existing_names:
+            continue
+        if field['name'] == PARTITION_FIELD:
+            columns.append(f"CURRENT_TIMESTAMP() AS `{PARTITION_FIELD}`")
+        else:
+            columns.append(f"CAST(NULL AS {SQL_TYPES.get(field['type'], field['type'])}) AS `{field['name']}`")
+    return ",\n        ".join(columns)
+
+# Function to count the rows of a table, including any still in the streaming buffer
+def count_rows(client: bigquery.Client, name: str) -> int:
+    rows = client.query(f"SELECT COUNT(*) AS n FROM `{table_ref(name)}`").result()
+    return next(iter(rows))["n"]
+
+# Function to migrate one table to the partitioned and clustered layout
+def migrate_results_table(client: bigquery.Client, name: str, dry_run: bool = False) -> str:
+    """Create, copy-and-swap or leave the table alone; return a one-line summary."""
+    try:
+        existing = client.get_table(table_ref(name))
+    except NotFound:
+        existing = None
+    if existing is None:
+        if dry_run:
+            return f"{name}: would be created"
+        create_results_table(client, name)
+        return f"{name}: created"
+    if has_results_layout(existing):
+        return f"{name}: already partitioned by {PARTITION_FIELD} and clustered by {', '.join(CLUSTERING_FIELDS)}"
+
+    staging = f"{name}_migrating"
+    backup = f"{name}_backup_{datetime.date.today():%Y%m%d}"
+    statements = [
+        f"""
+        CREATE TABLE `{table_ref(staging)}`
+        PARTITION BY DATE({PARTITION_FIELD})
+        CLUSTER BY {', '.join(CLUSTERING_FIELDS)}
+        AS SELECT
+        {migration_select_list(existing, name)}
+        FROM `{table_ref(name)}`
+        """,
+        f"ALTER TABLE `{table_ref(name)}` RENAME TO `{backup}`",
+        f"ALTER TABLE `{table_ref(staging)}` RENAME TO `{name}`",
+    ]
+    if dry_run:
+        return f"{name}: would run\n" + ";\n".join(s.strip() for s in statements)
+
+    try:
+        expected = count_rows(client, name)
+        client.query(statements[0]).result()
+        copied = count_rows(client, staging)
+        if copied != expected:
+            raise RuntimeError(f"copied {copied} of {expected} rows; {staging} left in place for inspection")
+        for statement in statements[1:]:
+            client.query(statement).result()
+    except Exception as e:
+        raise RuntimeError(f"Error migrating {name}: {e}")
+    return f"{name}: migrated {copied} rows; previous table kept as {backup}"
+
+# Function to create or replace the view with the latest state per session and task
+def create_latest_results_view(client: bigquery.Client, dry_run: bool = False) -> str:
+    statement = f"CREATE OR REPLACE VIEW `{table_ref(LATEST_RESULTS_VIEW)}` AS {latest_results_query()}"
+    if dry_run:
+        return f"{LATEST_RESULTS_VIEW}: would run\n{statement.strip()}"
+    try:
+        client.query(statement).result()
+    except Exception as e:
+        raise RuntimeError(f"Error creating view {LATEST_RESULTS_VIEW}: {e}")
+    return f"{LATEST_RESULTS_VIEW}: created or replaced"
+
+# Function to copy the results stored in enrichedMetadata into the event log
+def backfill_events(client: bigquery.Client, dry_run: bool = False) -> str:
+    """Turn each enrichedMetadata row into a question event and a steps event, at its resultAt."""
+    source = table_ref("enrichedMetadata")
+    selects = [
+        f"""
+        SELECT GENERATE_UUID() AS eventId, task_id, sessionId, model, '{stage}' AS stage,
+            {answer} AS answer, {result} AS result, COALESCE(resultAt, CURRENT_TIMESTAMP()) AS resultAt
+        FROM `{source}`
+        WHERE task_id IS NOT NULL AND ({answer} IS NOT NULL OR {result} IS NOT NULL)
+        """
+        for stage, answer, result in [("question", "GeneratedAnswer", "questionResult"),
+                                      ("steps", "StepsGeneratedAnswer", "stepsResult")]
+    ]
+    columns = "eventId, task_id, sessionId, model, stage, answer, result, resultAt"
+    statement = f"INSERT INTO `{table_ref(EVENTS_TABLE)}` ({columns})" + "UNION ALL".join(selects)
+    if dry_run:
+        return f"{EVENTS_TABLE}: would run\n{statement.strip()}"
+    try:
+        job = client.query(statement)
+        job.result()
+    except Exception as e:
+        raise RuntimeError(f"Error backfilling {EVENTS_TABLE} from enrichedMetadata: {e}")
+    return f"{EVENTS_TABLE}: backfilled {job.num_dml_affected_rows} events from enrichedMetadata"
+
+# Function to describe the layout of every results table
+def results_tables_status(client: bigquery.Client) -> list:
+    lines = []
+    for name in RESULTS_TABLES:
+        try:
+            table = client.get_table(table_ref(name))
+        except NotFound:
+            lines.append(f"{name}: missing")
+            continue
+        partitioning = table.time_partitioning
+        partitioned = f"partitioned by {partitioning.field or '_PARTITIONTIME'}" if partitioning else "not partitioned"
+        clustered = f"clustered by {', '.join(table.clustering_fields)}" if table.clustering_fields else "not clustered"
+        state = "up to date" if has_results_layout(table) else "needs migration"
+        lines.append(f"{name}: {table.num_rows} rows, {partitioned}, {clustered} ({state})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "migrate", "backfill-events"])
+    parser.add_argument("--table", choices=list(RESULTS_TABLES), help="Only this table (default: all).")
+    parser.add_argument("--dry-run", action="store_true", help="Print the statements without running them.")
+    args = parser.parse_args(argv)
+
+    client = bigquery.Client(project=project_id)
+    if args.command == "status":
+        print("\n".join(results_tables_status(client)))
+        return
+    if args.command == "backfill-events":
+        print(backfill_events(client, args.dry_run))
+        return
+    for name in [args.table] if args.table else RESULTS_TABLES:
+        print(migrate_results_table(client, name, args.dry_run))
+    if args.table in (None, EVENTS_TABLE):
+        print(create_latest_results_view(client, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+BM25 retrieval over attachment text.
+
+Attachment text (extractedData) used to be put in the prompt whole. Instead
+it is cut into chunks of about CHUNK_WORDS words (whole lines where
+possible, so spreadsheet rows stay together), and only the chunks most
+relevant to the question go into the prompt. Those are the first chunk
+(titles, column headers) plus the best BM25 matches, in document order
+(topped up with the following chunks if too few match).
+Text of at most RETRIEVAL_TOP_K chunks is used whole.
+
+dataflow/DataFromFile.py builds the index at ingest time and stores it as
+JSON in extractedIndex next to extractedData: chunk character spans into
+the text, chunk lengths and the postings. When no stored index matches
+the text, one is built on the spot. Parsed and built indexes are kept in
+a small in-process LRU cache, keyed by a SHA-256 digest of the text (the
+cache holds only indexes, not the texts, and a hit costs one hash of the text).
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from tracing import start_span
+
+CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "120"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+CHUNK_SEPARATOR = "\n...\n"
+INDEX_CACHE_ENTRIES = 256
+
+TERM_PATTERN = re.compile(r"\w+")
+LINE_PATTERN = re.compile(r"[^\n]+")
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def _terms(text):
+    return TERM_PATTERN.findall(text.lower())
+
+
+# Function to cut text into chunks of about CHUNK_WORDS words, returned as (start, end) character spans
+def chunk_spans(text: str, chunk_words: int = CHUNK_WORDS) -> list:
+    spans, start, end, words = [], None, None, 0
+    for line in LINE_PATTERN.finditer(text):
+        line_words = [(m.start(), m.end()) for m in WORD_PATTERN.finditer(text, line.start(), line.end())]
+        if not line_words:
+            continue
+        if words and words + len(line_words) > chunk_words:
+            spans.append((start, end))
+            start, words = None, 0
+        # A line longer than a chunk is split into word windows
+        for i in range(0, len(line_words), chunk_words):
+            window = line_words[i:i + chunk_words]
+            if start is None:
+                start = window[0][0]
+            end, words = window[-1][1], words + len(window)
+            if words >= chunk_words:
+                spans.append((start, end))
+                start, words = None, 0
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+
+# Function to build the BM25 index of a text
+def build_index(text: str, chunk_words: int = CHUNK_WORDS) -> dict:
+    """Return {"version", "chars", "spans", "lengths", "postings": {term: [[chunk, tf], ...]}}."""
+    spans = chunk_spans(text, chunk_words)
+    lengths, postings = [], {}
+    for chunk, (start, end) in enumerate(spans):
+        counts = Counter(_terms(text[start:end]))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append([chunk, tf])
+    return {"version": INDEX_VERSION, "chars": len(text), "spans": spans, "lengths": lengths, "postings": postings}
+
+
+def index_to_json(index: dict) -> str:
+    return json.dumps(index, separators=(",", ":"))
+
+
+# Function to rank a text's chunks against a query
+def search(index: dict, query: str, top_k: int = RETRIEVAL_TOP_K) -> list:
+    """Return the indices of the top_k chunks by BM25 score (only chunks matching at least one term)."""
+    n = len(index["lengths"])
+    if n == 0:
+        return []
+    average_length = (sum(index["lengths"]) / n) or 1.0
+    scores = {}
+    for term in set(_terms(query)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk, tf in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * index["lengths"][chunk] / average_length)
+            scores[chunk] = scores.get(chunk, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+# Function to get a text's index: the stored one if it matches the text, else one built now (cached either way)
+def get_index(text: str, stored_index: str = None) -> dict:
+    key = hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    index = None
+    if isinstance(stored_index, str):
+        try:
+            index = json.loads(stored_index)
+            if index.get("version") != INDEX_VERSION or index.get("chars") != len(text):
+                index = None  # stale: the text was re-extracted or truncated since
+        except (ValueError, AttributeError):
+            index = None
+    if index is None:
+        index = build_index(text)
+
+    with _index_cache_lock:
+        _index_cache[key] = index
+        if len(_index_cache) > INDEX_CACHE_ENTRIES:
+            _index_cache.popitem(last=False)
+    return index
+
+
+# Function to cut attachment text down to the chunks relevant to the question
+def relevant_excerpt(question: str, text: str, stored_index: str = None, top_k: int = RETRIEVAL_TOP_K) -> str:
+    """Return the first chunk and the best-matching chunks of text in document order (text itself if short)."""
+    if not isinstance(text, str) or not text or top_k <= 0:
+        return text
+    with start_span("retrieval.excerpt", chars=len(text)) as span:
+        index = get_index(text, stored_index)
+        spans = index["spans"]
+        if len(spans) <= top_k:
+            span.set_attribute("chunks", len(spans))
+            return text
+        chunks = {0}
+        # Best matches first; if too few chunks match, fill up from the start of the text
+        for chunk in search(index, question, top_k) + list(range(1, len(spans))):
+            if len(chunks) == top_k:
+                break
+            chunks.add(chunk)
+        excerpt = CHUNK_SEPARATOR.join(text[spans[c][0]:spans[c][1]] for c in sorted(chunks))
+        span.set_attributes(chunks=len(spans), selected=len(chunks), excerpt_chars=len(excerpt))
+    return excerpt
@@ -0,0 +1,183 @@
+"""
+GAIA-style answer scoring.
+
+Generated answers are free text, so an answer is scored correct when the
+expected answer appears in it after normalization:
+
+- numbers are compared as whole numeric tokens in canonical form
+  ("1,000" == "1000.00", "$5" == "5"), so "17" no longer matches "170";
+- lists ("a, b; c") are split and every item must appear;
+- everything else must appear as a whole word/phrase, ignoring case,
+  punctuation and whitespace differences.
+
+score_answers() works a column at a time: pandas string ops normalize the
+answers (in pyarrow for Arrow-backed strings) and one numpy string ufunc does
+the containment checks. score_answer() applies the same rules to a single pair
+with re, for the pages.
+"""
+import re
+import string
+
+import numpy as np
+import pandas as pd
+
+# Punctuation that never belongs to a token; ".", "," and "-" depend on context (numbers)
+PUNCTUATION = "".join(c for c in string.punctuation + "“”‘’–—…«»·•" if c not in ".,-")
+THOUSANDS_SEPARATOR = r",(?<=\d,)(?=\d{3}(?!\d))"
+NUMERIC_ANSWER_PATTERN = r"^\s*[$€£]?\s*-?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?\s*%?\s*$"
+NUMBER_SYMBOLS_PATTERN = r"[$€£%,\s]"
+LIST_SEPARATOR_PATTERN = r"\s*[,;]\s*"
+# Decimal points and minus signs are swapped for marks while the rest of the punctuation is dropped
+DECIMAL_POINT, MINUS_SIGN = "\x00", "\x01"
+
+# Normalization steps shared by the column and the single-case path, in order.
+# None has a lookaround, so they run in pyarrow for Arrow-backed strings (the
+# thousands separator pattern falls back to Python's re, and only runs on the
+# rows with one). The decimal point pattern runs twice: a match consumes the
+# digit after the point, so the second point of "1.2.3" is only marked by the second pass.
+NORMALIZATION_STEPS = [
+    (r"(\d)\.(\d)", r"\1" + DECIMAL_POINT + r"\2"),
+    (r"(\d)\.(\d)", r"\1" + DECIMAL_POINT + r"\2"),
+    (r"(^|\W)-(\d)", r"\1" + MINUS_SIGN + r"\2"),
+    ("[" + re.escape(PUNCTUATION) + ".,-]+", " "),
+    (r"\s\s+|[\t\n\r\f\v]", " "),
+]
+# Trailing zeros of decimals are insignificant ("3.50" -> "3.5", "2.0" -> "2")
+CANONICAL_NUMBER_STEPS = [(r"(\d)\.0+\b", r"\1"), (r"(\.\d*?[1-9])0+\b", r"\1")]
+# Expected numbers are canonicalized as text, never through floats, so integers past 2**53 keep their digits.
+# They are zero-padded first, then lose the padding and leading zeros but one ("0.5" for ".5", "7" for "007")
+LEADING_ZEROS_PATTERN = r"^0+(\d)"
+
+
+def _normalize_text(text) -> str:
+    """Single-case normalize_answers(): the same steps with re on one string."""
+    text = "" if pd.isna(text) else str(text).lower()
+    if "," in text:
+        text = re.sub(THOUSANDS_SEPARATOR, "", text)
+    for pattern, replacement in NORMALIZATION_STEPS:
+        # ASCII classes, as in pyarrow's regex engine
+        text = re.sub(pattern, replacement, text, flags=re.ASCII)
+    return text.replace(DECIMAL_POINT, ".").replace(MINUS_SIGN, "-").strip()
+
+
+def normalize_answers(answers: pd.Series) -> pd.Series:
+    """
+    Case-fold, drop punctuation and thousands separators (keeping decimal points
+    and minus signs), and collapse whitespace.
+    """
+    text = answers.fillna("").astype(str).str.lower()
+    has_separator = text.str.contains(r"\d,\d{3}", regex=True)
+    if has_separator.any():
+        text[has_separator] = text[has_separator].str.replace(THOUSANDS_SEPARATOR, "", regex=True)
+    for pattern, replacement in NORMALIZATION_STEPS:
+        text = text.str.replace(pattern, replacement, regex=True)
+    text = text.str.replace(DECIMAL_POINT, ".", regex=False).str.replace(MINUS_SIGN, "-", regex=False)
+    return text.str.strip()
+
+
+def _canonicalize_numbers(normalized: pd.Series) -> pd.Series:
+    """Drop insignificant trailing zeros from decimals ("3.50" -> "3.5", "2.0" -> "2")."""
+    for pattern, replacement in CANONICAL_NUMBER_STEPS:
+        normalized = normalized.str.replace(pattern, replacement, regex=True)
+    return normalized
+
+
+def _canonical_expected_numbers(expected: pd.Series) -> pd.Series:
+    """Expected numeric answers as canonical text ("$1,000.50" -> "1000.5", "-.5" -> "-0.5")."""
+    numbers = expected.str.replace(NUMBER_SYMBOLS_PATTERN, "", regex=True)
+    negative = numbers.str.startswith("-")
+    digits = ("0" + numbers.str.lstrip("-")).str.replace(LEADING_ZEROS_PATTERN, r"\1", regex=True)
+    return _canonicalize_numbers(digits.where(~negative, "-" + digits))
+
+
+def _canonical_expected_number(expected: str) -> str:
+    """Single-case _canonical_expected_numbers(): the same steps with re on one string."""
+    number = re.sub(NUMBER_SYMBOLS_PATTERN, "", expected)
+    sign = "-" if number.startswith("-") else ""
+    number = sign + re.sub(LEADING_ZEROS_PATTERN, r"\1", "0" + number.lstrip("-"))
+    for pattern, replacement in CANONICAL_NUMBER_STEPS:
+        number = re.sub(pattern, replacement, number, flags=re.ASCII)
+    return number
+
+
+def _contains_phrase(haystacks: pd.Series, needles: pd.Series) -> np.ndarray:
+    """
+    Element-wise whole-phrase containment of normalized needles in normalized
+    haystacks, as one numpy string ufunc over the two padded columns (pandas
+    has no pairwise "a in b").
+    """
+    padded_haystacks = (" " + haystacks.astype(str) + " ").to_numpy(dtype=np.dtypes.StringDType())
+    padded_needles = (" " + needles.astype(str) + " ").to_numpy(dtype=np.dtypes.StringDType())
+    return (np.strings.find(padded_haystacks, padded_needles) >= 0) & (padded_needles != "  ")
+
+
+def _score_numeric(generated: pd.Series, expected: pd.Series) -> np.ndarray:
+    """True where the generated answer contains the expected number ("1,000" == "1000.00")."""
+    return _contains_phrase(_canonicalize_numbers(generated), _canonical_expected_numbers(expected))
+
+
+def _score_lists(generated: pd.Series, expected: pd.Series) -> pd.Series:
+    """True where every item of the expected list appears in the generated answer."""
+    items = expected.str.split(LIST_SEPARATOR_PATTERN, regex=True).explode()
+    items = normalize_answers(items)
+    items = items[items != ""]
+    if items.empty:
+        return pd.Series(False, index=generated.index)
+    found = _contains_phrase(generated.reindex(items.index), items)
+    return pd.Series(found, index=items.index).groupby(level=0).all().reindex(generated.index, fill_value=False)
+
+
+def score_answers(generated_answers, expected_answers) -> pd.Series:
+    """
+    Score many (generated, expected) pairs at once.
+
+    Args:
+    - generated_answers: sequence or Series of model answers.
+    - expected_answers: sequence or Series of GAIA final answers, same length.
+
+    Returns:
+    - Boolean Series aligned with generated_answers (False where expected is empty).
+    """
+    generated = pd.Series(generated_answers).reset_index(drop=True)
+    expected = pd.Series(expected_answers).reset_index(drop=True).fillna("").astype(str)
+    if len(generated) != len(expected):
+        raise ValueError("generated_answers and expected_answers must have the same length.")
+
+    normalized_generated = normalize_answers(generated)
+    scores = pd.Series(False, index=generated.index)
+
+    is_numeric = expected.str.match(NUMERIC_ANSWER_PATTERN) & expected.str.contains(r"\d", regex=True)
+    is_list = ~is_numeric & expected.str.contains(r"[,;]", regex=True)
+    is_text = ~is_numeric & ~is_list
+
+    if is_numeric.any():
+        scores[is_numeric] = _score_numeric(normalized_generated[is_numeric], expected[is_numeric])
+    if is_list.any():
+        scores[is_list] = _score_lists(normalized_generated[is_list], expected[is_list])
+    if is_text.any():
+        scores[is_text] = _contains_phrase(normalized_generated[is_text], normalize_answers(expected[is_text]))
+
+    if isinstance(generated_answers, pd.Series):
+        scores.index = generated_answers.index
+    return scores
+
+
+def score_answer(generated_answer: str, expected_answer: str) -> bool:
+    """
+    Score a single generated answer against the expected GAIA final answer.
+
+    Same rules as score_answers(), applied with re on the two strings: the
+    pages score one case at a time, where building Series costs more than the scoring.
+    """
+    expected = "" if pd.isna(expected_answer) else str(expected_answer)
+    generated = f" {_normalize_text(generated_answer)} "
+
+    if re.match(NUMERIC_ANSWER_PATTERN, expected, flags=re.ASCII) and re.search(r"\d", expected, flags=re.ASCII):
+        for pattern, replacement in CANONICAL_NUMBER_STEPS:
+            generated = re.sub(pattern, replacement, generated, flags=re.ASCII)
+        return f" {_canonical_expected_number(expected)} " in generated
+    if "," in expected or ";" in expected:
+        items = [item for item in map(_normalize_text, re.split(LIST_SEPARATOR_PATTERN, expected)) if item]
+        return bool(items) and all(f" {item} " in generated for item in items)
+    needle = _normalize_text(expected)
+    return bool(needle) and f" {needle} " in generated
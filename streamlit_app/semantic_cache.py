@@ -0,0 +1,224 @@
+"""
+Semantic near-duplicate answer cache.
+
+The exact answer cache misses as soon as a prompt changes at all: an edited
+step in the validation page, different whitespace or punctuation in the
+extracted attachment text. This cache answers such near-duplicates from an
+earlier answer to the same task_id, model and sampling parameters.
+
+Prompts are embedded on the CPU as hashed word and word-pair counts
+(DIMENSIONS signed buckets of the case-folded words; whitespace and
+punctuation are ignored). A lookup scans the entries stored for the same
+(task_id, model, temperature, max_tokens, top_p) -- a handful per task, so an
+exact scan is cheaper than any ANN structure -- and returns the best answer
+when:
+- its cosine similarity is at least `threshold`;
+- at most `max_edit` word/word-pair counts differ (estimated from the
+  difference of the hashed counts), so a long attachment can't hide a
+  changed step;
+- the numbers in both prompts are identical, as GAIA answers often hinge
+  on them.
+
+A fraction `audit_rate` of hits is still sent to the model, and the fresh
+answer is compared with the cached one. Inconsistent answers are counted as
+false hits and every audit is appended to `<path>.audits.jsonl`.
+
+Entries are appended to a JSON lines file at `path` and reloaded (and
+compacted) when the cache is created, so answers survive restarts; entries
+other workers add meanwhile are picked up on their next start.
+
+Configured with SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD,
+SEMANTIC_CACHE_MAX_EDIT, SEMANTIC_CACHE_AUDIT_RATE,
+SEMANTIC_CACHE_ENTRIES_PER_TASK and SEMANTIC_CACHE_MAX_TASKS.
+"""
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+
+import numpy as np
+
+from tracing import start_span
+
+DIMENSIONS = 1024
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "model-evaluation-semantic-cache.jsonl")
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_EDIT = 12  # substituting one word changes about 6 word/word-pair counts
+DEFAULT_AUDIT_RATE = 0.05
+DEFAULT_ENTRIES_PER_TASK = 16
+DEFAULT_MAX_TASKS = 1000
+
+WORD_PATTERN = re.compile(r"\w+")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Result of a lookup: answer is None on a miss; vector is reused to add the fresh answer
+SemanticMatch = namedtuple("SemanticMatch", ["answer", "similarity", "vector", "numbers"])
+
+
+# Function to embed a prompt as signed hashed counts of its words and word pairs
+def embed(text: str) -> np.ndarray:
+    words = WORD_PATTERN.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    hashes = np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features),
+                         dtype=np.uint32, count=len(features))
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    np.add.at(vector, hashes % DIMENSIONS, np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32))
+    return vector
+
+
+# Function to fingerprint the numbers of a prompt, which must match exactly
+def numbers_digest(text: str) -> str:
+    return hashlib.sha1(" ".join(NUMBER_PATTERN.findall(text)).encode("utf-8")).hexdigest()
+
+
+# Function to tell whether an audited answer agrees with the cached one
+def answers_consistent(cached_answer: str, fresh_answer: str) -> bool:
+    from scoring import score_answer
+    return score_answer(fresh_answer, cached_answer) or score_answer(cached_answer, fresh_answer)
+
+
+class SemanticAnswerCache:
+    """Answers of earlier prompts per (task_id, model, sampling parameters), looked up by similarity."""
+
+    def __init__(self, path=None, threshold=None, max_edit=None, audit_rate=None,
+                 entries_per_task=None, max_tasks=None):
+        self.path = path or os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_PATH)
+        self.audit_path = f"{self.path}.audits.jsonl"
+        self.threshold = float(threshold if threshold is not None
+                               else os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+        self.max_edit = float(max_edit if max_edit is not None
+                              else os.getenv("SEMANTIC_CACHE_MAX_EDIT", DEFAULT_MAX_EDIT))
+        self.audit_rate = float(audit_rate if audit_rate is not None
+                                else os.getenv("SEMANTIC_CACHE_AUDIT_RATE", DEFAULT_AUDIT_RATE))
+        self.entries_per_task = int(entries_per_task or os.getenv("SEMANTIC_CACHE_ENTRIES_PER_TASK",
+                                                                  DEFAULT_ENTRIES_PER_TASK))
+        self.max_tasks = int(max_tasks or os.getenv("SEMANTIC_CACHE_MAX_TASKS", DEFAULT_MAX_TASKS))
+        self.lock = threading.Lock()
+        # (task_id, model, temperature, max_tokens, top_p) -> {"vectors", "norms", "numbers", "answers"}, LRU order
+        self.partitions = OrderedDict()
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "audits": 0, "false_hits": 0}
+        self.lookup_ms = deque(maxlen=1000)
+        self._load()
+
+    def _partition_key(self, task_id, params):
+        return (task_id, *params)
+
+    def _insert(self, key, vector, numbers, answer):
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = {"vectors": np.empty((0, DIMENSIONS), dtype=np.float32), "norms": np.empty(0, dtype=np.float32),
+                         "numbers": [], "answers": []}
+            self.partitions[key] = partition
+            if len(self.partitions) > self.max_tasks:
+                self.partitions.popitem(last=False)  # least recently used task
+        self.partitions.move_to_end(key)
+        partition["vectors"] = np.vstack([partition["vectors"], vector])[-self.entries_per_task:]
+        partition["norms"] = np.append(partition["norms"], np.linalg.norm(vector))[-self.entries_per_task:]
+        partition["numbers"] = (partition["numbers"] + [numbers])[-self.entries_per_task:]
+        partition["answers"] = (partition["answers"] + [answer])[-self.entries_per_task:]
+
+    def _load(self):
+        """Reload the persisted entries and rewrite the file without the evicted ones."""
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                vector = np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float16).astype(np.float32)
+                self._insert(tuple(entry["key"]), vector, entry["numbers"], entry["answer"])
+            except (ValueError, KeyError, TypeError):
+                continue  # truncated or corrupt line
+        if len(lines) > self.size():
+            self._compact()
+
+    def _entry_line(self, key, vector, numbers, answer):
+        return json.dumps({"key": list(key), "numbers": numbers, "answer": answer,
+                           "vector": base64.b64encode(vector.astype(np.float16).tobytes()).decode("ascii")}) + "\n"
+
+    def _compact(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for key, partition in self.partitions.items():
+                    for vector, numbers, answer in zip(partition["vectors"], partition["numbers"], partition["answers"]):
+                        f.write(self._entry_line(key, vector, numbers, answer))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def size(self):
+        return sum(len(partition["answers"]) for partition in self.partitions.values())
+
+    def lookup(self, task_id: str, params: tuple, prompt: str) -> SemanticMatch:
+        """Return the closest cached answer for the same task and params, or a SemanticMatch with answer None."""
+        start = time.perf_counter()
+        with start_span("semantic_cache.lookup", task_id=task_id) as span:
+            vector, numbers = embed(prompt), numbers_digest(prompt)
+            answer, similarity = None, 0.0
+            with self.lock:
+                partition = self.partitions.get(self._partition_key(task_id, params))
+                if partition is not None:
+                    norms = partition["norms"] * (np.linalg.norm(vector) or 1.0)
+                    similarities = partition["vectors"] @ vector / np.where(norms == 0, 1.0, norms)
+                    edits = np.abs(partition["vectors"] - vector).sum(axis=1)
+                    eligible = ((similarities >= self.threshold) & (edits <= self.max_edit)
+                                & (np.array(partition["numbers"]) == numbers))
+                    if eligible.any():
+                        best = int(np.argmax(np.where(eligible, similarities, -1.0)))
+                        answer, similarity = partition["answers"][best], float(similarities[best])
+                self.counters["lookups"] += 1
+                self.counters["hits" if answer is not None else "misses"] += 1
+            span.set_attributes(hit=answer is not None, similarity=similarity)
+        self.lookup_ms.append((time.perf_counter() - start) * 1000)
+        return SemanticMatch(answer, similarity, vector, numbers)
+
+    def add(self, task_id: str, params: tuple, match: SemanticMatch, answer: str):
+        """Store the model's answer for the prompt `match` was looked up with."""
+        key = self._partition_key(task_id, params)
+        with self.lock:
+            self._insert(key, match.vector, match.numbers, answer)
+            try:
+                with open(self.path, "a") as f:
+                    f.write(self._entry_line(key, match.vector, match.numbers, answer))
+            except OSError:
+                pass  # the cache still works in memory
+
+    def should_audit(self) -> bool:
+        return random.random() < self.audit_rate
+
+    def record_audit(self, task_id: str, match: SemanticMatch, fresh_answer: str) -> bool:
+        """Compare an audited hit with the model's fresh answer; return whether they agree."""
+        consistent = answers_consistent(match.answer, fresh_answer)
+        with self.lock:
+            self.counters["audits"] += 1
+            self.counters["false_hits"] += not consistent
+            try:
+                with open(self.audit_path, "a") as f:
+                    f.write(json.dumps({"task_id": task_id, "similarity": match.similarity, "consistent": consistent,
+                                        "cached_answer": match.answer, "fresh_answer": fresh_answer,
+                                        "audited_at": time.time()}) + "\n")
+            except OSError:
+                pass
+        return consistent
+
+    def stats(self) -> dict:
+        """Counters plus hit rate, audited false-hit rate and lookup latency percentiles (ms)."""
+        with self.lock:
+            stats = dict(self.counters, entries=self.size())
+        latencies = np.array(self.lookup_ms) if self.lookup_ms else np.zeros(1)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["false_hit_rate"] = stats["false_hits"] / stats["audits"] if stats["audits"] else None
+        stats["lookup_p50_ms"], stats["lookup_p95_ms"] = np.percentile(latencies, [50, 95]).tolist()
+        return stats
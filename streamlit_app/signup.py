@@ -3,6 +3,7 @@ import re
 from google.cloud import bigquery
 from dotenv import load_dotenv
 import os
+from query_cost import guarded_query
 
 # Load environment variables
 load_dotenv()
@@ -12,9 +13,6 @@ project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
 table_id = "UserInfo"  # UserInfo table
 
-# Initialize BigQuery Client
-client = bigquery.Client(project=project_id)
-
 # Password validation function
 def validate_password(password):
     errors = []
@@ -46,10 +44,11 @@ def is_email_unique(email):
     FROM `{project_id}.{dataset_id}.{table_id}`
     WHERE email = @email
     """
+    client = bigquery.Client(project=project_id)
     job_config = bigquery.QueryJobConfig(
         query_parameters=[bigquery.ScalarQueryParameter("email", "STRING", email)]
     )
-    query_job = client.query(query, job_config=job_config)
+    query_job = guarded_query(client, "signup.is_email_unique", query, job_config)
     result = query_job.result()
     for row in result:
         return row['count'] == 0
@@ -68,6 +67,7 @@ def save_to_bigquery(first_name, last_name, email, password):
             }
         ]
 
+        client = bigquery.Client(project=project_id)
         table_ref = f"{project_id}.{dataset_id}.{table_id}"
         errors = client.insert_rows_json(table_ref, rows_to_insert)
         if errors == []:
@@ -137,5 +137,6 @@ def signup_page():
             st.success("Sign up successful! You can now log in.")
             st.markdown("[Go to Login Page](?page=login)")
 
-# Call the signup page function
-signup_page()
+# Call the signup page function when run on its own (main.py calls it after importing)
+if __name__ == "__main__":
+    signup_page()
@@ -0,0 +1,207 @@
+"""
+Lightweight tracing for the evaluation app and ingest scripts.
+
+Spans follow the OpenTelemetry data model (trace/span ids, parent span,
+start/end in unix nanoseconds, attributes, status) and are exported as OTLP
+style JSON lines, so the files can be loaded into any OTel-aware tool.
+
+Usage:
+    from tracing import start_span, bind_attributes
+
+    bind_attributes(session_id=session_id)       # tag every later span in this context
+    with start_span("bigquery.query", task_id=task_id) as span:
+        ...
+        span.set_attribute("rows", len(df))
+
+Set TRACE_EXPORT_PATH to also append finished spans to a JSON lines file.
+`python tracing.py traces.jsonl` prints a per-span latency report.
+"""
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open ended
+HISTOGRAM_BUCKETS_MS = [1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_bound_attributes = contextvars.ContextVar("bound_attributes", default={})
+
+
+class Span:
+    """A single timed operation; see the OpenTelemetry span data model."""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc):
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self.end_time_unix_nano = self.start_time_unix_nano + int(self.duration_ms * 1e6)
+
+    def to_dict(self):
+        """OTLP/JSON-style representation of the span."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_time_unix_nano,
+            "endTimeUnixNano": self.end_time_unix_nano,
+            "attributes": self.attributes,
+            "status": {"code": self.status},
+        }
+
+
+class SpanExporter:
+    """Keeps recently finished spans in memory and optionally appends them to a JSON lines file."""
+
+    def __init__(self, path=None, max_spans=10000):
+        self.path = path
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        record = span.to_dict()
+        with self._lock:
+            self.spans.append(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+
+exporter = SpanExporter(os.getenv("TRACE_EXPORT_PATH"))
+
+
+def bind_attributes(**attributes):
+    """Attach attributes (e.g. session_id) to every span started later in this context."""
+    merged = dict(_bound_attributes.get())
+    merged.update({k: v for k, v in attributes.items() if v is not None})
+    _bound_attributes.set(merged)
+
+
+def bound_attributes():
+    """Attributes bound in this context with bind_attributes()."""
+    return dict(_bound_attributes.get())
+
+
+class start_span:
+    """
+    Context manager that starts a child of the current span (or a new trace)
+    and exports it when the block exits. A class rather than @contextmanager
+    because it wraps hot paths such as token counting.
+    """
+
+    def __init__(self, name, **attributes):
+        self.span = Span(name, _current_span.get(), {**_bound_attributes.get(), **attributes})
+
+    def __enter__(self):
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.span.record_exception(exc)
+        _current_span.reset(self._token)
+        end_span(self.span)
+        return False
+
+
+def new_span(name, **attributes):
+    """
+    Create a span without making it current, for work that is interleaved with
+    the caller (e.g. generators); finish it with end_span().
+    """
+    return Span(name, _current_span.get(), {**_bound_attributes.get(), **attributes})
+
+
+def end_span(span):
+    span.end()
+    exporter.export(span)
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_report(spans=None):
+    """
+    Summarize span durations per span name.
+
+    Returns a dict of name -> {count, errors, p50_ms, p95_ms, max_ms, histogram},
+    where histogram maps bucket labels ("<=10ms", ">10000ms") to counts.
+    """
+    spans = list(exporter.spans) if spans is None else spans
+    durations, errors = {}, {}
+    for span in spans:
+        duration_ms = (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6
+        durations.setdefault(span["name"], []).append(duration_ms)
+        if span["status"]["code"] == "ERROR":
+            errors[span["name"]] = errors.get(span["name"], 0) + 1
+
+    report = {}
+    for name, values in durations.items():
+        values.sort()
+        histogram = {f"<={bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+        histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+        for value in values:
+            bound = next((b for b in HISTOGRAM_BUCKETS_MS if value <= b), None)
+            histogram[f"<={bound}ms" if bound else f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+        report[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50_ms": _percentile(values, 0.5),
+            "p95_ms": _percentile(values, 0.95),
+            "max_ms": values[-1],
+            "histogram": histogram,
+        }
+    return report
+
+
+def format_report(report, bar_width=30):
+    """Render latency_report() output as text with one histogram per span name."""
+    lines = []
+    for name, stats in sorted(report.items(), key=lambda item: -item[1]["p95_ms"]):
+        lines.append(f"{name}: n={stats['count']} errors={stats['errors']} "
+                     f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms max={stats['max_ms']:.1f}ms")
+        for bucket, count in stats["histogram"].items():
+            if count:
+                bar = "#" * max(1, round(bar_width * count / stats["count"]))
+                lines.append(f"  {bucket:>9s} {count:6d} {bar}")
+    return "\n".join(lines)
+
+
+def load_spans(path):
+    """Read spans exported to a JSON lines file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python tracing.py <traces.jsonl>")
+    print(format_report(latency_report(load_spans(sys.argv[1]))))
@@ -0,0 +1,156 @@
+"""
+Token and cost ledger of model calls.
+
+Every chat completion the app makes (and every answer served from a cache)
+is recorded as one row: time, task_id, session_id, model, source (chat,
+stream, batch, or hedge for the losing copy of a hedged request), cache (miss, exact or semantic), prompt and completion
+tokens, whether the tokens were estimated (streamed responses carry no
+usage block, so they are counted with tiktoken) and latency. task_id and
+session_id default to the attributes bound for tracing.
+
+Rows are buffered in memory and flushed every LEDGER_FLUSH_ROWS rows or
+LEDGER_FLUSH_SECONDS seconds, and at exit. Each flush appends one gzip
+member of headerless CSV rows to a file per UTC day in LEDGER_DIR. Appends
+are single writes, so several workers can share the directory, and
+readers decode the concatenated members up to a truncated tail.
+"""
+import atexit
+import csv
+import datetime
+import glob
+import gzip
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from tracing import bound_attributes
+
+LEDGER_COLUMNS = ["ts", "task_id", "session_id", "model", "source", "cache",
+                  "prompt_tokens", "completion_tokens", "estimated", "latency_ms"]
+DEFAULT_LEDGER_DIR = os.path.join(tempfile.gettempdir(), "model-evaluation-usage")
+DEFAULT_FLUSH_ROWS = 100
+DEFAULT_FLUSH_SECONDS = 30
+
+
+class UsageLedger:
+    """Buffered, append-only ledger of model calls in daily gzip CSV files."""
+
+    def __init__(self, directory=None, flush_rows=None, flush_seconds=None):
+        self.directory = directory or os.getenv("LEDGER_DIR", DEFAULT_LEDGER_DIR)
+        self.flush_rows = int(flush_rows or os.getenv("LEDGER_FLUSH_ROWS", DEFAULT_FLUSH_ROWS))
+        self.flush_seconds = float(flush_seconds if flush_seconds is not None
+                                   else os.getenv("LEDGER_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS))
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.flush)
+
+    def path_for(self, day):
+        return os.path.join(self.directory, f"usage-{day}.csv.gz")
+
+    def record(self, model, prompt_tokens=0, completion_tokens=0, latency_ms=None, cache="miss", source="chat",
+               estimated=False, task_id=None, session_id=None):
+        bound = bound_attributes()
+        row = [datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+               task_id or bound.get("task_id") or "", session_id or bound.get("session_id") or "",
+               model, source, cache, int(prompt_tokens or 0), int(completion_tokens or 0), int(bool(estimated)),
+               "" if latency_ms is None else round(latency_ms, 1)]
+        with self.lock:
+            self.buffer.append(row)
+            due = len(self.buffer) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered rows to the daily files and return how many were written."""
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+        days = {}
+        for row in rows:
+            days.setdefault(row[0][:10], []).append(row)
+        try:
+            for day, day_rows in days.items():
+                text = io.StringIO()
+                csv.writer(text).writerows(day_rows)
+                with open(self.path_for(day), "ab") as f:
+                    f.write(gzip.compress(text.getvalue().encode("utf-8")))
+        except OSError as e:
+            print(f"Dropped {len(rows)} usage ledger rows: {e}", file=sys.stderr)
+            return 0
+        return len(rows)
+
+
+# Function to decompress every complete gzip member of a ledger file
+def _read_members(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    parts = []
+    while data:
+        member = zlib.decompressobj(wbits=31)
+        try:
+            parts.append(member.decompress(data))
+        except zlib.error:
+            break
+        if not member.eof:
+            break  # a flush still being written, or cut short
+        data = member.unused_data
+    return b"".join(parts)
+
+
+# Function to load the ledger rows of the last `days` UTC days (all of them if days is None)
+def load_usage(directory=None, days=None):
+    import pandas as pd
+
+    directory = directory or os.getenv("LEDGER_DIR", DEFAULT_LEDGER_DIR)
+    paths = sorted(glob.glob(os.path.join(directory, "usage-*.csv.gz")))
+    if days is not None:
+        first_day = (datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=days - 1)).isoformat()
+        paths = [path for path in paths if os.path.basename(path)[len("usage-"):][:10] >= first_day]
+    frames = []
+    for path in paths:
+        content = _read_members(path)
+        if content:
+            frames.append(pd.read_csv(io.BytesIO(content), names=LEDGER_COLUMNS, header=None,
+                                      dtype={"task_id": str, "session_id": str}, keep_default_na=False,
+                                      na_values={"latency_ms": [""]}))
+    if not frames:
+        return pd.DataFrame(columns=LEDGER_COLUMNS)
+    df = pd.concat(frames, ignore_index=True)
+    df["day"] = df["ts"].str[:10]
+    return df
+
+
+# Function to aggregate ledger rows per session, model or day
+def summarize_usage(df, by, pricing=None):
+    """
+    Return one row per value of `by` with calls, cache hits and hit rate, prompt/completion tokens,
+    latency percentiles of the calls that reached the model, and cost_usd when pricing
+    (model -> USD per 1K prompt and completion tokens) is given.
+    """
+    import pandas as pd
+
+    df = df.assign(cache_hit=df["cache"] != "miss")
+    if pricing is not None:
+        rates = df["model"].map(lambda model: pricing.get(model, (float("nan"), float("nan"))))
+        df = df.assign(cost_usd=(df["prompt_tokens"] * rates.str[0] + df["completion_tokens"] * rates.str[1]) / 1000)
+    grouped = df.groupby(by, sort=True)
+    latency = df[~df["cache_hit"]].groupby(by)["latency_ms"]
+    summary = pd.DataFrame({
+        "calls": grouped.size(),
+        "cache_hits": grouped["cache_hit"].sum(),
+        "prompt_tokens": grouped["prompt_tokens"].sum(),
+        "completion_tokens": grouped["completion_tokens"].sum(),
+        "p50_latency_ms": latency.median(),
+        "p95_latency_ms": latency.quantile(0.95),
+    })
+    summary["hit_rate"] = summary["cache_hits"] / summary["calls"]
+    summary["total_tokens"] = summary["prompt_tokens"] + summary["completion_tokens"]
+    if pricing is not None:
+        summary["cost_usd"] = grouped["cost_usd"].sum(min_count=1)
+    return summary.reset_index()
@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 from google.cloud import bigquery
 from dotenv import load_dotenv
 import os
+import datetime
+from tracing import start_span
+from bigquery_reads import query_dataframe
+from query_cost import guarded_query
+from results_schema import RESULTS_LOOKBACK_DAYS
+from evaluation_events import latest_results_query
+from charts import CHART_CACHE_ENTRIES, new_figure, set_count_axis, figure_to_png
 
 # Load environment variables
 load_dotenv()
@@ -11,35 +17,73 @@ load_dotenv()
 # BigQuery project details
 project_id = os.getenv("PROJECT_ID")
 dataset_id = os.getenv("DATASET_ID")
-enriched_table = "enrichedMetadata"  # Table containing questionResult, stepsResult, and sessionId
 
-# Function to load questionResult and stepsResult data from enrichedMetadata for the current session
+# Function to load the latest questionResult or stepsResult of each task for the current session
 @st.cache_data(ttl=60)
-def load_result_data(session_id, result_column):
-    """Load result data (questionResult or stepsResult) for the ongoing session from enrichedMetadata."""
+def load_result_data(session_id, result_column, since):
+    """
+    Load result data (questionResult or stepsResult) for the ongoing session from the evaluation event log.
+    Only partitions from `since` on are scanned, and clustering on sessionId skips other sessions' blocks.
+    """
     client = bigquery.Client(project=project_id)
     query = f"""
     SELECT 
         {result_column}, task_id
-    FROM `{project_id}.{dataset_id}.{enriched_table}`
-    WHERE sessionId = @session_id
+    FROM ({latest_results_query("WHERE sessionId = @session_id AND resultAt >= @since")})
     """
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("session_id", "STRING", session_id)
+            bigquery.ScalarQueryParameter("session_id", "STRING", session_id),
+            bigquery.ScalarQueryParameter("since", "TIMESTAMP", since)
         ]
     )
     try:
-        query_job = client.query(query, job_config=job_config)
-        df = query_job.result().to_dataframe()  # Convert query result to pandas DataFrame
+        with start_span("bigquery.load_result_data", session_id=session_id, column=result_column) as span:
+            df = query_dataframe(client, query, job_config, name="visualization.load_result_data")  # Read the result into a DataFrame through Arrow
+            span.set_attribute("rows", len(df))
         return df
     except Exception as e:
         st.error(f"Error fetching data from BigQuery: {e}")
         return pd.DataFrame()
 
+# Function to find the earliest time the session's results can have been written
+def session_results_since():
+    """The session's start, or the start of the day RESULTS_LOOKBACK_DAYS ago if it is unknown."""
+    started = st.session_state.get('session_started')
+    if started is not None:
+        return started
+    # Whole days, so the cached query results stay valid across reruns
+    day = datetime.date.today() - datetime.timedelta(days=RESULTS_LOOKBACK_DAYS)
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+# Function to count result values for the given labels (missing labels count as 0)
+def count_results(df, result_column, labels):
+    """Return the counts of each label in the result column, in label order."""
+    counts = df[result_column].value_counts().reindex(labels, fill_value=0)
+    return [counts[label] for label in labels]
+
+# Function to build the per-task overview of question and steps outcomes
+def build_overview_table(df_question, df_steps):
+    """Merge questionResult and stepsResult on task_id and add outcome columns."""
+    merged_df = pd.merge(df_question, df_steps, on='task_id', how='outer')
+
+    # Add Test Case and Steps Outcome columns
+    merged_df['Test Case Outcome'] = merged_df['questionResult'].apply(lambda x: '✅' if x == 'True' else '❌')
+
+    # Adjust Steps Outcome based on Test Case Outcome
+    def compute_steps_outcome(row):
+        if row['Test Case Outcome'] == '✅':
+            return '-'
+        else:
+            return '✅' if row['stepsResult'] == 'True' else '❌'
+
+    # Populate Steps Outcome based on the logic above
+    merged_df['Steps Outcome'] = merged_df.apply(compute_steps_outcome, axis=1)
+    return merged_df[['task_id', 'Test Case Outcome', 'Steps Outcome']]
+
 # Function to plot and display a bar chart with enhanced annotations
 def plot_bar_chart(labels, counts, title, colors):
-    fig, ax = plt.subplots(figsize=(3, 2))  # Adjusted figure size
+    fig, ax = new_figure(figsize=(3, 2))  # Adjusted figure size
 
     # Plot the bar chart
     bars = ax.bar(labels, counts, color=colors)
@@ -54,12 +98,17 @@ def plot_bar_chart(labels, counts, title, colors):
     ax.set_xlabel('Validation Result', fontsize=8)
     ax.set_ylabel('Count', fontsize=8)
 
-    # Set the Y-axis to start from 0, with increments by 1
-    ax.set_ylim(0, max(counts) + 1)
-    ax.yaxis.set_major_locator(plt.MultipleLocator(1))
+    # Set the Y-axis to start from 0, with integer ticks
+    set_count_axis(ax, counts)
 
     return fig
 
+# Function to render a bar chart as PNG, cached by its counts so unchanged charts are not redrawn
+@st.cache_data(max_entries=CHART_CACHE_ENTRIES)
+def render_bar_chart(labels, counts, title, colors):
+    with start_span("chart.render", title=title):
+        return figure_to_png(plot_bar_chart(labels, counts, title, colors))
+
 # Function to save feedback to BigQuery UserInfo table
 def save_feedback_to_bigquery(email, feedback):
     """Save feedback to the BigQuery UserInfo table for the logged-in user using MERGE."""
@@ -80,52 +129,182 @@ def save_feedback_to_bigquery(email, feedback):
         ]
     )
     try:
-        query_job = client.query(query, job_config=job_config)
-        query_job.result()  # Wait for the query to finish
-        st.sidebar.success("Feedback saved successfully!")
+        with start_span("bigquery.save_feedback"):
+            query_job = guarded_query(client, "visualization.save_feedback", query, job_config)
+            query_job.result()  # Wait for the query to finish
+        st.success("Feedback saved successfully!")
     except Exception as e:
         st.error(f"Error saving feedback to BigQuery: {e}")
 
 
-# Feedback functionality
+# Feedback functionality (call inside `with st.sidebar:`; reruns on its own)
+@st.fragment
 def feedback_section():
     """Render the feedback section in the sidebar and handle saving feedback."""
-    # Ensure the user is logged in before showing feedback section
-    if 'session_id' not in st.session_state or 'user_email' not in st.session_state:
-        st.sidebar.warning("Please log in to provide feedback.")
-        return
+    with start_span("fragment.feedback"):
+        # Ensure the user is logged in before showing feedback section
+        if 'session_id' not in st.session_state or 'user_email' not in st.session_state:
+            st.warning("Please log in to provide feedback.")
+            return
+
+        # State for toggling visibility of the feedback text box
+        if 'show_feedback' not in st.session_state:
+            st.session_state.show_feedback = False
+
+        # Button to toggle visibility of feedback box
+        if st.button("Give Feedback"):
+            st.session_state.show_feedback = not st.session_state.show_feedback
+
+        # If the button is clicked, show or hide the feedback text box
+        if st.session_state.show_feedback:
+            feedback = st.text_area("Your Feedback", key="feedback_text")
+
+            # Save feedback button
+            if st.button("Save Feedback"):
+                user_email = st.session_state.get('user_email', '')  # Get the user's email from session state
+                if feedback and user_email:
+                    save_feedback_to_bigquery(user_email, feedback)
+                else:
+                    st.warning("Please write feedback and ensure the user is logged in.")
+
+# Overview table panel
+@st.fragment
+def overview_panel(session_id, since):
+    with start_span("fragment.overview"):
+        # State for toggling visibility of the overview table
+        if 'show_overview_table' not in st.session_state:
+            st.session_state.show_overview_table = False
+
+        # Button to toggle visibility of the "Overview" table
+        if st.button("Overview"):
+            st.session_state.show_overview_table = not st.session_state.show_overview_table
+
+        # If the button is clicked, show or hide the table
+        if st.session_state.show_overview_table:
+            # Load questionResult and stepsResult data from BigQuery for the current session
+            df_question = load_result_data(session_id, "questionResult", since)
+            df_steps = load_result_data(session_id, "stepsResult", since)
+
+            if df_question.empty or df_steps.empty:
+                st.warning("No data available for the ongoing session.")
+            else:
+                # Display the table with the task_id, Test Case Outcome, and Steps Outcome
+                st.table(build_overview_table(df_question, df_steps))
+
+# "Outcome from Question" chart panel
+@st.fragment
+def question_outcome_panel(session_id, since):
+    with start_span("fragment.question_outcome"):
+        if 'show_question_graph' not in st.session_state:
+            st.session_state.show_question_graph = False
+
+        # Button to toggle visibility of "Outcome from Question" graph
+        if st.button("Outcome from Question"):
+            st.session_state.show_question_graph = not st.session_state.show_question_graph
+
+        # If the button is clicked, show or hide the graph for questionResult
+        if st.session_state.show_question_graph:
+            # Load questionResult data from BigQuery for the current session
+            df_question = load_result_data(session_id, "questionResult", since)
+
+            # If no data is available, show a message
+            if df_question.empty:
+                st.warning("No data available for the ongoing session.")
+            else:
+                # Count True and False values from the questionResult column
+                true_count, false_count = count_results(df_question, 'questionResult', ["True", "False"])
+
+                st.subheader(f"Total True: {true_count}")
+                st.subheader(f"Total False: {false_count}")
+
+                # Plot the True/False validation result counts
+                png = render_bar_chart(['True', 'False'], [int(true_count), int(false_count)], 'Validation Results: True vs False', ['purple', 'orange'])
+                st.image(png, width="stretch")
+
+# "Outcome from Steps" chart panel
+@st.fragment
+def steps_outcome_panel(session_id, since):
+    with start_span("fragment.steps_outcome"):
+        if 'show_steps_graph' not in st.session_state:
+            st.session_state.show_steps_graph = False
+
+        # Button to toggle visibility of "Outcome from Steps" graph
+        if st.button("Outcome from Steps"):
+            st.session_state.show_steps_graph = not st.session_state.show_steps_graph
+
+        # If the button is clicked, show or hide the graph for stepsResult
+        if st.session_state.show_steps_graph:
+            # Load stepsResult data from BigQuery for the current session
+            df_steps = load_result_data(session_id, "stepsResult", since)
+
+            # If no data is available, show a message
+            if df_steps.empty:
+                st.warning("No data available for the ongoing session.")
+            else:
+                # Count True, False, and Skipped values from the stepsResult column
+                true_count, false_count, skipped_count = count_results(df_steps, 'stepsResult', ["True", "False", "Skipped"])
+
+                st.subheader(f"Total True: {true_count}")
+                st.subheader(f"Total False: {false_count}")
+                st.subheader(f"Total Skipped: {skipped_count}")
+
+                # Plot the True/False/Skipped validation result counts
+                png = render_bar_chart(['True', 'False', 'Skipped'], [int(true_count), int(false_count), int(skipped_count)], 'Steps Results: True vs False vs Skipped', ['green', 'red', 'blue'])
+                st.image(png, width="stretch")
+
+# "Overall Outcome" chart panel
+@st.fragment
+def overall_outcome_panel(session_id, since):
+    with start_span("fragment.overall_outcome"):
+        if 'show_overall_graph' not in st.session_state:
+            st.session_state.show_overall_graph = False
+
+        # Button to toggle visibility of the new "Overall Outcome" graph
+        if st.button("Overall Outcome"):
+            st.session_state.show_overall_graph = not st.session_state.show_overall_graph
+
+        # If the button is clicked, show or hide the overall graph
+        if st.session_state.show_overall_graph:
+            # Load questionResult data from BigQuery for the current session
+            df_question = load_result_data(session_id, "questionResult", since)
+
+            # Load stepsResult data from BigQuery for the current session
+            df_steps = load_result_data(session_id, "stepsResult", since)
+
+            # Ensure both dataframes have data
+            if df_question.empty or df_steps.empty:
+                st.warning("No data available for the ongoing session.")
+            else:
+                # Count True values from questionResult
+                question_true_count, = count_results(df_question, 'questionResult', ["True"])
 
-    # State for toggling visibility of the feedback text box
-    if 'show_feedback' not in st.session_state:
-        st.session_state.show_feedback = False
+                # Count True and False values from stepsResult
+                steps_true_count, steps_false_count = count_results(df_steps, 'stepsResult', ["True", "False"])
 
-    # Button to toggle visibility of feedback box
-    if st.sidebar.button("Give Feedback"):
-        st.session_state.show_feedback = not st.session_state.show_feedback
+                # Plot the graph with three bars
+                labels = ['Questions', 'Steps', 'Null']
+                counts = [int(question_true_count), int(steps_true_count), int(steps_false_count)]
+                colors = ['purple', 'green', 'red']
 
-    # If the button is clicked, show or hide the feedback text box
-    if st.session_state.show_feedback:
-        feedback = st.sidebar.text_area("Your Feedback", key="feedback_text")
+                st.subheader(f"Question: {question_true_count}")
+                st.subheader(f"Steps: {steps_true_count}")
+                st.subheader(f"Null: {steps_false_count}")
 
-        # Save feedback button
-        if st.sidebar.button("Save Feedback"):
-            user_email = st.session_state.get('user_email', '')  # Get the user's email from session state
-            if feedback and user_email:
-                save_feedback_to_bigquery(user_email, feedback)
-                st.sidebar.success("Feedback saved successfully!")
-            else:
-                st.sidebar.warning("Please write feedback and ensure the user is logged in.")
+                # Plot the overall outcome graph
+                png = render_bar_chart(labels, counts, 'Overall Outcome: True and False', colors)
+                st.image(png, width="stretch")
 
 # Visualization Page
 def visualization_page():
     
     # Call the feedback section to display feedback options in the sidebar
-    feedback_section()
+    with st.sidebar:
+        feedback_section()
 
     # Add a "Back" button at the top to go to the validation page
     if st.button("Back to Validation Page"):
         st.session_state.page = 'validation'
-        st.experimental_set_query_params(page='validation')
+        st.query_params["page"] = 'validation'
 
     st.title("Validation Results")
 
@@ -136,141 +315,13 @@ def visualization_page():
         st.warning("Session ID not found. Please ensure you're logged in.")
         return
 
-    # State for toggling visibility of graphs
-    if 'show_question_graph' not in st.session_state:
-        st.session_state.show_question_graph = False
-
-    if 'show_steps_graph' not in st.session_state:
-        st.session_state.show_steps_graph = False
-
-    if 'show_overall_graph' not in st.session_state:
-        st.session_state.show_overall_graph = False
-
-    # State for toggling visibility of the overview table
-    if 'show_overview_table' not in st.session_state:
-        st.session_state.show_overview_table = False
-
-    # Button to toggle visibility of the "Overview" table
-    if st.button("Overview"):
-        st.session_state.show_overview_table = not st.session_state.show_overview_table
-
-    # If the button is clicked, show or hide the table
-    if st.session_state.show_overview_table:
-        # Load questionResult and stepsResult data from BigQuery for the current session
-        df_question = load_result_data(session_id, "questionResult")
-        df_steps = load_result_data(session_id, "stepsResult")
-
-        if df_question.empty or df_steps.empty:
-            st.warning("No data available for the ongoing session.")
-        else:
-            # Merge both dataframes on task_id
-            merged_df = pd.merge(df_question, df_steps, on='task_id', how='outer')
-
-        # Add Test Case and Steps Outcome columns
-        merged_df['Test Case Outcome'] = merged_df['questionResult'].apply(lambda x: '✅' if x == 'True' else '❌')
-
-        # Adjust Steps Outcome based on Test Case Outcome
-        def compute_steps_outcome(row):
-            if row['Test Case Outcome'] == '✅':
-                return '-'
-            else:
-                return '✅' if row['stepsResult'] == 'True' else '❌'
-
-        # Populate Steps Outcome based on the logic above
-        merged_df['Steps Outcome'] = merged_df.apply(compute_steps_outcome, axis=1)
-
-        # Display the table with the task_id, Test Case Outcome, and Steps Outcome
-        st.table(merged_df[['task_id', 'Test Case Outcome', 'Steps Outcome']])
-
-    # Button to toggle visibility of "Outcome from Question" graph
-    if st.button("Outcome from Question"):
-        st.session_state.show_question_graph = not st.session_state.show_question_graph
-
-    # If the button is clicked, show or hide the graph for questionResult
-    if st.session_state.show_question_graph:
-        # Load questionResult data from BigQuery for the current session
-        df_question = load_result_data(session_id, "questionResult")
-
-        # If no data is available, show a message
-        if df_question.empty:
-            st.warning("No data available for the ongoing session.")
-        else:
-            # Count True and False values from the questionResult column
-            question_result_counts = df_question['questionResult'].value_counts().reindex(["True", "False"], fill_value=0)
-
-            true_count = question_result_counts['True']
-            false_count = question_result_counts['False']
-
-            st.subheader(f"Total True: {true_count}")
-            st.subheader(f"Total False: {false_count}")
-
-            # Plot the True/False validation result counts
-            fig = plot_bar_chart(['True', 'False'], [true_count, false_count], 'Validation Results: True vs False', ['purple', 'orange'])
-            st.pyplot(fig)
-
-    # Button to toggle visibility of "Outcome from Steps" graph
-    if st.button("Outcome from Steps"):
-        st.session_state.show_steps_graph = not st.session_state.show_steps_graph
-
-    # If the button is clicked, show or hide the graph for stepsResult
-    if st.session_state.show_steps_graph:
-        # Load stepsResult data from BigQuery for the current session
-        df_steps = load_result_data(session_id, "stepsResult")
-
-        # If no data is available, show a message
-        if df_steps.empty:
-            st.warning("No data available for the ongoing session.")
-        else:
-            # Count True, False, and Skipped values from the stepsResult column
-            steps_result_counts = df_steps['stepsResult'].value_counts().reindex(["True", "False", "Skipped"], fill_value=0)
-
-            true_count = steps_result_counts['True']
-            false_count = steps_result_counts['False']
-            skipped_count = steps_result_counts['Skipped']
-
-            st.subheader(f"Total True: {true_count}")
-            st.subheader(f"Total False: {false_count}")
-            st.subheader(f"Total Skipped: {skipped_count}")
-
-            # Plot the True/False/Skipped validation result counts
-            fig = plot_bar_chart(['True', 'False', 'Skipped'], [true_count, false_count, skipped_count], 'Steps Results: True vs False vs Skipped', ['green', 'red', 'blue'])
-            st.pyplot(fig)
-
-    # Button to toggle visibility of the new "Overall Outcome" graph
-    if st.button("Overall Outcome"):
-        st.session_state.show_overall_graph = not st.session_state.show_overall_graph
-
-    # If the button is clicked, show or hide the overall graph
-    if st.session_state.show_overall_graph:
-        # Load questionResult data from BigQuery for the current session
-        df_question = load_result_data(session_id, "questionResult")
-
-        # Load stepsResult data from BigQuery for the current session
-        df_steps = load_result_data(session_id, "stepsResult")
-
-        # Ensure both dataframes have data
-        if df_question.empty or df_steps.empty:
-            st.warning("No data available for the ongoing session.")
-        else:
-            # Count True values from questionResult
-            question_true_count = df_question['questionResult'].value_counts().get('True', 0)
-
-            # Count True and False values from stepsResult
-            steps_true_count = df_steps['stepsResult'].value_counts().get('True', 0)
-            steps_false_count = df_steps['stepsResult'].value_counts().get('False', 0)
-
-            # Plot the graph with three bars
-            labels = ['Questions', 'Steps', 'Null']
-            counts = [question_true_count, steps_true_count, steps_false_count]
-            colors = ['purple', 'green', 'red']
-
-            st.subheader(f"Question: {question_true_count}")
-            st.subheader(f"Steps: {steps_true_count}")
-            st.subheader(f"Null: {steps_false_count}")
+    since = session_results_since()
 
-            # Plot the overall outcome graph
-            fig = plot_bar_chart(labels, counts, 'Overall Outcome: True and False', colors)
-            st.pyplot(fig)
+    # Each table/chart panel reruns on its own when its toggle is pressed
+    overview_panel(session_id, since)
+    question_outcome_panel(session_id, since)
+    steps_outcome_panel(session_id, since)
+    overall_outcome_panel(session_id, since)
 
 # Main function to run the page
 if __name__ == "__main__":
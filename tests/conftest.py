@@ -0,0 +1,12 @@
+"""
+The app and the ingest import their modules by name, as when run from their
+own directories: put streamlit_app/ and dataflow/ on sys.path.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("streamlit_app", "dataflow"):
+    path = os.path.join(REPO_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,168 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import cassette
+from cassette import (RECORD, REPLAY, Cassette, CassetteMiss, CassetteRowIterator, _stream, decode_table,
+                      encode_table, install_from_env, read_entries, request_key)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "session.cassette.jsonl.gz")
+
+
+def identity(value):
+    return value, value
+
+
+def record_calls(path, calls):
+    """Record (key, loose, result) calls; a result that is an exception is raised by the live call."""
+    recording = Cassette(path, RECORD)
+    for key, loose, result in calls:
+        def live(result=result):
+            if isinstance(result, Exception):
+                raise result
+            return result
+        try:
+            recording.call("svc", "op", key, loose, live, identity, lambda response: response)
+        except Exception:
+            pass
+    os.close(recording.fd)
+    return recording
+
+
+def replay(path, key, loose, latency=0.0):
+    return Cassette(path, REPLAY, latency).call("svc", "op", key, loose, None, identity, lambda response: response)
+
+
+def test_record_then_replay(path):
+    recording = record_calls(path, [("k1", "l", {"a": 1}), ("k2", "l", [1, 2])])
+    assert recording.stats()["recorded"] == 2
+    replaying = Cassette(path, REPLAY)
+    call = lambda key: replaying.call("svc", "op", key, "l", None, identity, lambda response: response)
+    assert call("k2") == [1, 2]
+    assert call("k1") == {"a": 1}
+    assert replaying.stats()["exact"] == 2
+
+
+def test_repeated_calls_replay_in_order_then_repeat_the_last(path):
+    record_calls(path, [("k", "l", 1), ("k", "l", 2)])
+    replaying = Cassette(path, REPLAY)
+    results = [replaying.call("svc", "op", "k", "l", None, identity, lambda response: response) for _ in range(3)]
+    assert results == [1, 2, 2]
+
+
+def test_unmatched_request_falls_back_to_the_same_operation(path):
+    record_calls(path, [("k1", "l", "first"), ("k2", "l", "second")])
+    replaying = Cassette(path, REPLAY)
+    call = lambda key, loose: replaying.call("svc", "op", key, loose, None, identity, lambda response: response)
+    assert [call("new", "l"), call("newer", "l")] == ["first", "second"]
+    assert replaying.stats()["loose"] == 2
+    with pytest.raises(CassetteMiss):
+        call("new", "other")
+    assert replaying.stats()["missed"] == 1
+
+
+def test_errors_are_replayed(path):
+    record_calls(path, [("k1", "l", ValueError("bad request")), ("k2", "l", KeyError("gone"))])
+    with pytest.raises(ValueError, match="bad request"):
+        replay(path, "k1", "l")
+    with pytest.raises(KeyError):
+        replay(path, "k2", "l")
+
+
+def test_unimportable_errors_are_replayed_as_runtime_errors():
+    error = cassette.rebuild_error({"type": "missing.module.Error", "message": "boom"})
+    assert type(error) is RuntimeError and "missing.module.Error: boom" in str(error)
+
+
+def test_replay_waits_for_the_recorded_latency(path, monkeypatch):
+    recording = Cassette(path, RECORD)
+    recording.record("svc", "op", "k", "l", 2.0, "slow")
+    os.close(recording.fd)
+    sleeps = []
+    monkeypatch.setattr(cassette.time, "sleep", sleeps.append)
+    assert replay(path, "k", "l") == "slow" and sleeps == []
+    assert replay(path, "k", "l", latency=0.5) == "slow" and sleeps == [1.0]
+
+
+def test_torn_tail_is_ignored(path):
+    record_calls(path, [("k1", "l", 1), ("k2", "l", 2)])
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-5])  # killed while writing the second call
+    assert [entry["key"] for entry in read_entries(path)] == ["k1"]
+
+
+def test_invalid_mode(path):
+    with pytest.raises(ValueError):
+        Cassette(path, "rewind")
+
+
+def test_request_key():
+    assert request_key("chat", {"b": 1, "a": 2}) == request_key("chat", {"a": 2, "b": 1})
+    assert request_key("chat", {"a": 1}) != request_key("chat", {"a": 2})
+    assert len(request_key("x")) == 32
+
+
+def test_table_round_trip():
+    table = pa.table({"task_id": ["a", None], "tokens": [1, 2], "score": [0.5, None]})
+    assert decode_table(encode_table(table)).equals(table)
+
+
+def test_row_iterator():
+    rows = CassetteRowIterator(pa.table({"task_id": ["a", None], "tokens": [1, 2]}))
+    assert rows.total_rows == 2
+    first = next(iter(rows))
+    assert first["task_id"] == first.task_id == "a"
+    with pytest.raises(AttributeError):
+        first.missing
+    df = rows.to_dataframe(string_dtype=pd.StringDtype("pyarrow"))
+    assert df["task_id"].dtype == pd.StringDtype("pyarrow") and df["tokens"].tolist() == [1, 2]
+
+
+def test_stream_round_trip(path, monkeypatch):
+    chunks = [{"choices": [{"delta": {"content": word}}]} for word in ("It", " is", " 42")]
+    recording = Cassette(path, RECORD)
+    assert list(_stream(recording, "k", "l", "summary", lambda: iter(chunks))) == chunks
+    # A stream that is not read to the end (a hedged request's loser) is not recorded
+    partial = _stream(recording, "k2", "l", "summary", lambda: iter(chunks))
+    next(partial)
+    partial.close()
+    os.close(recording.fd)
+    assert [entry["key"] for entry in read_entries(path)] == ["k"]
+
+    sleeps = []
+    monkeypatch.setattr(cassette.time, "sleep", sleeps.append)
+    replayed = list(_stream(Cassette(path, REPLAY, latency=1.0), "k", "l", "summary", None))
+    assert replayed == chunks
+    assert len(sleeps) <= len(chunks)
+
+
+def test_install_from_env_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("CASSETTE_MODE", raising=False)
+    assert install_from_env() is None
+    monkeypatch.setenv("CASSETTE_MODE", "off")
+    assert install_from_env() is None
+
+
+def test_openai_round_trip(path, monkeypatch):
+    openai = pytest.importorskip("openai")
+    responses = iter([{"choices": [{"message": {"content": "Paris"}}], "usage": {"total_tokens": 5}}])
+    monkeypatch.setattr(openai.ChatCompletion, "create", staticmethod(lambda **kwargs: next(responses)))
+    messages = [{"role": "user", "content": "Capital of France?"}]
+
+    recording = Cassette(path, RECORD)
+    cassette.patch_openai(recording)
+    recorded = openai.ChatCompletion.create(model="gpt-4", messages=messages, request_timeout=30)
+    os.close(recording.fd)
+
+    replaying = Cassette(path, REPLAY)
+    cassette.patch_openai(replaying)
+    # The request timeout is not part of the request
+    assert openai.ChatCompletion.create(model="gpt-4", messages=messages, request_timeout=5) == recorded
+    assert replaying.stats()["exact"] == 1
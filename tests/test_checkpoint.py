@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+import checkpoint
+from checkpoint import FAILED, ProgressJournal, output_hash
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "run.jsonl")
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_record_and_resume(path):
+    with ProgressJournal(path) as journal:
+        journal.record("a", "updated", "text a")
+        journal.record("b", "missing_file")
+        journal.record(3, "updated")
+    with ProgressJournal(path) as journal:
+        assert len(journal) == 3
+        assert journal.done("a") and journal.done(3) and not journal.done("c")
+        assert journal.outcome("b") == "missing_file" and journal.outcome("c") is None
+        assert journal.items() == ["a", "b", "3"]
+        assert journal.items("updated") == ["a", "3"]
+        assert journal.entries["a"]["sha256"] == output_hash("text a")
+
+
+def test_last_entry_of_an_item_wins(path):
+    with ProgressJournal(path) as journal:
+        journal.record("a", FAILED, detail="boom")
+        journal.record("a", "updated")
+    with ProgressJournal(path) as journal:
+        assert journal.outcome("a") == "updated"
+        assert journal.entries["a"]["attempts"] == 2  # failed attempts are carried over
+
+
+def test_failed_items_are_not_done(path):
+    with ProgressJournal(path) as journal:
+        journal.record("a", FAILED)
+        assert not journal.done("a")
+        assert journal.items(FAILED) == ["a"]
+
+
+def test_torn_last_line_is_dropped(path):
+    with ProgressJournal(path) as journal:
+        journal.record("a", "updated")
+        journal.record("b", "updated")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-10])  # killed while writing "b"
+    with ProgressJournal(path) as journal:
+        assert journal.items() == ["a"]
+        journal.record("c", "updated")
+    assert [entry["item"] for entry in read_lines(path)] == ["a", "c"]
+
+
+def test_reset_forgets_every_item(path):
+    with ProgressJournal(path) as journal:
+        journal.record("a", "updated")
+        journal.reset()
+        assert len(journal) == 0
+        journal.record("b", "updated")
+    with ProgressJournal(path) as journal:
+        assert journal.items() == ["b"]
+
+
+def test_run_skips_finished_items(path):
+    calls = []
+    with ProgressJournal(path) as journal:
+        entry = journal.run("a", lambda: calls.append("a") or ("updated", "out"))
+        assert entry["outcome"] == "updated" and entry["attempts"] == 1
+        assert journal.run("a", lambda: calls.append("again") or ("updated", "out")) is None
+    assert calls == ["a"]
+
+
+def test_run_retries_with_backoff(path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(checkpoint.time, "sleep", sleeps.append)
+    attempts = iter([RuntimeError("flaky"), RuntimeError("flaky"), ("updated", None)])
+
+    def work():
+        result = next(attempts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    with ProgressJournal(path, max_attempts=3, backoff_seconds=1) as journal:
+        entry = journal.run("a", work)
+    assert entry["outcome"] == "updated" and entry["attempts"] == 3
+    assert sleeps == [1, 2]
+
+
+def test_run_records_failure_after_max_attempts(path, monkeypatch):
+    monkeypatch.setattr(checkpoint.time, "sleep", lambda seconds: None)
+
+    def work():
+        raise RuntimeError("still down")
+
+    with ProgressJournal(path, max_attempts=2, backoff_seconds=1) as journal:
+        entry = journal.run("a", work)
+        assert entry["outcome"] == FAILED and entry["attempts"] == 2 and entry["detail"] == "still down"
+        # A failed item is run again, and its attempts add up
+        entry = journal.run("a", lambda: ("updated", None))
+        assert entry["attempts"] == 3
+
+
+def test_retry_reraises_the_last_error(path, monkeypatch):
+    monkeypatch.setattr(checkpoint.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def work():
+        calls.append(1)
+        raise ValueError(f"rejected {len(calls)}")
+
+    with ProgressJournal(path, max_attempts=2) as journal:
+        with pytest.raises(ValueError, match="rejected 2"):
+            journal.retry("insert", work)
+
+
+def test_journal_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("CHECKPOINT_DIR", str(tmp_path))
+    assert checkpoint.journal_path("batch run/1") == str(tmp_path / "batch_run_1.jsonl")
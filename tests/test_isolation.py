@@ -0,0 +1,133 @@
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+import isolation
+from isolation import (CRASHED, ERROR, MEMORY, TIMEOUT, IsolatedError, IsolatedWorker, IsolationCrashed,
+                       IsolationMemoryExceeded, IsolationTimeout, WorkProfile, format_profile, outcome_of)
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="the memory cap reads /proc")
+
+
+def add(a, b):
+    return a + b
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 2 ** 20))
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def crash():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def worker_pid():
+    return os.getpid()
+
+
+@pytest.fixture
+def worker():
+    worker = IsolatedWorker("test", timeout=10, memory_mb=64)
+    yield worker
+    worker.stop()
+
+
+def test_run_returns_the_result_in_one_worker(worker):
+    assert worker.run(add, 2, 3) == 5
+    assert worker.run(worker_pid) != os.getpid()
+    assert worker.run(worker_pid) == worker.run(worker_pid)
+    assert worker.starts == 1
+
+
+def test_error_keeps_the_worker(worker):
+    pid = worker.run(worker_pid)
+    with pytest.raises(IsolatedError, match="ValueError: bad file") as raised:
+        worker.run(fail, "bad file")
+    assert type(raised.value) is IsolatedError
+    assert worker.run(worker_pid) == pid
+
+
+def test_memory_cap_replaces_the_worker(worker):
+    assert worker.run(allocate, 16) == 16 * 2 ** 20
+    with pytest.raises(IsolationMemoryExceeded):
+        worker.run(allocate, 512)
+    assert worker.run(add, 1, 1) == 2
+    assert worker.starts == 2
+
+
+def no_proc(path, *args, **kwargs):
+    raise FileNotFoundError(2, "No such file or directory", path)
+
+
+def test_missing_proc_skips_the_memory_cap(monkeypatch, caplog):
+    # As on macOS: no /proc/self/statm, so the worker runs without a memory cap
+    monkeypatch.setattr(isolation, "open", no_proc, raising=False)
+    isolation._cap_memory(64 * 2 ** 20)
+    assert "without a memory cap" in caplog.text
+
+    worker = IsolatedWorker("test", timeout=10, memory_mb=64)  # forked with the missing /proc
+    try:
+        assert worker.run(allocate, 128) == 128 * 2 ** 20
+        assert worker.starts == 1
+    finally:
+        worker.stop()
+
+
+def test_timeout_kills_the_worker():
+    worker = IsolatedWorker("test", timeout=0.5, memory_mb=64)
+    try:
+        start = time.monotonic()
+        with pytest.raises(IsolationTimeout):
+            worker.run(time.sleep, 30)
+        assert time.monotonic() - start < 5
+        assert worker.process is None
+        assert worker.run(add, 1, 2) == 3
+        assert worker.starts == 2
+    finally:
+        worker.stop()
+
+
+def test_crash_replaces_the_worker(worker):
+    with pytest.raises(IsolationCrashed, match="exit code -9"):
+        worker.run(crash)
+    assert worker.run(add, 2, 2) == 4
+    assert worker.starts == 2
+
+
+def test_outcome_of():
+    assert outcome_of(IsolationTimeout()) == TIMEOUT
+    assert outcome_of(IsolationMemoryExceeded()) == MEMORY
+    assert outcome_of(IsolationCrashed()) == CRASHED
+    assert outcome_of(IsolatedError()) == ERROR
+    assert outcome_of(ValueError()) == ERROR
+
+
+def test_work_profile_summary():
+    profile = WorkProfile()
+    profile.record("pdf", 2_000_000, 1.0)
+    profile.record("pdf", 1_000_000, 3.0, TIMEOUT)
+    profile.record("pdf", 500_000, 0.5, MEMORY)
+    profile.record("xlsx", 100, 0.1, CRASHED)
+    summary = profile.summary()
+    assert list(summary) == ["pdf", "xlsx"]
+    pdf = summary["pdf"]
+    assert pdf["runs"] == 3 and pdf["mb"] == pytest.approx(3.5) and pdf["seconds"] == pytest.approx(4.5)
+    assert pdf["mb_per_s"] == pytest.approx(2.0)  # over the successful runs only
+    assert pdf["failure_rate"] == pytest.approx(2 / 3)
+    assert (pdf["errors"], pdf["timeouts"], pdf["memory"], pdf["crashes"]) == (0, 1, 1, 0)
+    assert summary["xlsx"]["mb_per_s"] is None and summary["xlsx"]["crashes"] == 1
+    lines = format_profile(summary).splitlines()
+    assert len(lines) == 3 and lines[1].startswith("pdf") and lines[2].split()[4] == "-"
+
+
+def test_profile_records_ok_by_default():
+    profile = WorkProfile()
+    profile.record("txt", 10, 0.01)
+    assert profile.summary()["txt"]["failure_rate"] == 0
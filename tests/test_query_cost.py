@@ -0,0 +1,151 @@
+import pytest
+
+import query_cost
+from query_cost import (QueryBudgetExceeded, check_query, format_bytes, guarded_query, load_budgets,
+                        load_query_costs, parse_bytes, top_offenders)
+
+
+class FakeClient:
+    """Runs nothing; records the queries it was asked to run."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, query, job_config=None):
+        self.queries.append(query)
+        return "job"
+
+
+class DryRuns:
+    """Stand-in for query_cost.estimate_bytes: bytes (or an exception) per query text."""
+
+    def __init__(self):
+        self.bytes = {}
+        self.calls = []
+
+    def __call__(self, client, query, job_config=None):
+        self.calls.append(query)
+        if isinstance(self.bytes[query], Exception):
+            raise self.bytes[query]
+        return self.bytes[query]
+
+
+@pytest.fixture
+def dry_runs(monkeypatch, tmp_path):
+    dry_runs = DryRuns()
+    monkeypatch.setattr(query_cost, "estimate_bytes", dry_runs)
+    monkeypatch.setattr(query_cost, "COST_LOG", str(tmp_path / "costs.jsonl"))
+    monkeypatch.setattr(query_cost, "DRY_RUN_ENABLED", True)
+    monkeypatch.setattr(query_cost, "BUDGET_MODE", "enforce")
+    monkeypatch.setattr(query_cost, "_estimates", {})
+    monkeypatch.delenv("BIGQUERY_BYTES_BUDGET", raising=False)
+    monkeypatch.setenv("BIGQUERY_BYTES_BUDGETS", "big.query=5GB,small.query=1MB")
+    return dry_runs
+
+
+@pytest.mark.parametrize("size, expected", [("500MB", 500 * 10 ** 6), ("1.5gb", 1_500_000_000), ("1000000", 10 ** 6),
+                                            (" 2 KB ", 2000), ("3TB", 3 * 10 ** 12), ("10B", 10)])
+def test_parse_bytes(size, expected):
+    assert parse_bytes(size) == expected
+
+
+@pytest.mark.parametrize("size", ["", "MB", "5 PB", "-1GB", "1e3"])
+def test_parse_bytes_rejects(size):
+    with pytest.raises(ValueError):
+        parse_bytes(size)
+
+
+def test_format_bytes():
+    assert format_bytes(0) == "0 B"
+    assert format_bytes(999) == "999 B"
+    assert format_bytes(1500) == "1.5 KB"
+    assert format_bytes(2 * 10 ** 9) == "2.0 GB"
+
+
+def test_load_budgets(monkeypatch):
+    monkeypatch.setenv("BIGQUERY_BYTES_BUDGET", "2GB")
+    monkeypatch.setenv("BIGQUERY_BYTES_BUDGETS", "admin.load=5GB, main.users=200MB")
+    assert load_budgets() == (2 * 10 ** 9, {"admin.load": 5 * 10 ** 9, "main.users": 200 * 10 ** 6})
+    monkeypatch.delenv("BIGQUERY_BYTES_BUDGET")
+    monkeypatch.delenv("BIGQUERY_BYTES_BUDGETS")
+    assert load_budgets() == (query_cost.DEFAULT_BUDGET_BYTES, {})
+
+
+def test_query_within_budget_runs_and_is_logged(dry_runs):
+    dry_runs.bytes["SELECT 1"] = 2 * 10 ** 9
+    client = FakeClient()
+    assert guarded_query(client, "big.query", "SELECT 1") == "job"
+    assert client.queries == ["SELECT 1"]
+    log = load_query_costs()
+    assert log[["name", "bytes", "budget", "over_budget"]].values.tolist() == [["big.query", 2 * 10 ** 9,
+                                                                                5 * 10 ** 9, False]]
+
+
+def test_query_over_budget_is_refused(dry_runs):
+    dry_runs.bytes["SELECT *"] = 2 * 10 ** 6
+    client = FakeClient()
+    with pytest.raises(QueryBudgetExceeded) as raised:
+        guarded_query(client, "small.query", "SELECT *")
+    assert (raised.value.estimated_bytes, raised.value.budget_bytes) == (2 * 10 ** 6, 10 ** 6)
+    assert "2.0 MB" in str(raised.value) and client.queries == []
+    assert load_query_costs()["over_budget"].tolist() == [True]
+
+
+def test_default_budget_applies_to_unnamed_budgets(dry_runs):
+    dry_runs.bytes["SELECT *"] = 2 * 10 ** 9
+    with pytest.raises(QueryBudgetExceeded):
+        check_query(FakeClient(), "other.query", "SELECT *")
+
+
+def test_warn_mode_runs_queries_over_budget(dry_runs, monkeypatch, capsys):
+    monkeypatch.setattr(query_cost, "BUDGET_MODE", "warn")
+    dry_runs.bytes["SELECT *"] = 2 * 10 ** 6
+    client = FakeClient()
+    guarded_query(client, "small.query", "SELECT *")
+    assert client.queries == ["SELECT *"]
+    assert "over its budget" in capsys.readouterr().err
+
+
+def test_estimates_are_cached_per_query(dry_runs, monkeypatch):
+    dry_runs.bytes["SELECT 1"] = 100
+    assert check_query(FakeClient(), "big.query", "SELECT 1") == 100
+    assert check_query(FakeClient(), "big.query", "SELECT 1") == 100
+    assert dry_runs.calls == ["SELECT 1"]
+    monkeypatch.setattr(query_cost, "DRY_RUN_TTL_SECONDS", 0)
+    check_query(FakeClient(), "big.query", "SELECT 1")
+    assert len(dry_runs.calls) == 2
+
+
+def test_disabled_guard_skips_the_dry_run(dry_runs, monkeypatch):
+    monkeypatch.setattr(query_cost, "DRY_RUN_ENABLED", False)
+    client = FakeClient()
+    assert check_query(client, "small.query", "SELECT *") is None
+    guarded_query(client, "small.query", "SELECT *")
+    assert dry_runs.calls == [] and client.queries == ["SELECT *"]
+
+
+def test_failed_dry_run_lets_the_query_run(dry_runs, capsys):
+    dry_runs.bytes["SELECT *"] = RuntimeError("dry run unavailable")
+    client = FakeClient()
+    guarded_query(client, "small.query", "SELECT *")
+    assert client.queries == ["SELECT *"]
+    assert "running it unchecked" in capsys.readouterr().err
+
+
+def test_top_offenders(dry_runs):
+    with open(query_cost.COST_LOG, "w", encoding="utf-8") as f:
+        f.write('{"ts": "2026-01-01T00:00:00", "name": "a", "bytes": 100, "budget": 1000, "over_budget": false}\n'
+                '{"ts": "2026-01-02T00:00:00", "name": "a", "bytes": 300, "budget": 1000, "over_budget": false}\n'
+                '{"ts": "2026-01-01T00:00:00", "name": "b", "bytes": 2000, "budget": 1000, "over_budget": true}\n'
+                '{"ts": "2026-01-03T00:00:00", "name": "c", "by')  # a line still being written
+    summary = top_offenders(load_query_costs())
+    assert summary["name"].tolist() == ["b", "a"]
+    a = summary.set_index("name").loc["a"]
+    assert (a["dry_runs"], a["latest_bytes"], a["max_bytes"]) == (2, 300, 300)
+    assert a["budget_used"] == pytest.approx(0.3) and a["growth"] == pytest.approx(3.0)
+    assert summary.set_index("name").loc["b", "over_budget"]
+    assert top_offenders(load_query_costs(), n=1)["name"].tolist() == ["b"]
+
+
+def test_top_offenders_of_an_empty_log(tmp_path):
+    assert top_offenders(load_query_costs(str(tmp_path / "missing.jsonl"))).empty
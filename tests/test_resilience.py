@@ -0,0 +1,202 @@
+import queue
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import (CircuitBreaker, CircuitOpenError, HedgedCaller, LatencyTracker, UpstreamTimeout,
+                        UpstreamUnavailable)
+
+
+class Clock:
+    """Stand-in for time.monotonic in the circuit breaker."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failures=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()  # a success resets the count
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.allow()
+    assert raised.value.retry_in == pytest.approx(20)
+
+
+def test_breaker_half_open_probe(clock):
+    breaker = CircuitBreaker("test", failures=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.allow()  # the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+
+
+def test_latency_tracker_quantile():
+    tracker = LatencyTracker(window=100)
+    for i in range(resilience.MIN_SAMPLES - 1):
+        tracker.add(i)
+    assert tracker.quantile(0.95) is None
+    for i in range(resilience.MIN_SAMPLES - 1, 100):
+        tracker.add(i)
+    assert tracker.quantile(0.95) == 95
+    assert tracker.quantile(1.0) == 99
+
+
+def make_caller(**kwargs):
+    kwargs = {"timeout": 2, "initial_delay": 0.1, "min_delay": 0.05, **kwargs}
+    return HedgedCaller("test", **kwargs)
+
+
+def test_call_returns_the_result():
+    caller = make_caller()
+    assert caller.call(lambda: 42) == 42
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_attempt_is_hedged_and_loser_discarded():
+    delays = iter([1.0, 0.0])
+    discarded = []
+    done = threading.Event()
+
+    def attempt():
+        delay = next(delays)
+        time.sleep(delay)
+        return delay
+
+    def discard(result):
+        discarded.append(result)
+        done.set()
+
+    caller = make_caller()
+    start = time.monotonic()
+    assert caller.call(attempt, discard=discard) == 0.0
+    assert time.monotonic() - start < 0.5
+    assert done.wait(2) and discarded == [1.0]
+
+
+def test_no_hedge_when_disabled():
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        time.sleep(0.3)
+        return "slow"
+
+    assert make_caller(hedge=False).call(attempt) == "slow"
+    assert len(calls) == 1
+
+
+def test_timeout_discards_late_results_and_counts_as_failure():
+    release = threading.Event()
+    discarded = []
+
+    def attempt():
+        release.wait(5)
+        return "late"
+
+    caller = make_caller(timeout=0.2, breaker_failures=1)
+    with pytest.raises(UpstreamTimeout):
+        caller.call(attempt, discard=discarded.append)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+    release.set()
+    caller.executor.shutdown(wait=True)
+    assert discarded == ["late", "late"]
+
+
+def test_result_finishing_at_the_deadline_is_discarded(monkeypatch):
+    finish, queued = threading.Event(), threading.Event()
+
+    class RacingQueue(queue.Queue):
+        """The attempt finishes and queues its result just as the wait for it times out."""
+
+        def get(self, block=True, timeout=None):
+            try:
+                return super().get(block, timeout)
+            except queue.Empty:
+                finish.set()
+                queued.wait(2)
+                raise
+
+        def put(self, item, block=True, timeout=None):
+            super().put(item, block, timeout)
+            queued.set()
+
+    monkeypatch.setattr(resilience.queue, "Queue", RacingQueue)
+    discarded = []
+    caller = make_caller(timeout=0.1, hedge=False)
+    with pytest.raises(UpstreamTimeout):
+        caller.call(lambda: finish.wait(2) and "late", discard=discarded.append)
+    assert discarded == ["late"]
+
+
+def test_errors_raise_the_last_error():
+    def attempt():
+        raise ValueError("rejected")
+
+    caller = make_caller(breaker_failures=1)
+    with pytest.raises(ValueError):
+        caller.call(attempt, counts_as_failure=lambda error: not isinstance(error, ValueError))
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(ValueError):
+        caller.call(attempt)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: 1)
+
+
+def test_in_flight_attempts_are_bounded():
+    release = threading.Event()
+    calls = []
+
+    def hung():
+        calls.append("hung")
+        release.wait(5)
+        return "hung"
+
+    caller = make_caller(max_workers=1, timeout=0.3, breaker_failures=1000)
+    # No hedge while the only worker is busy with the first attempt
+    with pytest.raises(UpstreamTimeout):
+        caller.call(hung)
+    assert calls == ["hung"]
+    # The hung attempt still holds the worker: the next call fails at once
+    start = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        caller.call(lambda: 1)
+    assert time.monotonic() - start < 0.1
+    release.set()
+    for _ in range(100):
+        if caller.in_flight == 0:
+            break
+        time.sleep(0.01)
+    assert caller.call(lambda: 1) == 1
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+import retrieval
+from retrieval import (CHUNK_SEPARATOR, build_index, chunk_spans, get_index, index_to_json, relevant_excerpt,
+                       search)
+
+
+@pytest.fixture(autouse=True)
+def empty_index_cache():
+    retrieval._index_cache.clear()
+    yield
+    retrieval._index_cache.clear()
+
+
+def make_text(lines=40, words_per_line=10):
+    return "\n".join(" ".join(f"w{line}x{word}" for word in range(words_per_line)) for line in range(lines))
+
+
+def test_chunk_spans_keep_whole_lines():
+    text = make_text()
+    spans = chunk_spans(text, chunk_words=25)
+    assert len(spans) == 20
+    for start, end in spans:
+        chunk = text[start:end]
+        assert len(chunk.split()) == 20
+        assert (start == 0 or text[start - 1] == "\n") and (end == len(text) or text[end] == "\n")
+    # Chunks cover every word, in order
+    assert " ".join(text[start:end] for start, end in spans).split() == text.split()
+
+
+def test_chunk_spans_split_long_lines_into_word_windows():
+    text = " ".join(f"word{i}" for i in range(55))
+    spans = chunk_spans(text, chunk_words=20)
+    assert [len(text[start:end].split()) for start, end in spans] == [20, 20, 15]
+
+
+def test_chunk_spans_of_blank_text():
+    assert chunk_spans("") == []
+    assert chunk_spans("\n  \n\t\n") == []
+
+
+def test_search_ranks_chunks_by_bm25():
+    text = "\n".join(["intro line about nothing"] * 3 + ["the zebra ate grass", "a zebra and another zebra",
+                                                        "grass only here"])
+    index = build_index(text, chunk_words=5)
+    assert len(index["spans"]) == 6
+    assert search(index, "Zebra?") == [4, 3]
+    assert search(index, "zebra grass", top_k=1) == [3]
+    assert search(index, "unicorn") == []
+    assert search(build_index(""), "zebra") == []
+
+
+def test_get_index_uses_a_matching_stored_index():
+    text = make_text()
+    stored = build_index(text, chunk_words=10)
+    assert get_index(text, index_to_json(stored)) == json.loads(index_to_json(stored))
+    # Served from the cache by the text's digest, stored index or not
+    assert get_index(text) is get_index(text, None)
+    assert len(retrieval._index_cache) == 1
+
+
+@pytest.mark.parametrize("stored", ["not json", '["a list"]', json.dumps({"version": 0, "chars": 1})])
+def test_get_index_rebuilds_unusable_stored_index(stored):
+    text = make_text()
+    assert get_index(text, stored) == build_index(text)
+
+
+def test_get_index_rebuilds_stale_stored_index():
+    text = make_text()
+    stale = index_to_json(build_index(text[:100]))
+    assert get_index(text, stale)["chars"] == len(text)
+
+
+def test_index_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(retrieval, "INDEX_CACHE_ENTRIES", 3)
+    for i in range(5):
+        get_index(f"text {i}")
+    assert len(retrieval._index_cache) == 3
+
+
+def test_relevant_excerpt():
+    lines = [f"line {i} filler words here" for i in range(200)]
+    lines[150] = "the secret zebra is here"
+    text = "\n".join(lines)
+    excerpt = relevant_excerpt("Where is the zebra?", text, top_k=3)
+    chunks = excerpt.split(CHUNK_SEPARATOR)
+    assert len(chunks) == 3
+    assert chunks[0].startswith("line 0 ")
+    assert "the secret zebra is here" in excerpt
+    # Short text, no text and no chunks are returned as is
+    assert relevant_excerpt("zebra", "short text") == "short text"
+    assert relevant_excerpt("zebra", None) is None
+    assert relevant_excerpt("zebra", text, top_k=0) == text
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from scoring import normalize_answers, score_answer, score_answers
+
+CASES = [
+    # numbers are whole tokens in canonical form
+    ("The answer is 170.", "17", False),
+    ("The answer is 17.", "17", True),
+    ("1.000", "1", True),
+    ("1", "1.000", True),
+    ("1.5", "1", False),
+    ("$5.00", "$5", True),
+    ("It is 1,000,000,000 people", "1000000000", True),
+    ("1000", "1,000", True),
+    ("50%", "50%", True),
+    ("0.5", ".5", True),
+    ("-5 degrees", "-5", True),
+    ("-0.5", "-.5", True),
+    ("7", "007", True),
+    ("It is 12345678901234567890", "12345678901234567890", True),
+    ("It is 12345678901234567000", "12345678901234567890", False),
+    ("x-5", "-5", False),
+    ("version 1.2.3", "1.2.3", True),
+    # lists need every item
+    ("apples, pears and plums", "plums; apples", True),
+    ("apples and pears", "plums; apples", False),
+    # text is a whole phrase, ignoring case, punctuation and whitespace
+    ("Paris.", "paris", True),
+    ("Comparison", "paris", False),
+    ("Saint-Denis", "saint  denis", True),
+    # empty or missing answers never match
+    ("", "", False),
+    ("anything", "", False),
+    (None, "3", False),
+    ("3", None, False),
+]
+
+
+@pytest.mark.parametrize("generated, expected, correct", CASES)
+def test_score_answer(generated, expected, correct):
+    assert score_answer(generated, expected) is correct
+
+
+def test_score_answers_matches_single_case_path():
+    generated, expected, correct = zip(*CASES)
+    scores = score_answers(pd.Series(generated, index=range(10, 10 + len(CASES))), list(expected))
+    assert scores.tolist() == list(correct)
+    assert scores.index.tolist() == list(range(10, 10 + len(CASES)))
+
+
+def test_score_answers_requires_same_length():
+    with pytest.raises(ValueError):
+        score_answers(["a", "b"], ["a"])
+
+
+def test_normalize_answers():
+    answers = pd.Series(["  Hello, World!  ", "1,234.50 and -3", "a.b - c", None])
+    assert normalize_answers(answers).tolist() == ["hello world", "1234.50 and -3", "a b c", ""]
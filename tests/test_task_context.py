@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+from bigquery_reads import string_dtype
+
+
+@pytest.fixture
+def context_builders(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    from openai_utils import build_task_context
+    from validation import step_context
+    return build_task_context, lambda question, data, index: step_context(question, "Step 1", data, index)
+
+
+@pytest.mark.parametrize("builder", [0, 1], ids=["build_task_context", "step_context"])
+def test_missing_extraction_adds_no_extracted_data(context_builders, builder):
+    # Null extractedData and extractedIndex, as query_dataframe reads them
+    row = pd.DataFrame({"extractedData": [None], "extractedIndex": [None]},
+                       dtype=string_dtype() or object).iloc[0]
+    context = context_builders[builder]("What is 2 + 2?", row["extractedData"], row["extractedIndex"])
+    assert "Extracted Data" not in context
+    assert "nan" not in context
+
+
+@pytest.mark.parametrize("builder", [0, 1], ids=["build_task_context", "step_context"])
+def test_extraction_is_added(context_builders, builder):
+    context = context_builders[builder]("What is 2 + 2?", "The attachment text", None)
+    assert "Extracted Data: The attachment text\n" in context